@@ -7,6 +7,9 @@ import sys
 def main():
     """Run administrative tasks."""
     os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pp1.settings')
+    if sys.argv[1:2] == ['test']:
+        # Las pruebas usan pp1/settings/test.py salvo que se pida otro entorno
+        os.environ.setdefault('DJANGO_ENTORNO', 'test')
     try:
         from django.core.management import execute_from_command_line
     except ImportError as exc:
@@ -7,10 +7,73 @@ For more information on this file, see
 https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
 """
 
+import logging
 import os
 
+import asgiref
+from asgiref.sync import SyncToAsync, ThreadSensitiveContext
+from django.conf import settings
 from django.core.asgi import get_asgi_application
+from django.db import connections
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pp1.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+logger = logging.getLogger(__name__)
+
+# Versiones de asgiref con las que se probó el reparto de hilos (ver requirements.txt)
+ASGIREF_PROBADO = ((3, 3), (3, 12))
+
+# Hilos para el código sync (ORM, vistas sync) libres para la próxima petición
+_hilos_libres = []
+
+
+def hilos_reutilizables(version=asgiref.__version__):
+    """True si esta versión de asgiref tiene los detalles internos de los que depende el reparto.
+
+    Se apoya en SyncToAsync.thread_sensitive_context y context_to_thread_executor,
+    que no son API pública: con otra versión se usa el handler de Django sin cambios.
+    """
+    try:
+        menor = tuple(int(parte) for parte in version.split('.')[:2])
+    except ValueError:
+        return False
+    return (ASGIREF_PROBADO[0] <= menor <= ASGIREF_PROBADO[1]
+            and hasattr(SyncToAsync, 'thread_sensitive_context')
+            and hasattr(SyncToAsync, 'context_to_thread_executor'))
+
+
+REPARTIR_HILOS = hilos_reutilizables()
+if not REPARTIR_HILOS:
+    logger.warning('asgiref %s no está probado con pp1/asgi.py: todas las peticiones compartirán un hilo sync',
+                   asgiref.__version__)
+
+
+def _liberar(hilo):
+    if len(_hilos_libres) < getattr(settings, 'ASGI_HILOS_LIBRES', 10):
+        _hilos_libres.append(hilo)
+        return
+    # Sobran hilos: este cierra sus conexiones (solo él puede hacerlo) y termina
+    ejecutor = SyncToAsync.context_to_thread_executor.pop(hilo, None)
+    if ejecutor:
+        ejecutor.submit(connections.close_all)
+        ejecutor.shutdown(wait=False)
+
+
+async def application(scope, receive, send):
+    # Cada petición en curso usa su propio hilo para el código sync; Django 3.2 no
+    # lo hace: sin esto todas las peticiones comparten un único hilo. Los hilos se
+    # reutilizan entre peticiones, así que sus conexiones persisten según CONN_MAX_AGE:
+    # como en WSGI, close_old_connections (señales request_started/request_finished
+    # del handler de Django) cierra al empezar y al terminar las vencidas o rotas.
+    if scope['type'] != 'http' or not REPARTIR_HILOS:
+        return await django_application(scope, receive, send)
+
+    hilo = _hilos_libres.pop() if _hilos_libres else ThreadSensitiveContext()
+    token = SyncToAsync.thread_sensitive_context.set(hilo)
+    try:
+        await django_application(scope, receive, send)
+    finally:
+        SyncToAsync.thread_sensitive_context.reset(token)
+        _liberar(hilo)
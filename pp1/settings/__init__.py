@@ -0,0 +1,21 @@
+"""
+Selecciona la configuración según DJANGO_ENTORNO: dev (por defecto), prod o test.
+
+`manage.py test` fija DJANGO_ENTORNO=test si no está definido. Otros ejecutores
+(pytest, `python -m django test`) deben definir DJANGO_ENTORNO=test o apuntar
+DJANGO_SETTINGS_MODULE directamente a pp1.settings.test (o .prod, .dev).
+"""
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+ENTORNO = os.environ.get('DJANGO_ENTORNO') or 'dev'
+
+if ENTORNO == 'dev':
+    from .dev import *  # noqa: F401,F403
+elif ENTORNO == 'prod':
+    from .prod import *  # noqa: F401,F403
+elif ENTORNO == 'test':
+    from .test import *  # noqa: F401,F403
+else:
+    raise ImproperlyConfigured(f'DJANGO_ENTORNO desconocido: {ENTORNO} (use dev, prod o test)')
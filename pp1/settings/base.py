@@ -0,0 +1,330 @@
+"""
+Django settings for pp1 project: configuración común a todos los entornos.
+
+Generated by 'django-admin startproject' using Django 3.2.25.
+dev.py, prod.py y test.py extienden este módulo; pp1/settings/__init__.py elige
+uno según la variable de entorno DJANGO_ENTORNO.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/3.2/topics/settings/
+
+For the full list of settings and their values, see
+https://docs.djangoproject.com/en/3.2/ref/settings/
+"""
+
+import os
+from pathlib import Path
+
+# Build paths inside the project like this: BASE_DIR / 'subdir'.
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+
+
+def env(nombre, defecto=None):
+    return os.environ.get(nombre, defecto)
+
+
+def env_bool(nombre, defecto=False):
+    valor = os.environ.get(nombre)
+    if valor is None:
+        return defecto
+    return valor.strip().lower() in ('1', 'true', 'yes', 'si', 'sí', 'on')
+
+
+def env_lista(nombre, defecto=()):
+    valor = os.environ.get(nombre)
+    if valor is None:
+        return list(defecto)
+    return [parte.strip() for parte in valor.split(',') if parte.strip()]
+
+
+# Quick-start development settings - unsuitable for production
+# See https://docs.djangoproject.com/en/3.2/howto/deployment/checklist/
+
+# SECURITY WARNING: keep the secret key used in production secret!
+SECRET_KEY = env('DJANGO_SECRET_KEY')
+
+# SECURITY WARNING: don't run with debug turned on in production!
+# Con DEBUG cada consulta SQL queda guardada en memoria y Django sirve los estáticos
+DEBUG = False
+
+ALLOWED_HOSTS = env_lista('DJANGO_ALLOWED_HOSTS')
+
+
+# Application definition
+
+INSTALLED_APPS = [
+    'django.contrib.admin',
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    'django.contrib.sessions',
+    'django.contrib.messages',
+    'django.contrib.staticfiles',
+    'pp2',
+    
+]
+
+MIDDLEWARE = [
+    'django.middleware.security.SecurityMiddleware',
+    'pp2.middleware.MetricasMiddleware',
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+]
+
+ROOT_URLCONF = 'pp1.urls'
+
+
+def cargadores_plantillas(debug):
+    """Fuera de DEBUG las plantillas se compilan una sola vez por proceso"""
+    cargadores = [
+        'django.template.loaders.filesystem.Loader',
+        'django.template.loaders.app_directories.Loader',
+    ]
+    return cargadores if debug else [('django.template.loaders.cached.Loader', cargadores)]
+
+
+TEMPLATES = [
+    {
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'DIRS': [],
+        'OPTIONS': {
+            'loaders': cargadores_plantillas(DEBUG),
+            'context_processors': [
+                'django.template.context_processors.debug',
+                'django.template.context_processors.request',
+                'django.contrib.auth.context_processors.auth',
+                'django.contrib.messages.context_processors.messages',
+            ],
+        },
+    },
+]
+
+WSGI_APPLICATION = 'pp1.wsgi.application'
+
+
+# Database
+# https://docs.djangoproject.com/en/3.2/ref/settings/#databases
+
+def base_de_datos(motor=None, nombre=None, host=None):
+    """Configuración de una base a partir de las variables DB_* (SQLite por defecto)"""
+    motor = motor or env('DB_ENGINE', 'sqlite')
+    if motor == 'postgresql':
+        return {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': nombre or env('DB_NAME', 'tienda'),
+            'USER': env('DB_USER', 'tienda'),
+            'PASSWORD': env('DB_PASSWORD', ''),
+            'HOST': host or env('DB_HOST', 'localhost'),
+            'PORT': env('DB_PORT', '5432'),
+            # Conexiones persistentes; se verifican al inicio de cada petición (DB_VERIFICAR_CONEXIONES)
+            'CONN_MAX_AGE': int(env('DB_CONN_MAX_AGE', 600)),
+            'OPTIONS': {
+                'connect_timeout': 5,
+            },
+        }
+    return {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': nombre or env('DB_NAME', BASE_DIR / 'db.sqlite3'),
+        # Conexiones persistentes: evita abrir la base (y repetir los PRAGMA) en cada petición
+        'CONN_MAX_AGE': int(env('DB_CONN_MAX_AGE', 60)),
+        'OPTIONS': {
+            # Segundos que el driver espera un bloqueo de escritura
+            'timeout': 20,
+        },
+    }
+
+
+DATABASES = {
+    'default': base_de_datos(),
+}
+
+# Réplicas de solo lectura: DB_REPLICAS es una lista separada por comas de hosts
+# (PostgreSQL) o de archivos (SQLite). Las vistas del catálogo leen de ellas.
+for numero, replica in enumerate(env_lista('DB_REPLICAS'), start=1):
+    if DATABASES['default']['ENGINE'].endswith('sqlite3'):
+        DATABASES[f'replica{numero}'] = base_de_datos(nombre=replica)
+    else:
+        DATABASES[f'replica{numero}'] = base_de_datos(host=replica)
+    # En las pruebas la réplica apunta a la base principal
+    DATABASES[f'replica{numero}']['TEST'] = {'MIRROR': 'default'}
+
+# Alias de DATABASES que reciben las lecturas del catálogo (pp2/bases_de_datos.py)
+BASES_DE_DATOS_REPLICA = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['pp2.bases_de_datos.RouterReplicas']
+
+# Comprueba con un ping las conexiones persistentes al empezar cada petición
+DB_VERIFICAR_CONEXIONES = env_bool('DB_VERIFICAR_CONEXIONES', True)
+
+# PRAGMA aplicados a cada conexión SQLite nueva (pp2/sqlite.py); {} para no tocar nada
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 20000,
+    'cache_size': -20000,
+    'mmap_size': 128 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+# Las transacciones (atomic) empiezan con BEGIN IMMEDIATE: las compras concurrentes esperan
+# su turno en lugar de fallar con "database is locked"
+SQLITE_TRANSACCION_INMEDIATA = True
+
+
+# Caché
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+
+def cache_desde_url(url):
+    """Cache compartido entre procesos a partir de una URL (DJANGO_CACHE_URL).
+
+    redis://host:puerto/db usa django-redis; memcached://host:puerto[,host:puerto]
+    usa pymemcache (ver requirements-prod.txt).
+    """
+    from django.core.exceptions import ImproperlyConfigured
+
+    esquema, _, ubicacion = url.partition('://')
+    if esquema in ('redis', 'rediss'):
+        return {'BACKEND': 'django_redis.cache.RedisCache', 'LOCATION': url}
+    if esquema == 'memcached':
+        return {'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+                'LOCATION': [servidor for servidor in ubicacion.split(',') if servidor]}
+    raise ImproperlyConfigured(f'DJANGO_CACHE_URL no soportada: {url} (use redis:// o memcached://)')
+
+
+# LocMem es propio de cada proceso: sirve en desarrollo y pruebas. Producción usa
+# DJANGO_CACHE_URL para que las invalidaciones por versión (catálogo, fragmentos,
+# cupones) lleguen a todos los procesos
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'pp1',
+    }
+}
+
+# Segundos que cada proceso reutiliza los cupones vigentes cargados en memoria. Las
+# invalidaciones llegan a todos los procesos solo si el cache es compartido (prod)
+CUPONES_RECARGA_SEGUNDOS = 60
+
+# Segundos que una página del catálogo permanece en caché (se invalida al editar productos)
+CATALOGO_CACHE_TIMEOUT = 60 * 60
+
+# max-age de las páginas anónimas del catálogo (Cache-Control: public) para CDN y navegadores;
+# pasado ese tiempo se revalidan con ETag/Last-Modified
+CATALOGO_CACHE_CONTROL_MAX_AGE = 60
+
+# Paginación por cursor (keyset) en el catálogo y el historial de pedidos; sin COUNT ni OFFSET
+PAGINACION_POR_CURSOR = False
+
+# Miniaturas de Producto.imagen (anchos en píxeles y formatos); se generan al guardar
+# y con `manage.py generar_derivadas_imagenes` para las imágenes existentes
+IMAGENES_ANCHOS = (160, 320, 640)
+IMAGENES_FORMATOS = ('webp', 'jpeg')
+IMAGENES_DERIVADAS_AL_GUARDAR = True
+
+# Búsqueda de productos: SQLite FTS5 si está disponible, si no el índice invertido TerminoBusqueda
+BUSQUEDA_USAR_FTS5 = True
+# Máximo de resultados que devuelve una búsqueda
+BUSQUEDA_LIMITE = 500
+
+# Versiones async de inicio, productos, detalle_producto y ver_carrito (pp2/vistas_async.py);
+# activar solo cuando el sitio corre con ASGI (pp1/asgi.py)
+VISTAS_ASYNC = env_bool('VISTAS_ASYNC', False)
+# Hilos sync (cada uno con sus conexiones persistentes) que pp1/asgi.py guarda entre peticiones
+ASGI_HILOS_LIBRES = 10
+
+# Métricas por vista (consultas, tiempo de BD, tiempo total, tamaño); ver /metricas/
+METRICAS_HABILITADAS = True
+# Peticiones recientes por vista usadas para p50/p95/p99
+METRICAS_VENTANA = 500
+# Repeticiones del mismo SQL en una petición a partir de las cuales se marca como N+1
+METRICAS_UMBRAL_DUPLICADOS = 3
+# Firmas de SQL repetido que se conservan por vista (las más frecuentes)
+METRICAS_MAX_DUPLICADAS = 10
+
+
+# Password validation
+# https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
+
+AUTH_PASSWORD_VALIDATORS = [
+    {
+        'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.CommonPasswordValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.NumericPasswordValidator',
+    },
+]
+
+# Vista de inicio de sesión a la que redirige login_required (p. ej. al finalizar la compra
+# con un carrito anónimo); el carrito se fusiona con el del usuario al iniciar sesión
+LOGIN_URL = 'login'
+
+
+# Internationalization
+# https://docs.djangoproject.com/en/3.2/topics/i18n/
+
+LANGUAGE_CODE = 'en-us'
+
+TIME_ZONE = 'UTC'
+
+USE_I18N = True
+
+USE_TZ = True
+
+
+# Static files (CSS, JavaScript, Images)
+# https://docs.djangoproject.com/en/3.2/howto/static-files/
+
+
+
+STATIC_URL = '/static/'
+
+STATICFILES_DIRS = [
+    BASE_DIR / 'pp2' / 'static',
+]
+
+# Destino de `manage.py collectstatic`; en producción los sirve el servidor web
+STATIC_ROOT = env('DJANGO_STATIC_ROOT', BASE_DIR / 'staticfiles')
+
+
+# Default primary key field type
+# https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
+
+DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+LOGOUT_REDIRECT_URL = 'inicio'
+
+# Evita que la sesión se pierda al cerrar el navegador
+SESSION_EXPIRE_AT_BROWSER_CLOSE = False
+
+# Duración de la sesión en segundos (14 días en este caso)
+SESSION_COOKIE_AGE = 1209600
+
+# No reescribir la sesión en cada petición: solo se guarda cuando cambia
+SESSION_SAVE_EVERY_REQUEST = False
+
+
+# Correo: remitente por defecto y destinatarios de las alertas de operación (mail_admins)
+EMAIL_BACKEND = env('DJANGO_EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
+EMAIL_HOST = env('DJANGO_EMAIL_HOST', 'localhost')
+DEFAULT_FROM_EMAIL = env('DJANGO_DEFAULT_FROM_EMAIL', 'Fruit Pack <pedidos@fruitpack.pe>')
+ADMINS = [('Operaciones', correo) for correo in env_lista('DJANGO_ADMINS')]
+
+# Tareas en segundo plano (pp2/cola.py): espera entre reintentos (se duplica en cada
+# intento hasta el máximo) y tiempo tras el cual una tarea tomada se da por abandonada
+TAREAS_ESPERA_BASE = 30
+TAREAS_ESPERA_MAXIMA = 60 * 60
+TAREAS_BLOQUEO = 5 * 60
+
+# Alerta a ADMINS cuando una compra deja un producto con este stock o menos
+STOCK_ALERTA_UMBRAL = 5
+
+
+# Settings para las sesiones: la cookie solo lleva el id de sesión y el carrito
+# vive en las tablas Carrito/CarritoItem
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
@@ -0,0 +1,15 @@
+"""Configuración de desarrollo: DEBUG y SQLite local"""
+from .base import *  # noqa: F401,F403
+from .base import TEMPLATES, cargadores_plantillas, env
+
+SECRET_KEY = env('DJANGO_SECRET_KEY', 'django-insecure-rj*5@54+i)#hw%$-d(4voa_e^ji)an)bfd4bho=do36wgtotak')
+
+DEBUG = True
+
+# Sin caché de plantillas: los cambios se ven sin reiniciar el servidor
+TEMPLATES[0]['OPTIONS']['loaders'] = cargadores_plantillas(DEBUG)
+
+ALLOWED_HOSTS = ['localhost', '127.0.0.1', '[::1]']
+
+# Los correos se muestran en la consola del servidor
+EMAIL_BACKEND = env('DJANGO_EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
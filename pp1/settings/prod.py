@@ -0,0 +1,47 @@
+"""Configuración de producción: todo lo sensible llega por variables de entorno.
+
+Variables: DJANGO_SECRET_KEY, DJANGO_ALLOWED_HOSTS, DJANGO_CACHE_URL, DB_ENGINE
+(postgresql por defecto), DB_NAME, DB_USER, DB_PASSWORD, DB_HOST, DB_PORT,
+DB_CONN_MAX_AGE, DB_REPLICAS.
+
+Requiere los drivers de requirements-prod.txt (psycopg2 para PostgreSQL y el
+cliente del cache elegido).
+"""
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+os.environ.setdefault('DB_ENGINE', 'postgresql')
+
+from .base import *  # noqa: E402,F401,F403
+from .base import DATABASES, SECRET_KEY, ALLOWED_HOSTS, cache_desde_url, env, env_bool  # noqa: E402
+
+if not SECRET_KEY:
+    raise ImproperlyConfigured('Defina DJANGO_SECRET_KEY para el entorno prod')
+if not ALLOWED_HOSTS:
+    raise ImproperlyConfigured('Defina DJANGO_ALLOWED_HOSTS para el entorno prod')
+if not env('DJANGO_CACHE_URL'):
+    raise ImproperlyConfigured('Defina DJANGO_CACHE_URL (redis:// o memcached://) para el entorno prod')
+
+# Compartido entre procesos: con LocMem cada worker invalidaría solo su propia copia
+CACHES = {'default': cache_desde_url(env('DJANGO_CACHE_URL'))}
+
+DEBUG = False
+
+# Detrás de un proxy con HTTPS
+SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
+SECURE_SSL_REDIRECT = env_bool('DJANGO_SSL_REDIRECT', True)
+SESSION_COOKIE_SECURE = True
+CSRF_COOKIE_SECURE = True
+
+# Las métricas por vista guardan los tiempos de las últimas peticiones; se pueden apagar
+METRICAS_HABILITADAS = env_bool('METRICAS_HABILITADAS', True)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'consola': {'class': 'logging.StreamHandler'},
+    },
+    'root': {'handlers': ['consola'], 'level': 'WARNING'},
+}
@@ -0,0 +1,21 @@
+"""Configuración de pruebas: SQLite para la base principal y una réplica de prueba.
+
+La réplica es otra base SQLite (no un espejo) para poder comprobar qué consultas
+llegan a ella; solo recibe lecturas si BASES_DE_DATOS_REPLICA la incluye.
+"""
+from .dev import *  # noqa: F401,F403
+from .dev import DATABASES, TEMPLATES, base_de_datos, cargadores_plantillas
+
+DEBUG = False
+
+# Las pruebas usan las plantillas en caché, como producción
+TEMPLATES[0]['OPTIONS']['loaders'] = cargadores_plantillas(DEBUG)
+
+DATABASES['replica'] = base_de_datos(motor='sqlite', nombre=':memory:')
+
+# Las pruebas del router la activan con override_settings
+BASES_DE_DATOS_REPLICA = []
+
+# Los productos de las pruebas apuntan a imágenes que no existen; las pruebas de
+# miniaturas lo activan con override_settings y un MEDIA_ROOT temporal
+IMAGENES_DERIVADAS_AL_GUARDAR = False
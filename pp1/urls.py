@@ -20,28 +20,41 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib.auth.views import LogoutView
 from pp2 import views
+from pp2 import vistas_async
+from pp2 import api
 from django.contrib.auth import views as auth_views
 
 
 
 
+# Vistas de lectura del catálogo y del carrito: async con VISTAS_ASYNC (para ASGI)
+lectura = vistas_async if settings.VISTAS_ASYNC else views
+
 urlpatterns = [
+    path('admin/panel-ventas/', views.panel_ventas, name='panel_ventas'),
     path('admin/', admin.site.urls),
-    path('', views.inicio, name='inicio'),
-    path('productos/', views.productos, name='productos'),
-    path('productos/<int:producto_id>/', views.detalle_producto, name='detalle_producto'),
+    path('', lectura.inicio, name='inicio'),
+    path('productos/', lectura.productos, name='productos'),
+    path('productos/<int:producto_id>/', lectura.detalle_producto, name='detalle_producto'),
     path('registro/', views.registro, name='registro'),
     path('login/', views.login_view, name='login'),
-    path('carrito/', views.ver_carrito, name='ver_carrito'),
+    path('carrito/', lectura.ver_carrito, name='ver_carrito'),
     path('finalizar/', views.finalizar_compra, name='finalizar_compra'),
     path('crear_pedido/<int:producto_id>/', views.crear_pedido, name='crear_pedido'),
     path('mi-cuenta/', views.mi_cuenta, name='mi_cuenta'),
     path('logout/', auth_views.LogoutView.as_view(), name='logout'),
     path('pedidos/', views.pedidos_view, name='pedidos'),
-    path('carrito/actualizar/<int:pedido_id>/', views.actualizar_pedido, name='actualizar_pedido'),
+    path('carrito/agregar/<int:producto_id>/', views.agregar_al_carrito, name='agregar_al_carrito'),
+    path('carrito/actualizar/<int:producto_id>/', views.actualizar_pedido, name='actualizar_pedido'),
     path('carrito/eliminar/<int:producto_id>/', views.eliminar_pedido, name='eliminar_pedido'),
     path('pedido/<int:pedido_id>/', views.detalle_pedido, name='detalle_pedido'),
     path('confirmacion-pedido/<int:pedido_id>/', views.confirmacion_pedido, name='confirmacion_pedido'),
+    path('metricas/', views.metricas, name='metricas'),
+    path('exportar/pedidos/', views.exportar_pedidos, name='exportar_pedidos'),
+    # API JSON de solo lectura del catálogo (ver pp2/api.py)
+    path('api/productos', api.productos, name='api_productos'),
+    path('api/productos/<int:producto_id>', api.producto, name='api_producto'),
+    path('api/categorias', api.categorias, name='api_categorias'),
     
 
 ]
@@ -1,6 +1,10 @@
 from django import forms 
 from django.contrib import admin
-from .models import Categoria, Producto, Pedido, DireccionEnvio, Cupon, DetallePedido
+from django.db.models import Prefetch
+from django.utils import timezone
+from .models import Categoria, Producto, Pedido, DireccionEnvio, Cupon, DetallePedido, Tarea
+from .busqueda import buscar_ids
+from .exportacion import filtrar_pedidos, respuesta_exportacion
 
 # Configuración personalizada para la administración de productos
 class ProductoAdmin(admin.ModelAdmin):
@@ -9,6 +13,17 @@ class ProductoAdmin(admin.ModelAdmin):
     search_fields = ('nombre', 'descripcion')
     list_editable = ('precio', 'stock', 'disponible')
 
+    def get_search_results(self, request, queryset, search_term):
+        # Usa el índice de búsqueda en lugar de LIKE '%x%' sobre nombre y descripción.
+        # Sin el tope de BUSQUEDA_LIMITE: el listado pagina todas las coincidencias
+        if not search_term.strip():
+            return queryset, False
+        limite = self.model._default_manager.count()
+        return queryset.filter(id__in=buscar_ids(search_term, limite=limite)), False
+
+# Se calculan a partir de los detalles y del cupón canjeado: no se editan a mano
+CAMPOS_CALCULADOS_PEDIDO = ('total', 'item_count', 'descuento', 'cupon')
+
 # Configuración personalizada para la administración de pedidos
 class PedidoForm(forms.ModelForm):
     # Campos que deseas mostrar
@@ -22,7 +37,7 @@ class PedidoForm(forms.ModelForm):
 
     class Meta:
         model = Pedido
-        fields = '__all__'  # Incluye todos los campos del modelo
+        exclude = CAMPOS_CALCULADOS_PEDIDO
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -39,12 +54,53 @@ class PedidoForm(forms.ModelForm):
                 self.fields['direccion'].initial = direccion.direccion
                 self.fields['distrito'].initial = direccion.distrito
 
+# Filtro por nombre de usuario con un cuadro de texto (no carga la tabla de usuarios)
+class UsuarioFilter(admin.SimpleListFilter):
+    title = 'usuario'
+    parameter_name = 'usuario'
+    template = 'admin/filtro_texto.html'
+
+    def lookups(self, request, model_admin):
+        return ()
+
+    def has_output(self):
+        return True
+
+    def choices(self, changelist):
+        # Conserva el resto de filtros activos al enviar el formulario
+        yield {
+            'valor': self.value() or '',
+            'parametros': [
+                (clave, valor) for clave, valor in changelist.get_filters_params().items()
+                if clave != self.parameter_name
+            ],
+        }
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(usuario__username=self.value())
+        return queryset
+
 # Configuración personalizada para la administración de pedidos
 class PedidoAdmin(admin.ModelAdmin):
     form = PedidoForm  # Usar el formulario personalizado
     list_display = ('usuario', 'mostrar_productos', 'mostrar_cantidades', 'fecha_pedido', 'estado')
-    list_filter = ('fecha_pedido', 'usuario', 'estado')
+    list_filter = ('fecha_pedido', UsuarioFilter, 'estado')
     search_fields = ('usuario__username',)
+    raw_id_fields = ('usuario', 'direccion_envio')
+    readonly_fields = CAMPOS_CALCULADOS_PEDIDO
+    # Evita un COUNT(*) adicional sobre toda la tabla cuando hay filtros activos
+    show_full_result_count = False
+    actions = ['exportar_csv', 'exportar_jsonl']
+
+    def get_queryset(self, request):
+        # Usuario y detalles (con el nombre del producto) en un número fijo de consultas
+        detalles = DetallePedido.objects.select_related('producto').only(
+            'id', 'pedido_id', 'cantidad', 'producto__nombre'
+        ).order_by('id')
+        return super().get_queryset(request).select_related('usuario').prefetch_related(
+            Prefetch('detallepedido_set', queryset=detalles)
+        )
 
     # Métodos para mostrar productos y cantidades
     def mostrar_productos(self, obj):
@@ -55,6 +111,15 @@ class PedidoAdmin(admin.ModelAdmin):
         return ", ".join([str(detalle.cantidad) for detalle in obj.detallepedido_set.all()])
     mostrar_cantidades.short_description = 'Cantidades'
 
+    # Exportación en streaming de los pedidos seleccionados (con detalles y dirección)
+    def exportar_csv(self, request, queryset):
+        return respuesta_exportacion(filtrar_pedidos(queryset=queryset.model.objects.filter(pk__in=queryset)), 'csv')
+    exportar_csv.short_description = 'Exportar pedidos seleccionados (CSV)'
+
+    def exportar_jsonl(self, request, queryset):
+        return respuesta_exportacion(filtrar_pedidos(queryset=queryset.model.objects.filter(pk__in=queryset)), 'jsonl')
+    exportar_jsonl.short_description = 'Exportar pedidos seleccionados (JSON Lines)'
+
 
 
 # Configuración personalizada para la administración de categorías
@@ -69,8 +134,25 @@ class DireccionEnvioAdmin(admin.ModelAdmin):
 
 # Configuración personalizada para la administración de cupones
 class CuponAdmin(admin.ModelAdmin):
-    list_display = ('codigo', 'descuento', 'valido_desde', 'valido_hasta')
+    list_display = ('codigo', 'descuento', 'valido_desde', 'valido_hasta', 'usos', 'max_usos')
     search_fields = ('codigo',)
+    readonly_fields = ('usos',)
+
+# Cola de tareas en segundo plano: consulta de fallos y reintento manual
+class TareaAdmin(admin.ModelAdmin):
+    list_display = ('id', 'tipo', 'estado', 'intentos', 'disponible_desde', 'creada', 'terminada')
+    list_filter = ('estado', 'tipo')
+    search_fields = ('clave',)
+    readonly_fields = ('lote', 'ultimo_error', 'creada', 'terminada')
+    show_full_result_count = False
+    actions = ['reintentar']
+
+    def reintentar(self, request, queryset):
+        reintentadas = queryset.filter(estado='fallida').update(
+            estado='pendiente', intentos=0, disponible_desde=timezone.now(), terminada=None,
+        )
+        self.message_user(request, f'{reintentadas} tareas vuelven a la cola')
+    reintentar.short_description = 'Reintentar tareas fallidas seleccionadas'
 
 # Registrar los modelos con la configuración personalizada
 admin.site.register(Producto, ProductoAdmin)
@@ -78,3 +160,4 @@ admin.site.register(Categoria, CategoriaAdmin)
 admin.site.register(Pedido, PedidoAdmin)
 admin.site.register(DireccionEnvio, DireccionEnvioAdmin)
 admin.site.register(Cupon, CuponAdmin)
+admin.site.register(Tarea, TareaAdmin)
@@ -0,0 +1,173 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import DetallePedido, Pedido, VentaDiaria, VentaDiariaCategoria, VentaDiariaProducto
+
+CAMPOS_ACUMULADOS = ('unidades', 'ingresos', 'pedidos')
+
+
+def _acumular(modelo, claves, filas):
+    """Suma las filas (dicts con las claves y los campos acumulados) a la tabla de resumen.
+
+    En SQLite y PostgreSQL es un único INSERT ... ON CONFLICT DO UPDATE con sumas en
+    la base de datos, así que pedidos concurrentes no pierden actualizaciones.
+    """
+    if not filas:
+        return
+    if connection.vendor not in ('sqlite', 'postgresql'):
+        for fila in filas:
+            fila = {modelo._meta.get_field(nombre).attname: valor for nombre, valor in fila.items()}
+            filtro = {campo: valor for campo, valor in fila.items() if campo not in CAMPOS_ACUMULADOS}
+            incrementos = {campo: F(campo) + fila[campo] for campo in CAMPOS_ACUMULADOS}
+            if not modelo.objects.filter(**filtro).update(**incrementos):
+                modelo.objects.create(**fila)
+        return
+
+    qn = connection.ops.quote_name
+    tabla = qn(modelo._meta.db_table)
+    columnas = [modelo._meta.get_field(nombre).column for nombre in (*claves, *CAMPOS_ACUMULADOS)]
+    marcadores = '(' + ', '.join(['%s'] * len(columnas)) + ')'
+    sql = (
+        f"INSERT INTO {tabla} ({', '.join(qn(c) for c in columnas)}) "
+        f"VALUES {', '.join([marcadores] * len(filas))} "
+        f"ON CONFLICT ({', '.join(qn(c) for c in columnas[:len(claves)])}) DO UPDATE SET "
+        + ', '.join(f'{qn(c)} = {tabla}.{qn(c)} + excluded.{qn(c)}' for c in columnas[len(claves):])
+    )
+    parametros = []
+    for fila in filas:
+        parametros.extend(fila[nombre] for nombre in (*claves, *CAMPOS_ACUMULADOS))
+    with connection.cursor() as cursor:
+        cursor.execute(sql, parametros)
+
+
+def _aplicar(fecha, estado, lineas, signo):
+    """Suma (signo=1) o resta (signo=-1) las líneas de un pedido en los tres resúmenes.
+
+    `lineas` es una lista de (producto_id, categoria_id, cantidad, precio_unitario).
+    """
+    if not lineas:
+        return
+    por_producto, por_categoria = {}, {}
+    for producto_id, categoria_id, cantidad, precio in lineas:
+        for acumulado, clave in ((por_producto, producto_id), (por_categoria, categoria_id)):
+            unidades, ingresos = acumulado.get(clave, (0, Decimal('0.00')))
+            acumulado[clave] = (unidades + cantidad, ingresos + cantidad * precio)
+
+    def filas(clave, acumulado):
+        return [
+            {'fecha': fecha, 'estado': estado, clave: id_,
+             'unidades': signo * unidades, 'ingresos': signo * ingresos, 'pedidos': signo}
+            for id_, (unidades, ingresos) in sorted(acumulado.items())
+        ]
+
+    with transaction.atomic():
+        _acumular(VentaDiariaProducto, ('fecha', 'producto', 'estado'), filas('producto', por_producto))
+        _acumular(VentaDiariaCategoria, ('fecha', 'categoria', 'estado'), filas('categoria', por_categoria))
+        _acumular(VentaDiaria, ('fecha', 'estado'), [{
+            'fecha': fecha, 'estado': estado,
+            'unidades': signo * sum(unidades for unidades, _ in por_producto.values()),
+            'ingresos': signo * sum((ingresos for _, ingresos in por_producto.values()), Decimal('0.00')),
+            'pedidos': signo,
+        }])
+
+
+def _lineas(pedido):
+    return list(DetallePedido.objects.filter(pedido_id=pedido.pk).values_list(
+        'producto_id', 'producto__categoria_id', 'cantidad', 'precio_unitario'
+    ))
+
+
+def registrar_pedido(pedido, lineas=None):
+    """Suma un pedido recién creado; `lineas` evita releer los detalles en el checkout"""
+    _aplicar(timezone.localdate(pedido.fecha_pedido), pedido.estado,
+             _lineas(pedido) if lineas is None else lineas, 1)
+
+
+def mover_pedido(pedido, estado_anterior):
+    """Pasa las cifras del pedido del estado anterior al actual"""
+    lineas = _lineas(pedido)
+    fecha = timezone.localdate(pedido.fecha_pedido)
+    with transaction.atomic():
+        _aplicar(fecha, estado_anterior, lineas, -1)
+        _aplicar(fecha, pedido.estado, lineas, 1)
+
+
+def retirar_pedido(pedido, estado=None):
+    """Resta un pedido que se va a eliminar"""
+    _aplicar(timezone.localdate(pedido.fecha_pedido), estado or pedido.estado, _lineas(pedido), -1)
+
+
+def reconstruir(desde=None, hasta=None):
+    """Recalcula los resúmenes desde los detalles de pedido (todo el historial o un rango de fechas)"""
+    importe = ExpressionWrapper(F('cantidad') * F('precio_unitario'),
+                                output_field=DecimalField(max_digits=14, decimal_places=2))
+    detalles = DetallePedido.objects.annotate(fecha=TruncDate('pedido__fecha_pedido'))
+    pedidos = Pedido.objects.annotate(fecha=TruncDate('fecha_pedido')).filter(item_count__gt=0)
+    resumenes = (VentaDiaria, VentaDiariaProducto, VentaDiariaCategoria)
+    if desde:
+        detalles, pedidos = detalles.filter(fecha__gte=desde), pedidos.filter(fecha__gte=desde)
+    if hasta:
+        detalles, pedidos = detalles.filter(fecha__lte=hasta), pedidos.filter(fecha__lte=hasta)
+
+    with transaction.atomic():
+        for modelo in resumenes:
+            existentes = modelo.objects.all()
+            if desde:
+                existentes = existentes.filter(fecha__gte=desde)
+            if hasta:
+                existentes = existentes.filter(fecha__lte=hasta)
+            existentes.delete()
+
+        def agrupar(*campos):
+            return detalles.values('fecha', 'pedido__estado', *campos).annotate(
+                unidades_=Sum('cantidad'), ingresos_=Sum(importe), pedidos_=Count('pedido', distinct=True)
+            ).order_by()
+
+        VentaDiariaProducto.objects.bulk_create([
+            VentaDiariaProducto(fecha=fila['fecha'], estado=fila['pedido__estado'], producto_id=fila['producto'],
+                                unidades=fila['unidades_'], ingresos=fila['ingresos_'], pedidos=fila['pedidos_'])
+            for fila in agrupar('producto').iterator()
+        ], batch_size=1000)
+        VentaDiariaCategoria.objects.bulk_create([
+            VentaDiariaCategoria(fecha=fila['fecha'], estado=fila['pedido__estado'],
+                                 categoria_id=fila['producto__categoria'], unidades=fila['unidades_'],
+                                 ingresos=fila['ingresos_'], pedidos=fila['pedidos_'])
+            for fila in agrupar('producto__categoria').iterator()
+        ], batch_size=1000)
+        VentaDiaria.objects.bulk_create([
+            VentaDiaria(fecha=fila['fecha'], estado=fila['estado'], unidades=fila['unidades_'],
+                        ingresos=fila['ingresos_'], pedidos=fila['pedidos_'])
+            for fila in pedidos.values('fecha', 'estado').annotate(
+                unidades_=Sum('item_count'), ingresos_=Sum('total'), pedidos_=Count('id')
+            ).order_by().iterator()
+        ], batch_size=1000)
+
+
+def panel(dias=30, hoy=None):
+    """Datos del panel de ventas, leídos solo de las tablas de resumen"""
+    hoy = hoy or timezone.localdate()
+    desde = hoy - timedelta(days=dias - 1)
+    activos = {'fecha__gte': desde, 'fecha__lte': hoy}
+    sumas = {'unidades_': Sum('unidades'), 'ingresos_': Sum('ingresos'), 'pedidos_': Sum('pedidos')}
+    validos = VentaDiaria.objects.filter(**activos).exclude(estado='cancelado')
+
+    return {
+        'desde': desde,
+        'hasta': hoy,
+        'totales': validos.aggregate(**sumas),
+        'por_dia': list(validos.values('fecha').annotate(**sumas).order_by('fecha')),
+        'por_estado': list(VentaDiaria.objects.filter(**activos).values('estado').annotate(**sumas).order_by('estado')),
+        'por_categoria': list(
+            VentaDiariaCategoria.objects.filter(**activos).exclude(estado='cancelado')
+            .values('categoria__nombre').annotate(**sumas).order_by('-ingresos_')
+        ),
+        'top_productos': list(
+            VentaDiariaProducto.objects.filter(**activos).exclude(estado='cancelado')
+            .values('producto__nombre').annotate(**sumas).order_by('-ingresos_')[:10]
+        ),
+    }
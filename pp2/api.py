@@ -0,0 +1,200 @@
+"""API JSON de solo lectura del catálogo para la app móvil.
+
+  GET /api/productos                 listado por cursor (?categoria, ?precio, ?q, ?cursor, ?limite)
+  GET /api/productos?ids=1,2,3       lote por ids en una sola consulta (para hidratar carritos)
+  GET /api/productos/<id>            un producto
+  GET /api/categorias                todas las categorías
+
+Todas aceptan ?fields=id,nombre,... para devolver solo esos campos; solo se leen
+de la base las columnas necesarias.
+"""
+from decimal import Decimal, InvalidOperation
+from functools import wraps
+
+from django.http import Http404, JsonResponse
+from django.views.decorators.http import require_GET
+
+from .bases_de_datos import lectura_en_replica
+from .cache_catalogo import ORDEN_CURSOR, PRODUCTOS_POR_PAGINA, filtrar_productos
+from .condicional import condicional, validadores_catalogo, validadores_producto
+from .models import Categoria, Producto
+from .paginacion import CursorInvalido, paginar_por_cursor
+
+MAX_POR_PAGINA = 100
+MAX_IDS = 100
+# JSON sin espacios y con tildes sin escapar
+JSON_COMPACTO = {'separators': (',', ':'), 'ensure_ascii': False}
+
+
+class ParametroInvalido(ValueError):
+    """Un parámetro de la petición no se puede interpretar (se responde 400)"""
+
+
+def _imagen(producto):
+    return producto.imagen.url if producto.imagen else None
+
+
+def _miniaturas(producto):
+    storage = Producto._meta.get_field('imagen').storage
+    return [
+        {'url': storage.url(derivada['nombre']), 'ancho': derivada['ancho'], 'formato': derivada['formato']}
+        for derivada in producto.derivadas
+    ]
+
+
+# Campo de la API -> (columna a leer, valor a partir de la instancia)
+CAMPOS_PRODUCTO = {
+    'id': ('id', lambda producto: producto.id),
+    'nombre': ('nombre', lambda producto: producto.nombre),
+    'descripcion': ('descripcion', lambda producto: producto.descripcion),
+    'precio': ('precio', lambda producto: producto.precio),
+    'stock': ('stock', lambda producto: producto.stock),
+    'disponible': ('disponible', lambda producto: producto.disponible),
+    'categoria': ('categoria_id', lambda producto: producto.categoria_id),
+    'imagen': ('imagen', _imagen),
+    'miniaturas': ('derivadas', _miniaturas),
+    'actualizado': ('actualizado', lambda producto: producto.actualizado),
+}
+CAMPOS_PRODUCTO_POR_DEFECTO = ('id', 'nombre', 'precio', 'imagen', 'categoria')
+
+CAMPOS_CATEGORIA = {
+    'id': ('id', lambda categoria: categoria.id),
+    'nombre': ('nombre', lambda categoria: categoria.nombre),
+    'descripcion': ('descripcion', lambda categoria: categoria.descripcion),
+    'actualizado': ('actualizado', lambda categoria: categoria.actualizado),
+}
+CAMPOS_CATEGORIA_POR_DEFECTO = ('id', 'nombre')
+
+
+def api(vista):
+    """Solo GET; los errores se responden con un JSON {"error": ...} (400 o 404)"""
+    @require_GET
+    @wraps(vista)
+    def envoltura(request, *args, **kwargs):
+        try:
+            return vista(request, *args, **kwargs)
+        except (ParametroInvalido, CursorInvalido) as error:
+            return JsonResponse({'error': str(error)}, status=400, json_dumps_params=JSON_COMPACTO)
+        except Http404 as error:
+            return JsonResponse({'error': str(error)}, status=404, json_dumps_params=JSON_COMPACTO)
+    return envoltura
+
+
+def _respuesta(datos):
+    return JsonResponse(datos, json_dumps_params=JSON_COMPACTO)
+
+
+def _campos(request, disponibles, por_defecto):
+    """Campos pedidos con ?fields= (en orden y sin repetir)"""
+    pedidos = [campo.strip() for campo in request.GET.get('fields', '').split(',') if campo.strip()]
+    if not pedidos:
+        return list(por_defecto)
+    desconocidos = [campo for campo in pedidos if campo not in disponibles]
+    if desconocidos:
+        raise ParametroInvalido(
+            f"Campos desconocidos: {', '.join(desconocidos)} (disponibles: {', '.join(disponibles)})"
+        )
+    return list(dict.fromkeys(pedidos))
+
+
+def _columnas(disponibles, campos, *obligatorias):
+    return list(dict.fromkeys([disponibles[campo][0] for campo in campos] + list(obligatorias)))
+
+
+def _serializar(objetos, disponibles, campos):
+    return [{campo: disponibles[campo][1](objeto) for campo in campos} for objeto in objetos]
+
+
+def _entero(valor, nombre, minimo=1, maximo=None):
+    try:
+        numero = int(valor)
+    except (TypeError, ValueError):
+        raise ParametroInvalido(f'{nombre} debe ser un número entero')
+    if numero < minimo:
+        raise ParametroInvalido(f'{nombre} debe ser al menos {minimo}')
+    if maximo is not None and numero > maximo:
+        raise ParametroInvalido(f'{nombre} no puede ser mayor que {maximo}')
+    return numero
+
+
+def _ids(valor):
+    ids = [_entero(parte, 'ids') for parte in valor.split(',') if parte.strip()]
+    if not ids:
+        raise ParametroInvalido('ids no puede estar vacío')
+    if len(ids) > MAX_IDS:
+        raise ParametroInvalido(f'Se admiten como máximo {MAX_IDS} ids por petición')
+    return list(dict.fromkeys(ids))
+
+
+def _precio(valor):
+    if not valor:
+        return None
+    try:
+        return Decimal(valor)
+    except InvalidOperation:
+        raise ParametroInvalido('precio debe ser un número')
+
+
+@api
+@lectura_en_replica
+def productos(request):
+    if 'ids' in request.GET:
+        return _lote_productos(request)
+    return _listado_productos(request)
+
+
+@condicional(validadores_catalogo)
+def _listado_productos(request):
+    """Productos disponibles por keyset (precio, id); `siguiente`/`anterior` son cursores opacos"""
+    campos = _campos(request, CAMPOS_PRODUCTO, CAMPOS_PRODUCTO_POR_DEFECTO)
+    limite = _entero(request.GET.get('limite', PRODUCTOS_POR_PAGINA), 'limite', maximo=MAX_POR_PAGINA)
+    queryset = filtrar_productos(
+        request.GET.get('categoria'), _precio(request.GET.get('precio')), request.GET.get('q', '').strip(),
+    ).only(*_columnas(CAMPOS_PRODUCTO, campos, *ORDEN_CURSOR))
+    pagina = paginar_por_cursor(queryset, ORDEN_CURSOR, request.GET.get('cursor'), limite)
+    return _respuesta({
+        'resultados': _serializar(pagina, CAMPOS_PRODUCTO, campos),
+        'siguiente': pagina.next_cursor,
+        'anterior': pagina.previous_cursor,
+    })
+
+
+def _lote_productos(request):
+    """Productos con los ids pedidos, en ese orden, con una sola consulta.
+
+    Incluye los no disponibles (un carrito puede tenerlos); los ids que no
+    existen se devuelven en `faltantes`.
+    """
+    ids = _ids(request.GET['ids'])
+    campos = _campos(request, CAMPOS_PRODUCTO, CAMPOS_PRODUCTO_POR_DEFECTO)
+    por_id = {
+        producto.id: producto
+        for producto in Producto.objects.filter(id__in=ids).only(*_columnas(CAMPOS_PRODUCTO, campos, 'id'))
+    }
+    return _respuesta({
+        'resultados': _serializar((por_id[id_] for id_ in ids if id_ in por_id), CAMPOS_PRODUCTO, campos),
+        'faltantes': [id_ for id_ in ids if id_ not in por_id],
+    })
+
+
+@api
+@lectura_en_replica
+@condicional(validadores_producto)
+def producto(request, producto_id):
+    campos = _campos(request, CAMPOS_PRODUCTO, CAMPOS_PRODUCTO_POR_DEFECTO)
+    encontrado = Producto.objects.filter(pk=producto_id).only(*_columnas(CAMPOS_PRODUCTO, campos)).first()
+    if encontrado is None:
+        raise Http404('No existe el producto')
+    return _respuesta(_serializar([encontrado], CAMPOS_PRODUCTO, campos)[0])
+
+
+@api
+@lectura_en_replica
+def categorias(request):
+    campos = _campos(request, CAMPOS_CATEGORIA, CAMPOS_CATEGORIA_POR_DEFECTO)
+    return _respuesta({
+        'resultados': _serializar(
+            Categoria.objects.order_by('nombre').only(*_columnas(CAMPOS_CATEGORIA, campos)),
+            CAMPOS_CATEGORIA, campos,
+        ),
+    })
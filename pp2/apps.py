@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class Pp2Config(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'pp2'
+
+    def ready(self):
+        # Registra los receptores de señales y las tareas en segundo plano del app
+        from . import signals, tareas  # noqa: F401
@@ -0,0 +1,81 @@
+import asyncio
+import random
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import connections
+
+# Modelos del catálogo que pueden leerse de una réplica (admiten algo de retraso)
+MODELOS_CATALOGO = {'pp2.producto', 'pp2.categoria', 'pp2.terminobusqueda'}
+
+_lectura_en_replica = ContextVar('lectura_en_replica', default=False)
+
+
+def replicas():
+    return getattr(settings, 'BASES_DE_DATOS_REPLICA', [])
+
+
+def lectura_en_replica(vista):
+    """Decorador: durante la vista, las lecturas del catálogo van a una réplica.
+
+    Sirve también para vistas async: sync_to_async copia el contexto al hilo
+    donde corre el ORM.
+    """
+    if asyncio.iscoroutinefunction(vista):
+        @wraps(vista)
+        async def envoltura_async(request, *args, **kwargs):
+            marca = _lectura_en_replica.set(True)
+            try:
+                return await vista(request, *args, **kwargs)
+            finally:
+                _lectura_en_replica.reset(marca)
+        return envoltura_async
+
+    @wraps(vista)
+    def envoltura(request, *args, **kwargs):
+        marca = _lectura_en_replica.set(True)
+        try:
+            return vista(request, *args, **kwargs)
+        finally:
+            _lectura_en_replica.reset(marca)
+    return envoltura
+
+
+class RouterReplicas:
+    """Envía a una réplica las lecturas del catálogo hechas dentro de vistas marcadas.
+
+    Sesiones, usuarios, carritos y pedidos siempre se leen de `default` para no
+    ver datos atrasados justo después de escribirlos. Las escrituras van a `default`.
+    """
+
+    def db_for_read(self, model, **hints):
+        disponibles = replicas()
+        if disponibles and _lectura_en_replica.get() and model._meta.label_lower in MODELOS_CATALOGO:
+            return random.choice(disponibles)
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Todas las bases tienen los mismos datos
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None
+
+
+def verificar_conexiones():
+    """Cierra las conexiones persistentes que ya no responden para que se reabran.
+
+    Equivale a CONN_HEALTH_CHECKS de Django 4.1: sin esto, una conexión cortada por
+    la base o por la red falla en la primera consulta de la siguiente petición.
+    """
+    if not getattr(settings, 'DB_VERIFICAR_CONEXIONES', True):
+        return
+    for conexion in connections.all():
+        if conexion.connection is None or conexion.in_atomic_block or not conexion.settings_dict['CONN_MAX_AGE']:
+            continue
+        if not conexion.is_usable():
+            conexion.close()
@@ -0,0 +1,364 @@
+import asyncio
+import io
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from .middleware import percentil
+from .models import Categoria, DetallePedido, DireccionEnvio, Pedido, Producto
+
+CLAVE_USUARIO = 'bench'
+DIRECCION = {
+    'nombres': 'Cliente', 'apellidos': 'Prueba', 'celular': '999999999', 'dni': '12345678',
+    'direccion': 'Av. Siempre Viva 123', 'ciudad': 'Lima', 'distrito': 'Miraflores',
+    'pais': 'Perú', 'correo': 'cliente@example.com',
+}
+
+
+@contextmanager
+def base_temporal():
+    """Base SQLite en un archivo temporal (no en memoria, para que los hilos compartan datos)"""
+    descriptor, ruta = tempfile.mkstemp(prefix='benchmark-', suffix='.sqlite3')
+    os.close(descriptor)
+    connection.settings_dict.setdefault('TEST', {})['NAME'] = ruta
+    nombre_original = connection.settings_dict['NAME']
+    setup_test_environment()
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        cache.clear()
+        yield ruta
+    finally:
+        connection.creation.destroy_test_db(nombre_original, verbosity=0)
+        teardown_test_environment()
+        for sufijo in ('', '-wal', '-shm'):
+            if os.path.exists(ruta + sufijo):
+                os.remove(ruta + sufijo)
+
+
+def sembrar_datos(productos=500, usuarios=50, pedidos=2000, categorias=8, semilla=1):
+    """Carga un conjunto de datos sintético reproducible y devuelve los usuarios creados"""
+    azar = random.Random(semilla)
+    Categoria.objects.bulk_create([Categoria(nombre=f'Categoría {i}') for i in range(categorias)])
+    ids_categorias = list(Categoria.objects.order_by('id').values_list('id', flat=True))
+
+    Producto.objects.bulk_create([
+        Producto(
+            nombre=f'Producto {i}',
+            descripcion=f'Descripción del producto {i}',
+            precio=Decimal(azar.randint(100, 10000)) / 100,
+            # Stock alto para que las compras del escenario no se queden sin unidades
+            stock=1_000_000,
+            disponible=i % 10 != 0,
+            categoria_id=ids_categorias[i % len(ids_categorias)],
+        )
+        for i in range(productos)
+    ], batch_size=500)
+    precios = dict(Producto.objects.values_list('id', 'precio'))
+    ids_productos = list(precios)
+
+    # Un solo hash para todos: el escenario usa force_login
+    clave = make_password(CLAVE_USUARIO)
+    User.objects.bulk_create([
+        User(username=f'{CLAVE_USUARIO}{i}', password=clave) for i in range(usuarios)
+    ], batch_size=500)
+    creados = list(User.objects.filter(username__startswith=CLAVE_USUARIO).order_by('id'))
+
+    DireccionEnvio.objects.bulk_create([DireccionEnvio(usuario=usuario, **DIRECCION) for usuario in creados])
+    direcciones = dict(DireccionEnvio.objects.values_list('usuario_id', 'id'))
+    estados = [estado for estado, _ in Pedido.ESTADOS]
+    Pedido.objects.bulk_create([
+        Pedido(usuario_id=usuario.pk, direccion_envio_id=direcciones[usuario.pk], estado=azar.choice(estados))
+        for usuario in (creados[i % len(creados)] for i in range(pedidos))
+    ], batch_size=500)
+    # SQLite no devuelve los ids en bulk_create
+    nuevos = list(Pedido.objects.order_by('id'))
+
+    detalles = []
+    for pedido in nuevos:
+        for producto_id in azar.sample(ids_productos, min(3, len(ids_productos))):
+            cantidad = azar.randint(1, 5)
+            detalles.append(DetallePedido(pedido=pedido, producto_id=producto_id, cantidad=cantidad,
+                                          precio_unitario=precios[producto_id]))
+            pedido.total += precios[producto_id] * cantidad
+            pedido.item_count += cantidad
+    DetallePedido.objects.bulk_create(detalles, batch_size=1000)
+    Pedido.objects.bulk_update(nuevos, ['total', 'item_count'], batch_size=500)
+    return creados
+
+
+class Medicion:
+    """Latencias y consultas por paso del escenario, compartidas por los hilos"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.pasos = {}
+
+    def registrar(self, paso, ms, consultas, error):
+        with self._lock:
+            datos = self.pasos.setdefault(paso, {'ms': [], 'consultas': [], 'errores': 0})
+            datos['ms'].append(ms)
+            datos['consultas'].append(consultas)
+            datos['errores'] += error
+
+
+def _peticion(cliente, medicion, paso, metodo, url, datos=None):
+    # Las vistas del recorrido redirigen tras cada POST exitoso
+    esperado = 302 if metodo == 'post' else 200
+    inicio = time.perf_counter()
+    try:
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = getattr(cliente, metodo)(url, datos or {})
+        error = respuesta.status_code != esperado
+    except Exception:
+        error = True
+    medicion.registrar(paso, (time.perf_counter() - inicio) * 1000, len(consultas), error)
+
+
+def recorrido_cliente(usuario, productos, medicion, azar):
+    """Un cliente navega el catálogo, arma el carrito, compra y revisa sus pedidos"""
+    # Sin relanzar excepciones: el cliente las recibe por una señal global compartida entre hilos
+    cliente = Client(raise_request_exception=False)
+    cliente.force_login(usuario)
+    producto_id, otro_id = azar.sample(productos, 2)
+    pasos = [
+        ('inicio', 'get', reverse('inicio')),
+        ('productos', 'get', reverse('productos')),
+        ('productos_pagina', 'get', reverse('productos') + f'?page={azar.randint(1, 5)}'),
+        ('detalle_producto', 'get', reverse('detalle_producto', args=[producto_id])),
+        ('carrito_agregar', 'post', reverse('crear_pedido', args=[producto_id]), {'cantidad': 2}),
+        ('carrito_agregar', 'post', reverse('crear_pedido', args=[otro_id]), {'cantidad': 1}),
+        ('ver_carrito', 'get', reverse('ver_carrito')),
+        ('carrito_eliminar', 'post', reverse('eliminar_pedido', args=[otro_id])),
+        ('finalizar_compra', 'get', reverse('finalizar_compra')),
+        ('finalizar_compra_post', 'post', reverse('finalizar_compra'), DIRECCION),
+        ('pedidos', 'get', reverse('pedidos')),
+    ]
+    for paso, metodo, url, *datos in pasos:
+        _peticion(cliente, medicion, paso, metodo, url, *datos)
+
+
+def ejecutar(usuarios, iteraciones=1, concurrencia=8, semilla=1):
+    """Corre `iteraciones` recorridos por usuario con `concurrencia` hilos y devuelve el reporte.
+
+    Los recorridos de un mismo usuario son secuenciales: su carrito es único.
+    """
+    productos = list(Producto.objects.filter(disponible=True).values_list('id', flat=True))
+    medicion = Medicion()
+    trabajos = [(usuario, random.Random(semilla + n)) for n, usuario in enumerate(usuarios)]
+
+    def trabajo(args):
+        usuario, azar = args
+        try:
+            for _ in range(iteraciones):
+                recorrido_cliente(usuario, productos, medicion, azar)
+        finally:
+            # Cada hilo abre su propia conexión
+            if concurrencia > 1:
+                connections.close_all()
+
+    inicio = time.perf_counter()
+    if concurrencia > 1:
+        with ThreadPoolExecutor(max_workers=concurrencia) as pool:
+            list(pool.map(trabajo, trabajos))
+    else:
+        for args in trabajos:
+            trabajo(args)
+    segundos = time.perf_counter() - inicio
+    return reporte(medicion, segundos)
+
+
+def reporte(medicion, segundos):
+    pasos = {}
+    total = 0
+    for paso, datos in sorted(medicion.pasos.items()):
+        ms = sorted(datos['ms'])
+        total += len(ms)
+        pasos[paso] = {
+            'peticiones': len(ms),
+            'errores': datos['errores'],
+            'p50_ms': round(percentil(ms, 50), 2),
+            'p95_ms': round(percentil(ms, 95), 2),
+            'p99_ms': round(percentil(ms, 99), 2),
+            'consultas': round(sum(datos['consultas']) / len(datos['consultas']), 2),
+        }
+    return {
+        'segundos': round(segundos, 3),
+        'peticiones': total,
+        'peticiones_por_segundo': round(total / segundos, 2) if segundos else 0,
+        'pasos': pasos,
+    }
+
+
+def comparar(base, actual, umbral=0.25, margen_ms=2.0):
+    """Lista de regresiones de `actual` frente a `base`.
+
+    La latencia p95 de un paso o el throughput pueden empeorar hasta `umbral`
+    (proporción); `margen_ms` evita falsos positivos en pasos muy rápidos.
+    Las consultas por petición no pueden aumentar y no puede haber errores nuevos.
+    """
+    regresiones = []
+    if actual['peticiones_por_segundo'] < base['peticiones_por_segundo'] * (1 - umbral):
+        regresiones.append(
+            f"throughput: {actual['peticiones_por_segundo']} req/s (base {base['peticiones_por_segundo']})"
+        )
+    for paso, datos in actual['pasos'].items():
+        anterior = base['pasos'].get(paso)
+        if anterior is None:
+            continue
+        if datos['p95_ms'] > anterior['p95_ms'] * (1 + umbral) + margen_ms:
+            regresiones.append(f"{paso}: p95 {datos['p95_ms']} ms (base {anterior['p95_ms']} ms)")
+        if datos['consultas'] > anterior['consultas']:
+            regresiones.append(f"{paso}: {datos['consultas']} consultas/petición (base {anterior['consultas']})")
+        if datos['errores'] > anterior['errores']:
+            regresiones.append(f"{paso}: {datos['errores']} errores (base {anterior['errores']})")
+    return regresiones
+
+
+def guardar(reporte_, ruta, configuracion):
+    with open(ruta, 'w', encoding='utf-8') as archivo:
+        json.dump({'configuracion': configuracion, 'reporte': reporte_}, archivo, indent=2, ensure_ascii=False)
+
+
+def cargar(ruta):
+    with open(ruta, encoding='utf-8') as archivo:
+        return json.load(archivo)
+
+
+# Comparación WSGI / ASGI con clientes lentos
+
+RUTAS_LECTURA = ('inicio', 'productos', 'detalle_producto', 'ver_carrito')
+
+
+def urls_lectura(productos):
+    """URLs de las vistas de lectura del catálogo y del carrito"""
+    return [
+        reverse('inicio'),
+        reverse('productos'),
+        reverse('productos') + '?page=2',
+        *[reverse('detalle_producto', args=[producto_id]) for producto_id in productos[:5]],
+        reverse('ver_carrito'),
+    ]
+
+
+def cookie_de_sesion(usuario):
+    cliente = Client()
+    cliente.force_login(usuario)
+    return cliente.cookies[settings.SESSION_COOKIE_NAME].value
+
+
+def _resumen_servidor(latencias, errores, segundos):
+    latencias.sort()
+    return {
+        'peticiones': len(latencias),
+        'errores': errores,
+        'segundos': round(segundos, 3),
+        'peticiones_por_segundo': round(len(latencias) / segundos, 2) if segundos else 0,
+        'p50_ms': round(percentil(latencias, 50), 2),
+        'p95_ms': round(percentil(latencias, 95), 2),
+        'p99_ms': round(percentil(latencias, 99), 2),
+    }
+
+
+def medir_wsgi(urls, cookie, conexiones, peticiones, hilos, latencia_cliente):
+    """Servidor WSGI con `hilos` workers: cada worker queda ocupado mientras el cliente lento recibe"""
+    from django.core.handlers.wsgi import WSGIHandler
+
+    aplicacion = WSGIHandler()
+    errores = []
+
+    def atender(url):
+        ruta, _, consulta = url.partition('?')
+        entorno = {
+            'REQUEST_METHOD': 'GET', 'PATH_INFO': ruta, 'QUERY_STRING': consulta,
+            'SERVER_NAME': 'testserver', 'SERVER_PORT': '80', 'HTTP_HOST': 'testserver',
+            'HTTP_COOKIE': f'{settings.SESSION_COOKIE_NAME}={cookie}',
+            'wsgi.input': io.BytesIO(), 'wsgi.url_scheme': 'http', 'wsgi.errors': io.StringIO(),
+        }
+        estado = []
+        cuerpo = aplicacion(entorno, lambda status, headers, exc_info=None: estado.append(status))
+        try:
+            for _ in cuerpo:
+                time.sleep(latencia_cliente)
+        finally:
+            cuerpo.close()
+        if not estado[0].startswith('200'):
+            errores.append(url)
+
+    def cliente(numero):
+        # Cada cliente espera su respuesta antes de pedir la siguiente; la latencia
+        # incluye el tiempo en la cola del servidor si todos los workers están ocupados
+        propias = []
+        for i in range(numero, peticiones, conexiones):
+            inicio = time.perf_counter()
+            servidor.submit(atender, urls[i % len(urls)]).result()
+            propias.append((time.perf_counter() - inicio) * 1000)
+        return propias
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=hilos) as servidor, ThreadPoolExecutor(max_workers=conexiones) as clientes:
+        latencias = [ms for propias in clientes.map(cliente, range(conexiones)) for ms in propias]
+    segundos = time.perf_counter() - inicio
+    connections.close_all()
+    return _resumen_servidor(latencias, len(errores), segundos)
+
+
+def medir_asgi(urls, cookie, conexiones, peticiones, latencia_cliente):
+    """Aplicación ASGI de pp1/asgi.py con `conexiones` clientes lentos sobre un solo event loop"""
+    from pp1.asgi import application
+
+    errores = []
+    latencias = []
+
+    async def atender(url):
+        inicio = time.perf_counter()
+        ruta, _, consulta = url.partition('?')
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': ruta, 'raw_path': ruta.encode(), 'query_string': consulta.encode(),
+            'root_path': '', 'server': ('testserver', 80), 'client': ('127.0.0.1', 50000),
+            'headers': [(b'host', b'testserver'),
+                        (b'cookie', f'{settings.SESSION_COOKIE_NAME}={cookie}'.encode())],
+        }
+        estado = {}
+
+        async def recibir():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def enviar(mensaje):
+            if mensaje['type'] == 'http.response.start':
+                estado['status'] = mensaje['status']
+            elif mensaje['type'] == 'http.response.body':
+                # El cliente lento no bloquea ningún hilo: solo esta corrutina espera
+                await asyncio.sleep(latencia_cliente)
+
+        await application(scope, recibir, enviar)
+        if estado.get('status') != 200:
+            errores.append(url)
+        latencias.append((time.perf_counter() - inicio) * 1000)
+
+    async def cliente(numero):
+        for i in range(numero, peticiones, conexiones):
+            await atender(urls[i % len(urls)])
+
+    async def todos():
+        await asyncio.gather(*(cliente(numero) for numero in range(conexiones)))
+
+    inicio = time.perf_counter()
+    asyncio.run(todos())
+    segundos = time.perf_counter() - inicio
+    return _resumen_servidor(latencias, len(errores), segundos)
@@ -0,0 +1,182 @@
+import re
+import unicodedata
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection, connections, router, transaction
+
+TABLA_FTS = 'pp2_producto_fts'
+PESO_NOMBRE = 10.0
+PESO_DESCRIPCION = 1.0
+LONGITUD_MAXIMA_TERMINO = 64
+
+# Alias de conexión -> si tiene la tabla FTS5 (la réplica puede no tenerla)
+_fts5_disponible = {}
+
+
+def normalizar(texto):
+    """Minúsculas y sin tildes: "Arándanos" -> "arandanos" """
+    descompuesto = unicodedata.normalize('NFKD', texto or '')
+    return ''.join(c for c in descompuesto if not unicodedata.combining(c)).lower()
+
+
+def tokenizar(texto):
+    return [token[:LONGITUD_MAXIMA_TERMINO] for token in re.findall(r'\w+', normalizar(texto))]
+
+
+def terminos_ponderados(nombre, descripcion):
+    """Peso de cada término de un producto: las coincidencias en el nombre valen más"""
+    pesos = Counter()
+    for token in tokenizar(nombre):
+        pesos[token] += PESO_NOMBRE
+    for token in tokenizar(descripcion):
+        pesos[token] += PESO_DESCRIPCION
+    return pesos
+
+
+def usa_fts5(conexion=connection):
+    """Backend activo en `conexion`: la tabla FTS5 si la migración pudo crearla, si no el índice invertido"""
+    if not getattr(settings, 'BUSQUEDA_USAR_FTS5', True):
+        return False
+    if conexion.alias not in _fts5_disponible:
+        _fts5_disponible[conexion.alias] = TABLA_FTS in conexion.introspection.table_names()
+    return _fts5_disponible[conexion.alias]
+
+
+def _conexion_lectura():
+    # La misma base a la que el router manda las lecturas del catálogo (una réplica en sus vistas)
+    from .models import Producto
+
+    return connections[router.db_for_read(Producto)]
+
+
+# --- Mantenimiento del índice ---
+
+def indexar_producto(producto):
+    """Actualiza la entrada del producto en el índice de búsqueda"""
+    indexar_productos([producto])
+
+
+def indexar_productos(productos):
+    """Actualiza en bloque las entradas de varios productos (usado por la importación)"""
+    from .models import TerminoBusqueda
+
+    productos = list(productos)
+    if not productos:
+        return
+    ids = [producto.pk for producto in productos]
+
+    if usa_fts5():
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {TABLA_FTS} WHERE rowid = %s', [(pk,) for pk in ids])
+            cursor.executemany(
+                f'INSERT INTO {TABLA_FTS} (rowid, nombre, descripcion) VALUES (%s, %s, %s)',
+                [(p.pk, normalizar(p.nombre), normalizar(p.descripcion)) for p in productos],
+            )
+        return
+
+    with transaction.atomic():
+        TerminoBusqueda.objects.filter(producto_id__in=ids).delete()
+        TerminoBusqueda.objects.bulk_create([
+            TerminoBusqueda(termino=termino, producto_id=producto.pk, peso=peso)
+            for producto in productos
+            for termino, peso in terminos_ponderados(producto.nombre, producto.descripcion).items()
+        ], batch_size=1000)
+
+
+def desindexar_producto(producto_id):
+    from .models import TerminoBusqueda
+
+    if usa_fts5():
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {TABLA_FTS} WHERE rowid = %s', [producto_id])
+    else:
+        TerminoBusqueda.objects.filter(producto_id=producto_id).delete()
+
+
+def reconstruir_indice(tamano_lote=500):
+    """Vuelve a indexar todo el catálogo; devuelve la cantidad de productos indexados"""
+    from .models import Producto, TerminoBusqueda
+
+    productos = Producto.objects.only('id', 'nombre', 'descripcion').order_by('id')
+    total = 0
+    with transaction.atomic():
+        if usa_fts5():
+            with connection.cursor() as cursor:
+                cursor.execute(f'DELETE FROM {TABLA_FTS}')
+                lote = []
+                for producto in productos.iterator(chunk_size=tamano_lote):
+                    lote.append((producto.pk, normalizar(producto.nombre), normalizar(producto.descripcion)))
+                    if len(lote) >= tamano_lote:
+                        cursor.executemany(f'INSERT INTO {TABLA_FTS} (rowid, nombre, descripcion) VALUES (%s, %s, %s)', lote)
+                        total += len(lote)
+                        lote = []
+                if lote:
+                    cursor.executemany(f'INSERT INTO {TABLA_FTS} (rowid, nombre, descripcion) VALUES (%s, %s, %s)', lote)
+                    total += len(lote)
+            return total
+
+        TerminoBusqueda.objects.all().delete()
+        lote = []
+        for producto in productos.iterator(chunk_size=tamano_lote):
+            total += 1
+            lote.extend(
+                TerminoBusqueda(termino=termino, producto_id=producto.pk, peso=peso)
+                for termino, peso in terminos_ponderados(producto.nombre, producto.descripcion).items()
+            )
+            if len(lote) >= tamano_lote:
+                TerminoBusqueda.objects.bulk_create(lote)
+                lote = []
+        TerminoBusqueda.objects.bulk_create(lote)
+    return total
+
+
+# --- Consultas ---
+
+def _buscar_fts5(conexion, tokens, limite):
+    # Cada token como prefijo entre comillas (sin sintaxis FTS del usuario); todos deben aparecer
+    consulta = ' '.join(f'"{token}"*' for token in tokens)
+    with conexion.cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid FROM {TABLA_FTS} WHERE {TABLA_FTS} MATCH %s '
+            f'ORDER BY bm25({TABLA_FTS}, %s, %s) LIMIT %s',
+            [consulta, PESO_NOMBRE, PESO_DESCRIPCION, limite],
+        )
+        return [fila[0] for fila in cursor.fetchall()]
+
+
+def _buscar_indice_invertido(conexion, tokens, limite):
+    from .models import TerminoBusqueda
+
+    puntajes = None
+    for token in tokens:
+        # Prefijo como rango sobre el índice (termino >= token AND termino < token + U+FFFF)
+        coincidencias = Counter()
+        for producto_id, peso in TerminoBusqueda.objects.using(conexion.alias).filter(
+            termino__gte=token, termino__lt=token + '\uffff'
+        ).values_list('producto_id', 'peso'):
+            coincidencias[producto_id] += peso
+        if puntajes is None:
+            puntajes = coincidencias
+        else:
+            puntajes = Counter({
+                producto_id: puntaje + coincidencias[producto_id]
+                for producto_id, puntaje in puntajes.items() if producto_id in coincidencias
+            })
+        if not puntajes:
+            return []
+    ordenados = sorted(puntajes.items(), key=lambda item: (-item[1], item[0]))
+    return [producto_id for producto_id, _ in ordenados[:limite]]
+
+
+def buscar_ids(texto, limite=None):
+    """Ids de productos que contienen todos los términos (por prefijo), del más al menos relevante"""
+    tokens = list(dict.fromkeys(tokenizar(texto)))
+    if not tokens:
+        return []
+    if limite is None:
+        limite = getattr(settings, 'BUSQUEDA_LIMITE', 500)
+    conexion = _conexion_lectura()
+    if usa_fts5(conexion):
+        return _buscar_fts5(conexion, tokens, limite)
+    return _buscar_indice_invertido(conexion, tokens, limite)
@@ -0,0 +1,130 @@
+import hashlib
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Page, Paginator
+from django.db.models import Case, IntegerField, When
+
+from .busqueda import buscar_ids
+from .models import Producto
+from .paginacion import paginar_por_cursor
+
+PRODUCTOS_POR_PAGINA = 12
+ORDEN_CURSOR = ('precio', 'id')
+CLAVE_VERSION = 'catalogo:version'
+
+_lock = threading.Lock()
+_contadores = {'hits': 0, 'misses': 0}
+
+
+class _PaginatorConConteo(Paginator):
+    """Paginator que reutiliza un COUNT ya conocido en lugar de consultarlo"""
+
+    def __init__(self, object_list, per_page, count):
+        super().__init__(object_list, per_page)
+        self.count = count
+
+
+def _timeout():
+    return getattr(settings, 'CATALOGO_CACHE_TIMEOUT', 60 * 60)
+
+
+def _contar(nombre):
+    with _lock:
+        _contadores[nombre] += 1
+
+
+def version_catalogo():
+    """Versión actual del catálogo; forma parte de todas las claves"""
+    version = cache.get(CLAVE_VERSION)
+    if version is None:
+        cache.add(CLAVE_VERSION, 1, timeout=None)
+        version = cache.get(CLAVE_VERSION, 1)
+    return version
+
+
+def invalidar_catalogo():
+    """Incrementa la versión para que las entradas anteriores dejen de usarse"""
+    try:
+        cache.incr(CLAVE_VERSION)
+    except ValueError:
+        cache.add(CLAVE_VERSION, 1, timeout=None)
+
+
+def _clave(*partes):
+    resumen = hashlib.md5(repr(partes).encode('utf-8')).hexdigest()
+    return f'catalogo:v{version_catalogo()}:{resumen}'
+
+
+def filtrar_productos(categoria=None, precio=None, q=None):
+    """Queryset del listado de productos con los filtros de la tienda.
+
+    Con una búsqueda `q` los resultados salen ordenados por relevancia.
+    """
+    productos = Producto.objects.filter(disponible=True).order_by(*ORDEN_CURSOR)
+    if categoria:
+        productos = productos.filter(categoria__nombre=categoria)
+    if precio:
+        productos = productos.filter(precio__lte=precio)
+    if q:
+        ids = buscar_ids(q)
+        productos = productos.filter(id__in=ids).order_by(Case(
+            *[When(id=producto_id, then=posicion) for posicion, producto_id in enumerate(ids)],
+            output_field=IntegerField(),
+        ), 'id')
+    return productos
+
+
+def pagina_productos(categoria=None, precio=None, page_number=None, q=None):
+    """Página del listado de productos, servida desde la caché cuando es posible"""
+    clave = _clave('productos', categoria or '', precio or '', page_number or '', q or '')
+    datos = cache.get(clave)
+
+    if datos is None:
+        _contar('misses')
+        page_obj = Paginator(filtrar_productos(categoria, precio, q), PRODUCTOS_POR_PAGINA).get_page(page_number)
+        datos = {
+            'productos': list(page_obj.object_list),
+            'count': page_obj.paginator.count,
+            'number': page_obj.number,
+        }
+        cache.set(clave, datos, _timeout())
+        return page_obj
+
+    _contar('hits')
+    paginator = _PaginatorConConteo(datos['productos'], PRODUCTOS_POR_PAGINA, datos['count'])
+    return Page(datos['productos'], datos['number'], paginator)
+
+
+def pagina_productos_cursor(categoria=None, precio=None, cursor=None, q=None):
+    """Página del listado por keyset (precio, id), también servida desde la caché.
+
+    Con búsqueda, el orden sigue siendo (precio, id): la relevancia solo filtra.
+    """
+    clave = _clave('productos-cursor', categoria or '', precio or '', cursor or '', q or '')
+    pagina = cache.get(clave)
+
+    if pagina is None:
+        _contar('misses')
+        pagina = paginar_por_cursor(
+            filtrar_productos(categoria, precio, q), ORDEN_CURSOR, cursor, PRODUCTOS_POR_PAGINA
+        )
+        cache.set(clave, pagina, _timeout())
+        return pagina
+
+    _contar('hits')
+    return pagina
+
+
+def estadisticas():
+    """Contadores de aciertos y fallos de la caché del catálogo en este proceso"""
+    with _lock:
+        hits, misses = _contadores['hits'], _contadores['misses']
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'ratio': hits / total if total else 0.0,
+        'version': version_catalogo(),
+    }
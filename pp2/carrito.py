@@ -0,0 +1,165 @@
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .cupones import CuponInvalido, buscar_cupon, calcular_descuento
+from .models import Carrito, CarritoItem, Producto
+
+CLAVE_SESION = 'carrito_id'
+CLAVE_SESION_CUPON = 'cupon'
+
+
+def _validar_cantidad(cantidad):
+    # Un 0 dejaría una línea vacía y un negativo choca con la restricción de la tabla (IntegrityError)
+    if cantidad < 1:
+        raise ValueError(f'La cantidad debe ser al menos 1 (se recibió {cantidad})')
+
+
+class CarritoCompras:
+    """Carrito del request actual, guardado en las tablas Carrito/CarritoItem.
+
+    La sesión solo guarda el id del carrito; cada operación sobre un producto
+    es una única consulta indexada por (carrito, producto).
+    """
+
+    def __init__(self, request):
+        self.request = request
+        self._carrito_id = request.session.get(CLAVE_SESION)
+
+    @property
+    def carrito_id(self):
+        """Id del carrito, creándolo (o recuperando el del usuario) si aún no existe"""
+        if self._carrito_id is None:
+            usuario = self.request.user
+            if usuario.is_authenticated:
+                carrito, _ = Carrito.objects.get_or_create(usuario=usuario)
+            else:
+                carrito = Carrito.objects.create()
+            self._guardar_en_sesion(carrito.pk)
+        return self._carrito_id
+
+    def _guardar_en_sesion(self, carrito_id):
+        self._carrito_id = carrito_id
+        self.request.session[CLAVE_SESION] = carrito_id
+
+    def _items(self):
+        return CarritoItem.objects.filter(carrito_id=self.carrito_id)
+
+    def agregar(self, producto_id, cantidad=1):
+        """Suma `cantidad` unidades del producto al carrito"""
+        _validar_cantidad(cantidad)
+        if self._items().filter(producto_id=producto_id).update(cantidad=F('cantidad') + cantidad):
+            return
+        try:
+            with transaction.atomic():
+                CarritoItem.objects.create(carrito_id=self.carrito_id, producto_id=producto_id, cantidad=cantidad)
+        except IntegrityError:
+            # Otra petición creó la fila al mismo tiempo
+            self._items().filter(producto_id=producto_id).update(cantidad=F('cantidad') + cantidad)
+
+    def actualizar(self, producto_id, cantidad):
+        """Fija la cantidad de un producto (para quitarlo está `eliminar`)"""
+        _validar_cantidad(cantidad)
+        if not self._items().filter(producto_id=producto_id).update(cantidad=cantidad):
+            self.agregar(producto_id, cantidad)
+
+    def eliminar(self, producto_id):
+        if self._carrito_id is not None:
+            self._items().filter(producto_id=producto_id).delete()
+
+    def vaciar(self):
+        if self._carrito_id is not None:
+            self._items().delete()
+
+    def items(self):
+        """Lista de {'producto_id', 'cantidad'} en el orden en que se agregaron"""
+        if self._carrito_id is None:
+            return []
+        return list(self._items().order_by('id').values('producto_id', 'cantidad'))
+
+    def aplicar_cupon(self, codigo):
+        """Valida el código contra los cupones vigentes en memoria y lo guarda en la sesión"""
+        cupon = buscar_cupon(codigo)
+        self.request.session[CLAVE_SESION_CUPON] = cupon.codigo
+        return cupon
+
+    def quitar_cupon(self):
+        self.request.session.pop(CLAVE_SESION_CUPON, None)
+
+    def cupon(self):
+        """Cupón aplicado si sigue vigente; si venció se quita de la sesión"""
+        codigo = self.request.session.get(CLAVE_SESION_CUPON)
+        if not codigo:
+            return None
+        try:
+            return buscar_cupon(codigo)
+        except CuponInvalido:
+            self.quitar_cupon()
+            return None
+
+    def cotizar(self):
+        return cotizar_carrito(self.items(), self.cupon())
+
+
+class CotizacionCarrito:
+    """Líneas del carrito con precios vigentes y el total, calculados de una sola lectura"""
+
+    def __init__(self, lineas, cupon=None):
+        self.lineas = lineas
+        self.total = sum((linea['subtotal'] for linea in lineas), Decimal('0.00'))
+        self.item_count = sum(linea['cantidad'] for linea in lineas)
+        self.cupon = cupon
+        self.descuento = calcular_descuento(cupon, self.total)
+        self.total_a_pagar = self.total - self.descuento
+
+    def __iter__(self):
+        return iter(self.lineas)
+
+    def __len__(self):
+        return len(self.lineas)
+
+
+def cotizar_carrito(items, cupon=None):
+    """Carga todos los productos del carrito con un solo in_bulk y calcula subtotales en Decimal.
+
+    Los productos que ya no existen se omiten. Sirve para cualquier vista que
+    muestre el carrito (carrito, finalizar compra, mini carrito).
+    """
+    productos = Producto.objects.in_bulk([item['producto_id'] for item in items])
+    lineas = []
+    for item in items:
+        producto = productos.get(item['producto_id'])
+        if producto is None:
+            continue
+        lineas.append({
+            'producto': producto,
+            'cantidad': item['cantidad'],
+            'subtotal': producto.precio * item['cantidad'],
+        })
+    return CotizacionCarrito(lineas, cupon)
+
+
+def fusionar_carrito_anonimo(request, carrito_anonimo_id):
+    """Pasa los productos del carrito anónimo al carrito del usuario que acaba de iniciar sesión"""
+    carrito_usuario, _ = Carrito.objects.get_or_create(usuario=request.user)
+    request.session[CLAVE_SESION] = carrito_usuario.pk
+    if not carrito_anonimo_id or carrito_anonimo_id == carrito_usuario.pk:
+        return carrito_usuario
+
+    with transaction.atomic():
+        anonimos = {
+            item.producto_id: item
+            for item in CarritoItem.objects.filter(carrito_id=carrito_anonimo_id, carrito__usuario__isnull=True)
+        }
+        existentes = list(CarritoItem.objects.filter(carrito=carrito_usuario, producto_id__in=anonimos))
+        for item in existentes:
+            item.cantidad += anonimos.pop(item.producto_id).cantidad
+        CarritoItem.objects.bulk_update(existentes, ['cantidad'])
+        CarritoItem.objects.bulk_create([
+            CarritoItem(carrito=carrito_usuario, producto_id=producto_id, cantidad=item.cantidad)
+            for producto_id, item in anonimos.items()
+        ])
+        Carrito.objects.filter(pk=carrito_anonimo_id, usuario__isnull=True).delete()
+
+    return carrito_usuario
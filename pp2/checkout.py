@@ -0,0 +1,127 @@
+from collections import OrderedDict
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+
+from .analitica import registrar_pedido
+from .cola import encolar
+from .cupones import calcular_descuento, canjear_cupon
+from .models import DetallePedido, Pedido, Producto
+from .tareas import tareas_de_pedido
+
+
+class StockInsuficiente(Exception):
+    """Algún producto del carrito no tiene stock suficiente, no está disponible o ya no existe"""
+
+    def __init__(self, productos, inexistentes=()):
+        self.productos = productos
+        self.inexistentes = list(inexistentes)
+        partes = []
+        if productos:
+            partes.append("No hay stock suficiente para: " + ", ".join(producto.nombre for producto in productos))
+        if self.inexistentes:
+            partes.append("Ya no existen los productos con id: " + ", ".join(map(str, self.inexistentes)))
+        super().__init__("; ".join(partes) or "No hay stock suficiente para completar la compra")
+
+
+def _cantidades_por_producto(carrito):
+    """Agrupa las cantidades del carrito por producto_id"""
+    cantidades = OrderedDict()
+    for item in carrito:
+        producto_id = int(item['producto_id'])
+        cantidades[producto_id] = cantidades.get(producto_id, 0) + int(item['cantidad'])
+    return cantidades
+
+
+def _por_producto(cantidades):
+    """Expresión CASE que devuelve la cantidad pedida según el id del producto"""
+    return Case(
+        *[When(id=producto_id, then=Value(cantidad)) for producto_id, cantidad in cantidades.items()],
+        output_field=IntegerField(),
+    )
+
+
+def procesar_compra(usuario, direccion_envio, carrito, cupon=None):
+    """Crea el pedido y descuenta el stock en una única transacción.
+
+    Las consultas no dependen del tamaño del carrito:
+      - un SELECT FOR UPDATE de precios y categorías (bloquea las filas por id)
+      - un UPDATE condicional del stock de todos los productos
+      - un UPDATE condicional de los usos del cupón, si hay `cupon`
+      - un INSERT por tabla: dirección, pedido, detalles y tareas en segundo plano
+      - un upsert por tabla de resumen de ventas
+
+    Si falta stock o un producto ya no existe, se revierte todo y se lanza
+    StockInsuficiente; si el cupón ya no puede canjearse, CuponInvalido.
+    """
+    cantidades = _cantidades_por_producto(carrito)
+
+    try:
+        with transaction.atomic():
+            # Orden fijo por id para que pedidos concurrentes bloqueen en el mismo orden
+            precios, categorias = {}, {}
+            for producto_id, precio, categoria_id in (
+                Producto.objects.select_for_update()
+                .filter(id__in=cantidades, disponible=True)
+                .order_by('id')
+                .values_list('id', 'precio', 'categoria_id')
+            ):
+                precios[producto_id] = precio
+                categorias[producto_id] = categoria_id
+
+            actualizados = 0
+            if len(precios) == len(cantidades):
+                pedida = _por_producto(cantidades)
+                actualizados = Producto.objects.filter(
+                    id__in=cantidades, stock__gte=pedida
+                ).update(stock=F('stock') - pedida, actualizado=timezone.now())
+            if actualizados != len(cantidades):
+                # Revierte cualquier descuento parcial
+                raise StockInsuficiente([])
+
+            if cupon is not None:
+                canjear_cupon(cupon)
+
+            direccion_envio.usuario = usuario
+            direccion_envio.save()
+
+            total = sum(precios[producto_id] * cantidad for producto_id, cantidad in cantidades.items())
+            pedido = Pedido.objects.create(
+                usuario=usuario,
+                direccion_envio=direccion_envio,
+                estado='espera',
+                total=total,
+                item_count=sum(cantidades.values()),
+                cupon_id=cupon.id if cupon is not None else None,
+                descuento=calcular_descuento(cupon, total),
+            )
+
+            DetallePedido.objects.bulk_create([
+                DetallePedido(
+                    pedido=pedido,
+                    producto_id=producto_id,
+                    cantidad=cantidad,
+                    precio_unitario=precios[producto_id],
+                )
+                for producto_id, cantidad in cantidades.items()
+            ])
+
+            # Resúmenes de ventas con las líneas ya en memoria (sin releer los detalles)
+            registrar_pedido(pedido, [
+                (producto_id, categorias[producto_id], cantidad, precios[producto_id])
+                for producto_id, cantidad in cantidades.items()
+            ])
+
+            encolar(*tareas_de_pedido(pedido, cantidades))
+    except StockInsuficiente:
+        # Solo en el camino de error: identificar los productos que no alcanzan
+        existentes = list(Producto.objects.filter(id__in=cantidades).order_by('id'))
+        faltantes = [
+            producto for producto in existentes
+            if not producto.disponible or producto.stock < cantidades[producto.id]
+        ]
+        ids = {producto.id for producto in existentes}
+        raise StockInsuficiente(faltantes, [id_ for id_ in cantidades if id_ not in ids]) from None
+
+    return pedido
@@ -0,0 +1,126 @@
+"""Cola de tareas en segundo plano guardada en la tabla Tarea.
+
+Las tareas se encolan dentro de la transacción que las origina (solo existen si
+esta confirma) y las ejecuta `manage.py procesar_tareas`. La entrega es "al menos
+una vez": si un trabajador muere a mitad de una tarea, otra la retoma al vencer el
+bloqueo, así que las funciones de las tareas deben tolerar repetirse.
+"""
+import logging
+import random
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Tarea
+
+logger = logging.getLogger(__name__)
+
+_registro = {}
+
+
+class TareaDesconocida(Exception):
+    """No hay ninguna función registrada para el tipo de tarea"""
+
+    def __init__(self, tipo):
+        self.tipo = tipo
+        super().__init__(f"No hay ninguna tarea registrada como {tipo}")
+
+
+def tarea(tipo):
+    """Decorador: registra la función que ejecuta las tareas de `tipo` (recibe **datos)"""
+    def registrar(funcion):
+        _registro[tipo] = funcion
+        return funcion
+    return registrar
+
+
+def _segundos(nombre, defecto):
+    return getattr(settings, nombre, defecto)
+
+
+def espera_reintento(intentos):
+    """Espera exponencial tras el intento fallido número `intentos`, con un 10 % de azar"""
+    espera = min(_segundos('TAREAS_ESPERA_BASE', 30) * 2 ** (intentos - 1), _segundos('TAREAS_ESPERA_MAXIMA', 3600))
+    return timedelta(seconds=espera + random.uniform(0, espera / 10))
+
+
+def encolar(*tareas):
+    """Guarda las tareas (instancias de Tarea sin guardar) con un solo INSERT.
+
+    Las que traen una `clave` ya encolada se ignoran (ON CONFLICT DO NOTHING).
+    """
+    for nueva in tareas:
+        if nueva.tipo not in _registro:
+            raise TareaDesconocida(nueva.tipo)
+    Tarea.objects.bulk_create(tareas, ignore_conflicts=True)
+
+
+def tomar(cantidad=10):
+    """Reserva hasta `cantidad` tareas listas para este trabajador y las devuelve.
+
+    La reserva es un UPDATE condicional: si dos trabajadores eligen la misma
+    tarea, solo uno la actualiza. Funciona igual en SQLite y PostgreSQL. Una tarea
+    cuyo bloqueo venció sin intentos restantes queda fallida en vez de retomarse.
+    """
+    ahora = timezone.now()
+    # El trabajador murió en el último intento (ejecutar nunca registró el fallo): si se
+    # retomara, una tarea que tumba al trabajador se repetiría sin fin
+    Tarea.objects.filter(
+        estado='en_proceso', disponible_desde__lte=ahora, intentos__gte=F('max_intentos'),
+    ).update(estado='fallida', terminada=ahora, ultimo_error='El bloqueo venció sin que el trabajador terminara')
+    listas = Tarea.objects.filter(estado__in=('pendiente', 'en_proceso'), disponible_desde__lte=ahora)
+    ids = list(listas.order_by('disponible_desde', 'id').values_list('id', flat=True)[:cantidad])
+    if not ids:
+        return []
+
+    lote = uuid.uuid4().hex
+    listas.filter(id__in=ids).update(
+        estado='en_proceso', lote=lote, intentos=F('intentos') + 1,
+        disponible_desde=ahora + timedelta(seconds=_segundos('TAREAS_BLOQUEO', 300)),
+    )
+    return list(Tarea.objects.filter(lote=lote).order_by('id'))
+
+
+def ejecutar(tarea):
+    """Ejecuta una tarea tomada; devuelve True si terminó bien.
+
+    Si falla, vuelve a quedar pendiente con una espera creciente, o fallida al
+    agotar `max_intentos`.
+    """
+    try:
+        funcion = _registro.get(tarea.tipo)
+        if funcion is None:
+            raise TareaDesconocida(tarea.tipo)
+        funcion(**tarea.datos)
+    except Exception:
+        agotada = tarea.intentos >= tarea.max_intentos
+        logger.warning('Falló la tarea %s (intento %s de %s)', tarea, tarea.intentos, tarea.max_intentos,
+                       exc_info=True)
+        # Condicionado al lote: si el bloqueo venció y otro trabajador la tomó, no se pisa
+        Tarea.objects.filter(pk=tarea.pk, lote=tarea.lote).update(
+            estado='fallida' if agotada else 'pendiente',
+            disponible_desde=timezone.now() + espera_reintento(tarea.intentos),
+            ultimo_error=traceback.format_exc(),
+            terminada=timezone.now() if agotada else None,
+        )
+        return False
+
+    Tarea.objects.filter(pk=tarea.pk, lote=tarea.lote).update(
+        estado='completada', terminada=timezone.now(), ultimo_error='',
+    )
+    return True
+
+
+def procesar(cantidad=10):
+    """Toma y ejecuta un lote de tareas; devuelve (completadas, con error)"""
+    completadas = errores = 0
+    for tomada in tomar(cantidad):
+        if ejecutar(tomada):
+            completadas += 1
+        else:
+            errores += 1
+    return completadas, errores
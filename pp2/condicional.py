@@ -0,0 +1,125 @@
+"""GET condicional (ETag/Last-Modified) y Cache-Control para las vistas del catálogo.
+
+Los validadores salen de una sola consulta de agregados sobre `actualizado`, así
+que una respuesta 304 no carga la página del catálogo ni renderiza la plantilla.
+"""
+import asyncio
+import hashlib
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Count, Max, Subquery
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from .models import Categoria, Producto
+
+METODOS_SEGUROS = ('GET', 'HEAD')
+
+
+def _max_age():
+    return getattr(settings, 'CATALOGO_CACHE_CONTROL_MAX_AGE', 60)
+
+
+def _personal(request):
+    """La respuesta depende de quién pide: sesión iniciada, cookie de sesión o token CSRF.
+
+    En un 304 la vista no se ejecuta y CSRF_COOKIE_USED no llega a marcarse:
+    por eso también cuentan las cookies que trae la petición.
+    """
+    return bool(
+        request.user.is_authenticated
+        or settings.SESSION_COOKIE_NAME in request.COOKIES
+        or settings.CSRF_COOKIE_NAME in request.COOKIES
+        or request.META.get('CSRF_COOKIE_USED')
+    )
+
+
+def _etag(request, *partes):
+    # La página cambia con la URL y con el usuario (barra de navegación, botones del carrito)
+    partes += (request.get_full_path(), request.user.pk)
+    if _personal(request):
+        # Otra sesión o un token CSRF rotado no pueden reutilizar la copia anterior
+        partes += (request.COOKIES.get(settings.SESSION_COOKIE_NAME), request.COOKIES.get(settings.CSRF_COOKIE_NAME))
+    return quote_etag(hashlib.md5(repr(partes).encode('utf-8')).hexdigest())
+
+
+def validadores_catalogo(request):
+    """(etag, última modificación) del listado de productos.
+
+    Se usa el catálogo completo y no solo la página: cualquier alta, baja o cambio
+    de un producto o su categoría cambia el ETag de todas las páginas.
+    """
+    # Sin JOIN: MAX y COUNT sobre los productos salen del índice de `actualizado`
+    ultima_categoria = Categoria.objects.order_by('-actualizado').values('actualizado')[:1]
+    datos = Producto.objects.aggregate(
+        productos=Max('actualizado'), total=Count('id'), categorias=Max(Subquery(ultima_categoria)),
+    )
+    ultima = max(filter(None, (datos['productos'], datos['categorias'])), default=None)
+    return _etag(request, datos['productos'], datos['categorias'], datos['total']), ultima
+
+
+def validadores_producto(request, producto_id):
+    """(etag, última modificación) de la ficha de un producto; (None, None) si no existe"""
+    fila = Producto.objects.filter(pk=producto_id).values_list('actualizado', 'categoria__actualizado').first()
+    if fila is None:
+        return None, None
+    return _etag(request, *fila), max(fila)
+
+
+def _validar(validadores, request, *args, **kwargs):
+    """Calcula los validadores; devuelve también la respuesta 304/412 si corresponde"""
+    etag, ultima = validadores(request, *args, **kwargs)
+    # La fecha es la del catálogo: no refleja cambios del usuario o de su carrito, así
+    # que solo valida (y se envía) en peticiones anónimas; las demás dependen del ETag
+    ultima = int(ultima.timestamp()) if ultima and not _personal(request) else None
+    return etag, ultima, get_conditional_response(request, etag=etag, last_modified=ultima)
+
+
+def _cabeceras(request, respuesta, etag, ultima):
+    if respuesta.status_code not in (200, 304):
+        return respuesta
+    if etag and not respuesta.has_header('ETag'):
+        respuesta['ETag'] = etag
+    # Con o sin cookies la página es otra: un cache compartido debe distinguirlas
+    patch_vary_headers(respuesta, ('Cookie',))
+    # Solo las páginas anónimas sin token CSRF pueden guardarse en un cache compartido
+    if _personal(request):
+        patch_cache_control(respuesta, private=True, no_cache=True)
+    else:
+        if ultima and not respuesta.has_header('Last-Modified'):
+            respuesta['Last-Modified'] = http_date(ultima)
+        patch_cache_control(respuesta, public=True, max_age=_max_age())
+    return respuesta
+
+
+def condicional(validadores):
+    """Decorador: responde 304 sin ejecutar la vista si el cliente ya tiene la versión actual.
+
+    `validadores(request, *args, **kwargs)` devuelve (etag, datetime). Como
+    lectura_en_replica, acepta también vistas async.
+    """
+    def decorador(vista):
+        if asyncio.iscoroutinefunction(vista):
+            @wraps(vista)
+            async def envoltura_async(request, *args, **kwargs):
+                if request.method not in METODOS_SEGUROS:
+                    return await vista(request, *args, **kwargs)
+                etag, ultima, respuesta = await sync_to_async(_validar)(validadores, request, *args, **kwargs)
+                if respuesta is None:
+                    respuesta = await vista(request, *args, **kwargs)
+                # request.user ya se cargó al calcular el ETag: no hace falta otro salto
+                return _cabeceras(request, respuesta, etag, ultima)
+            return envoltura_async
+
+        @wraps(vista)
+        def envoltura(request, *args, **kwargs):
+            if request.method not in METODOS_SEGUROS:
+                return vista(request, *args, **kwargs)
+            etag, ultima, respuesta = _validar(validadores, request, *args, **kwargs)
+            if respuesta is None:
+                respuesta = vista(request, *args, **kwargs)
+            return _cabeceras(request, respuesta, etag, ultima)
+        return envoltura
+    return decorador
@@ -0,0 +1,114 @@
+import threading
+import time
+from collections import namedtuple
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Cupon
+
+CLAVE_VERSION = 'cupones:version'
+CENTIMO = Decimal('0.01')
+
+# Copia inmutable de un cupón vigente; es lo único que se consulta al validar
+CuponVigente = namedtuple('CuponVigente', 'id codigo descuento max_usos')
+
+_lock = threading.Lock()
+_estado = {'fecha': None, 'version': None, 'cargado': 0, 'cupones': {}}
+
+
+class CuponInvalido(Exception):
+    """Se lanza cuando el código no existe, no está vigente o ya se agotó"""
+
+    def __init__(self, codigo, motivo='no es válido'):
+        self.codigo = codigo
+        super().__init__(f"El cupón {codigo} {motivo}")
+
+
+normalizar_codigo = Cupon.normalizar_codigo
+
+
+def _version():
+    # Vive en el cache de Django: solo se comparte entre procesos si el backend es compartido
+    # (Redis/Memcached, ver DJANGO_CACHE_URL); con LocMem invalida únicamente este proceso
+    version = cache.get(CLAVE_VERSION)
+    if version is None:
+        cache.add(CLAVE_VERSION, 1, timeout=None)
+        version = cache.get(CLAVE_VERSION, 1)
+    return version
+
+
+def invalidar_cupones():
+    """Fuerza la recarga de los cupones vigentes (en todos los procesos si el cache es compartido)"""
+    try:
+        cache.incr(CLAVE_VERSION)
+    except ValueError:
+        cache.add(CLAVE_VERSION, 1, timeout=None)
+    with _lock:
+        _estado['version'] = None
+
+
+def cupones_vigentes():
+    """Cupones vigentes hoy por código normalizado.
+
+    Se cargan con una sola consulta y se mantienen en memoria del proceso hasta
+    que cambia la fecha, se guarda/elimina un cupón o pasan CUPONES_RECARGA_SEGUNDOS.
+    Ese plazo acota cuánto tarda otro proceso en enterarse si el cache no es compartido.
+    """
+    hoy = timezone.localdate()
+    version = _version()
+    ahora = time.monotonic()
+    with _lock:
+        if (_estado['fecha'] == hoy and _estado['version'] == version
+                and ahora - _estado['cargado'] < getattr(settings, 'CUPONES_RECARGA_SEGUNDOS', 60)):
+            return _estado['cupones']
+
+    cupones = {
+        normalizar_codigo(cupon.codigo): CuponVigente(cupon.id, cupon.codigo, cupon.descuento, cupon.max_usos)
+        for cupon in Cupon.objects.filter(valido_desde__lte=hoy, valido_hasta__gte=hoy)
+        if cupon.max_usos is None or cupon.usos < cupon.max_usos
+    }
+    with _lock:
+        _estado.update(fecha=hoy, version=version, cargado=ahora, cupones=cupones)
+    return cupones
+
+
+def buscar_cupon(codigo):
+    """Cupón vigente para el código, o CuponInvalido; no consulta la base si el cache está cargado"""
+    cupon = cupones_vigentes().get(normalizar_codigo(codigo))
+    if cupon is None:
+        raise CuponInvalido(normalizar_codigo(codigo))
+    return cupon
+
+
+def calcular_descuento(cupon, total):
+    """Monto a descontar de `total` según el porcentaje del cupón"""
+    if cupon is None:
+        return Decimal('0.00')
+    descuento = (total * cupon.descuento / 100).quantize(CENTIMO, rounding=ROUND_HALF_UP)
+    return min(descuento, total)
+
+
+def canjear_cupon(cupon):
+    """Suma un uso al cupón con un UPDATE condicional.
+
+    Debe llamarse dentro de la transacción del pedido: si el cupón venció o
+    alcanzó `max_usos` entre la validación y el canje, lanza CuponInvalido.
+    Si este canje lo agota, los procesos dejan de ofrecerlo al confirmar el pedido.
+    """
+    hoy = timezone.localdate()
+    canjeado = Cupon.objects.filter(
+        Q(max_usos__isnull=True) | Q(usos__lt=F('max_usos')),
+        pk=cupon.id, valido_desde__lte=hoy, valido_hasta__gte=hoy,
+    ).update(usos=F('usos') + 1)
+    if not canjeado:
+        # Deja de ofrecerlo hasta la próxima recarga
+        invalidar_cupones()
+        raise CuponInvalido(cupon.codigo, 'ya no está disponible')
+    # UPDATE no dispara post_save: se invalida aquí (una consulta más solo con max_usos)
+    if cupon.max_usos is not None and Cupon.objects.filter(pk=cupon.id, usos__gte=F('max_usos')).exists():
+        transaction.on_commit(invalidar_cupones)
@@ -0,0 +1,144 @@
+import csv
+import json
+from datetime import datetime, time, timedelta
+
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from .models import DetallePedido, Pedido
+
+COLUMNAS_CSV = [
+    'pedido_id', 'fecha_pedido', 'estado', 'usuario', 'total', 'descuento', 'item_count',
+    'nombres', 'apellidos', 'celular', 'dni', 'direccion', 'ciudad', 'distrito', 'pais', 'correo',
+    'producto_id', 'producto', 'cantidad', 'precio_unitario', 'subtotal',
+]
+CAMPOS_DIRECCION = ['nombres', 'apellidos', 'celular', 'dni', 'direccion', 'ciudad', 'distrito', 'pais', 'correo']
+FORMATOS = ('csv', 'jsonl')
+
+
+class _Eco:
+    """Pseudo-archivo para csv.writer: devuelve la línea en lugar de guardarla"""
+
+    def write(self, valor):
+        return valor
+
+
+class ProgresoExportacion:
+    """Id del último pedido cuyas filas ya se entregaron, para reanudar con `despues_de`"""
+
+    def __init__(self):
+        self.ultimo_id = None
+
+
+def _inicio_del_dia(fecha):
+    return timezone.make_aware(datetime.combine(fecha, time.min))
+
+
+def filtrar_pedidos(desde=None, hasta=None, estado=None, despues_de=None, queryset=None):
+    """Pedidos a exportar ordenados por id; `despues_de` permite reanudar una exportación"""
+    pedidos = Pedido.objects.all() if queryset is None else queryset
+    if desde:
+        pedidos = pedidos.filter(fecha_pedido__gte=_inicio_del_dia(desde))
+    if hasta:
+        # Rango semiabierto para que el índice sobre fecha_pedido siga sirviendo
+        pedidos = pedidos.filter(fecha_pedido__lt=_inicio_del_dia(hasta + timedelta(days=1)))
+    if estado:
+        pedidos = pedidos.filter(estado=estado)
+    if despues_de:
+        pedidos = pedidos.filter(id__gt=despues_de)
+    return pedidos.order_by('id')
+
+
+def iterar_pedidos(pedidos, chunk_size=500):
+    """Genera (pedido, detalles) leyendo los pedidos con .iterator() y los detalles por tandas.
+
+    En memoria solo hay una tanda a la vez, sin importar el tamaño de la exportación.
+    """
+    pedidos = pedidos.select_related('usuario', 'direccion_envio').iterator(chunk_size=chunk_size)
+    tanda = []
+    for pedido in pedidos:
+        tanda.append(pedido)
+        if len(tanda) >= chunk_size:
+            yield from _con_detalles(tanda)
+            tanda = []
+    if tanda:
+        yield from _con_detalles(tanda)
+
+
+def _con_detalles(pedidos):
+    detalles = {}
+    for detalle in DetallePedido.objects.filter(pedido_id__in=[p.pk for p in pedidos]).select_related(
+        'producto'
+    ).only('id', 'pedido_id', 'cantidad', 'precio_unitario', 'producto__id', 'producto__nombre').order_by('id'):
+        detalles.setdefault(detalle.pedido_id, []).append(detalle)
+    for pedido in pedidos:
+        yield pedido, detalles.get(pedido.pk, [])
+
+
+def _datos_pedido(pedido):
+    return {
+        'pedido_id': pedido.pk,
+        'fecha_pedido': pedido.fecha_pedido.isoformat(),
+        'estado': pedido.estado,
+        'usuario': pedido.usuario.username,
+        'total': str(pedido.total),
+        'descuento': str(pedido.descuento),
+        'item_count': pedido.item_count,
+    }
+
+
+def _datos_direccion(direccion):
+    if direccion is None:
+        return None
+    return {campo: getattr(direccion, campo) or '' for campo in CAMPOS_DIRECCION}
+
+
+def _datos_detalle(detalle):
+    return {
+        'producto_id': detalle.producto_id,
+        'producto': detalle.producto.nombre,
+        'cantidad': detalle.cantidad,
+        'precio_unitario': str(detalle.precio_unitario),
+        'subtotal': str(detalle.subtotal),
+    }
+
+
+def filas_csv(pedidos, chunk_size=500, progreso=None):
+    """Líneas CSV: cabecera y una fila por detalle (o una fila vacía si el pedido no tiene detalles)"""
+    escritor = csv.writer(_Eco())
+    yield escritor.writerow(COLUMNAS_CSV)
+    for pedido, detalles in iterar_pedidos(pedidos, chunk_size):
+        base = _datos_pedido(pedido)
+        base.update(_datos_direccion(pedido.direccion_envio) or {})
+        for detalle in detalles or [None]:
+            fila = dict(base, **(_datos_detalle(detalle) if detalle else {}))
+            yield escritor.writerow([fila.get(columna, '') for columna in COLUMNAS_CSV])
+        # Se llega aquí cuando quien consume ya pidió la fila siguiente: escribió todas las de este pedido
+        if progreso is not None:
+            progreso.ultimo_id = pedido.pk
+
+
+def filas_jsonl(pedidos, chunk_size=500, progreso=None):
+    """Un objeto JSON por pedido y por línea, con su dirección y sus detalles"""
+    for pedido, detalles in iterar_pedidos(pedidos, chunk_size):
+        datos = _datos_pedido(pedido)
+        datos['direccion_envio'] = _datos_direccion(pedido.direccion_envio)
+        datos['detalles'] = [_datos_detalle(detalle) for detalle in detalles]
+        yield json.dumps(datos, ensure_ascii=False, separators=(',', ':')) + '\n'
+        if progreso is not None:
+            progreso.ultimo_id = pedido.pk
+
+
+def exportar(pedidos, formato='csv', chunk_size=500, progreso=None):
+    """Genera la exportación; si se pasa un ProgresoExportacion, lleva el último pedido entregado"""
+    if formato == 'jsonl':
+        return filas_jsonl(pedidos, chunk_size, progreso)
+    return filas_csv(pedidos, chunk_size, progreso)
+
+
+def respuesta_exportacion(pedidos, formato='csv', chunk_size=500):
+    """StreamingHttpResponse con la exportación; el contenido se genera mientras se envía"""
+    tipo = 'application/x-ndjson' if formato == 'jsonl' else 'text/csv'
+    response = StreamingHttpResponse(exportar(pedidos, formato, chunk_size), content_type=f'{tipo}; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="pedidos.{formato}"'
+    return response
@@ -0,0 +1,117 @@
+import hashlib
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.utils import timezone
+
+from .models import Producto
+
+ANCHOS = (160, 320, 640)
+FORMATOS = {
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+CARPETA = 'productos/derivadas'
+
+
+def _anchos():
+    return tuple(getattr(settings, 'IMAGENES_ANCHOS', ANCHOS))
+
+
+def _formatos():
+    return tuple(getattr(settings, 'IMAGENES_FORMATOS', tuple(FORMATOS)))
+
+
+def _leer_original(imagen):
+    imagen.open('rb')
+    try:
+        return imagen.read()
+    finally:
+        imagen.close()
+
+
+def generar_derivadas(producto, contenido=None):
+    """Genera las miniaturas de la imagen del producto y devuelve su descripción.
+
+    Los nombres incluyen un hash del contenido original, así que reprocesar la
+    misma imagen reutiliza los archivos existentes y una imagen nueva nunca
+    queda oculta por la caché del navegador.
+    """
+    from PIL import Image
+
+    if contenido is None:
+        contenido = _leer_original(producto.imagen)
+    resumen = hashlib.sha256(contenido).hexdigest()[:12]
+    base = os.path.splitext(os.path.basename(producto.imagen.name))[0]
+    storage = producto.imagen.storage
+
+    with Image.open(BytesIO(contenido)) as original:
+        original.load()
+        ancho_original, alto_original = original.size
+        tiene_alfa = original.mode in ('RGBA', 'LA') or 'transparency' in original.info
+        # No se amplían imágenes: el ancho máximo es el del original
+        anchos = sorted({min(ancho, ancho_original) for ancho in _anchos()})
+
+        derivadas = []
+        for ancho in anchos:
+            alto = max(1, round(alto_original * ancho / ancho_original))
+            redimensionada = original.convert('RGBA' if tiene_alfa else 'RGB').resize(
+                (ancho, alto), Image.LANCZOS
+            )
+            for formato in _formatos():
+                formato_pil, extension, opciones = FORMATOS[formato]
+                nombre = f'{CARPETA}/{base}-{resumen}-{ancho}w.{extension}'
+                if not storage.exists(nombre):
+                    imagen = redimensionada
+                    if formato_pil == 'JPEG' and imagen.mode != 'RGB':
+                        imagen = imagen.convert('RGB')
+                    salida = BytesIO()
+                    imagen.save(salida, formato_pil, **opciones)
+                    storage.save(nombre, ContentFile(salida.getvalue()))
+                derivadas.append({
+                    'nombre': nombre,
+                    'ancho': ancho,
+                    'alto': alto,
+                    'formato': formato,
+                    'hash': resumen,
+                    'original': producto.imagen.name,
+                })
+    return derivadas
+
+
+def actualizar_derivadas(producto, forzar=False):
+    """Regenera las miniaturas si la imagen cambió; devuelve True si hubo cambios.
+
+    Sin `forzar`, basta comparar el nombre del archivo original para saber si
+    hay trabajo pendiente, de modo que guardar un producto (por ejemplo desde
+    list_editable) no vuelve a leer la imagen.
+    """
+    if not producto.imagen:
+        derivadas = []
+    elif not forzar and producto.derivadas and all(
+        derivada.get('original') == producto.imagen.name for derivada in producto.derivadas
+    ):
+        return False
+    else:
+        derivadas = generar_derivadas(producto)
+
+    if derivadas == producto.derivadas:
+        return False
+    producto.derivadas = derivadas
+    producto.actualizado = timezone.now()
+    # update() para no volver a disparar post_save
+    Producto.objects.filter(pk=producto.pk).update(derivadas=derivadas, actualizado=producto.actualizado)
+    return True
+
+
+def pendientes():
+    """Productos con imagen cuyas miniaturas faltan o no corresponden al original"""
+    for producto in Producto.objects.exclude(imagen='').exclude(imagen__isnull=True).only(
+        'id', 'imagen', 'derivadas'
+    ).order_by('id').iterator(chunk_size=100):
+        if not producto.derivadas or any(
+            derivada.get('original') != producto.imagen.name for derivada in producto.derivadas
+        ):
+            yield producto
@@ -0,0 +1,241 @@
+import csv
+import json
+import os
+from decimal import Decimal, InvalidOperation
+
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+
+from .busqueda import indexar_productos
+from .cache_catalogo import invalidar_catalogo
+from .imagenes import actualizar_derivadas
+from .models import Categoria, Producto
+
+CAMPOS_PRODUCTO = ('descripcion', 'precio', 'stock', 'disponible', 'categoria_id')
+VERDADEROS = {'1', 'true', 'si', 'sí', 'yes', 'y', 'x'}
+
+
+class FilaInvalida(ValueError):
+    """Una fila del archivo de importación no se puede interpretar"""
+
+
+def leer_filas(ruta, formato=None):
+    """Genera (número de línea, dict) desde un CSV con cabecera o un archivo JSON Lines"""
+    formato = formato or ('jsonl' if ruta.endswith(('.jsonl', '.ndjson')) else 'csv')
+    with open(ruta, newline='', encoding='utf-8-sig') as archivo:
+        if formato == 'jsonl':
+            for numero, linea in enumerate(archivo, start=1):
+                if linea.strip():
+                    try:
+                        yield numero, json.loads(linea)
+                    except json.JSONDecodeError as error:
+                        yield numero, FilaInvalida(str(error))
+        else:
+            for numero, fila in enumerate(csv.DictReader(archivo), start=2):
+                yield numero, fila
+
+
+def _limpiar(fila):
+    """Normaliza una fila: solo se devuelven los campos presentes (una actualización puede ser parcial)"""
+    if isinstance(fila, Exception):
+        raise fila
+    datos = {}
+    nombre = str(fila.get('nombre') or '').strip()
+    if not nombre:
+        raise FilaInvalida('falta el nombre')
+    datos['nombre'] = nombre
+    if fila.get('categoria') not in (None, ''):
+        datos['categoria'] = str(fila['categoria']).strip()
+    if fila.get('descripcion') is not None:
+        datos['descripcion'] = str(fila['descripcion'])
+    try:
+        if fila.get('precio') not in (None, ''):
+            datos['precio'] = Decimal(str(fila['precio'])).quantize(Decimal('0.01'))
+        if fila.get('stock') not in (None, ''):
+            datos['stock'] = int(fila['stock'])
+    except (InvalidOperation, ValueError) as error:
+        raise FilaInvalida(f'valor numérico inválido: {error}')
+    if fila.get('disponible') not in (None, ''):
+        valor = fila['disponible']
+        datos['disponible'] = valor if isinstance(valor, bool) else str(valor).strip().lower() in VERDADEROS
+    if fila.get('imagen'):
+        datos['imagen'] = os.path.basename(str(fila['imagen']).strip())
+    return datos
+
+
+class ImportadorCatalogo:
+    """Upsert por lotes de Categoria y Producto usando el nombre como clave natural.
+
+    Cada lote usa un número fijo de consultas: una lectura de categorías y de
+    productos existentes, un bulk_create y un bulk_update. Con `simular` se
+    calcula el diff y se revierte la transacción. El nombre no es único en la
+    base: si varios productos (o categorías) comparten el de una fila, no se
+    adivina cuál actualizar y la fila se informa como error.
+    """
+
+    def __init__(self, directorio_imagenes=None, simular=False, tamano_lote=1000, informar=None):
+        self.directorio_imagenes = directorio_imagenes
+        self.simular = simular
+        self.tamano_lote = tamano_lote
+        self.informar = informar or (lambda mensaje: None)
+        self.categorias = {}
+        self.categorias_repetidas = set()
+        self.creados = self.actualizados = self.sin_cambios = 0
+        self.errores = []
+
+    def importar(self, filas):
+        lote = []
+        for numero, fila in filas:
+            try:
+                lote.append((numero, _limpiar(fila)))
+            except FilaInvalida as error:
+                self.errores.append((numero, str(error)))
+                continue
+            if len(lote) >= self.tamano_lote:
+                self._procesar_lote(lote)
+                lote = []
+        if lote:
+            self._procesar_lote(lote)
+        if not self.simular and (self.creados or self.actualizados):
+            transaction.on_commit(invalidar_catalogo)
+        return self
+
+    def _categorias(self, nombres):
+        faltantes = set(nombres) - set(self.categorias)
+        if not faltantes:
+            return
+        for categoria in Categoria.objects.filter(nombre__in=faltantes):
+            if categoria.nombre in self.categorias:
+                self.categorias_repetidas.add(categoria.nombre)
+            self.categorias[categoria.nombre] = categoria.pk
+        nuevas = [Categoria(nombre=nombre) for nombre in faltantes if nombre not in self.categorias]
+        if nuevas:
+            for categoria in nuevas:
+                self.informar(f'+ categoría {categoria.nombre}')
+            Categoria.objects.bulk_create(nuevas)
+            # bulk_create no devuelve ids en todos los motores: se vuelven a leer
+            for categoria in Categoria.objects.filter(nombre__in=[c.nombre for c in nuevas]):
+                self.categorias[categoria.nombre] = categoria.pk
+
+    def _procesar_lote(self, lote):
+        try:
+            with transaction.atomic():
+                self._aplicar_lote(lote)
+                if self.simular:
+                    raise _Simulacion()
+        except _Simulacion:
+            pass
+
+    def _aplicar_lote(self, lote):
+        # La última fila gana si un nombre aparece repetido en el lote
+        por_nombre = {}
+        for numero, datos in lote:
+            por_nombre.setdefault(datos['nombre'], {'numero': numero}).update(datos)
+
+        self._categorias({datos['categoria'] for datos in por_nombre.values() if 'categoria' in datos})
+        existentes, repetidos = {}, set()
+        for producto in Producto.objects.filter(nombre__in=por_nombre):
+            if producto.nombre in existentes:
+                repetidos.add(producto.nombre)
+            existentes[producto.nombre] = producto
+
+        nuevos, modificados, campos, reindexar, con_imagen = [], [], set(), [], []
+        for nombre, datos in por_nombre.items():
+            if nombre in repetidos:
+                self.errores.append((datos['numero'], f'hay varios productos llamados "{nombre}"'))
+                continue
+            if datos.get('categoria') in self.categorias_repetidas:
+                self.errores.append((datos['numero'], f'hay varias categorías llamadas "{datos["categoria"]}"'))
+                continue
+            if 'categoria' in datos:
+                datos['categoria_id'] = self.categorias[datos.pop('categoria')]
+            producto = existentes.get(nombre)
+
+            if producto is None:
+                if 'precio' not in datos or 'categoria_id' not in datos:
+                    self.errores.append((datos['numero'], 'un producto nuevo necesita precio y categoría'))
+                    continue
+                producto = Producto(
+                    nombre=nombre,
+                    descripcion=datos.get('descripcion', ''),
+                    precio=datos['precio'],
+                    stock=datos.get('stock', 0),
+                    disponible=datos.get('disponible', True),
+                    categoria_id=datos['categoria_id'],
+                )
+                self._adjuntar_imagen(producto, datos.get('imagen'), datos['numero'])
+                self.informar(f'+ {nombre} (S/{producto.precio}, stock {producto.stock})')
+                nuevos.append(producto)
+                continue
+
+            cambios = []
+            for campo in CAMPOS_PRODUCTO:
+                if campo in datos and getattr(producto, campo) != datos[campo]:
+                    cambios.append(f'{campo} {getattr(producto, campo)} -> {datos[campo]}')
+                    setattr(producto, campo, datos[campo])
+                    campos.add(campo)
+            if self._adjuntar_imagen(producto, datos.get('imagen'), datos['numero']):
+                cambios.append(f'imagen -> {producto.imagen.name}')
+                campos.add('imagen')
+                con_imagen.append(producto)
+            if not cambios:
+                self.sin_cambios += 1
+                continue
+            self.informar(f'~ {nombre}: ' + ', '.join(cambios))
+            modificados.append(producto)
+            if 'descripcion' in datos:
+                reindexar.append(producto)
+
+        if self.simular:
+            self.creados += len(nuevos)
+            self.actualizados += len(modificados)
+            return
+
+        if nuevos:
+            Producto.objects.bulk_create(nuevos, batch_size=self.tamano_lote)
+            # Ids de los productos creados para el índice de búsqueda y las miniaturas
+            creados = list(Producto.objects.filter(nombre__in=[p.nombre for p in nuevos]).exclude(
+                pk__in=[p.pk for p in existentes.values()]))
+            reindexar.extend(creados)
+            con_imagen.extend(producto for producto in creados if producto.imagen)
+        if modificados:
+            # bulk_update no aplica auto_now
+            ahora = timezone.now()
+            for producto in modificados:
+                producto.actualizado = ahora
+            Producto.objects.bulk_update(modificados, sorted(campos | {'actualizado'}), batch_size=self.tamano_lote)
+
+        # bulk_create/bulk_update no disparan señales: índice y miniaturas se actualizan aquí
+        indexar_productos(reindexar)
+        for producto in con_imagen:
+            actualizar_derivadas(producto)
+
+        self.creados += len(nuevos)
+        self.actualizados += len(modificados)
+
+    def _adjuntar_imagen(self, producto, archivo, numero):
+        """Copia la imagen desde el directorio local si es distinta de la actual"""
+        if not archivo or not self.directorio_imagenes:
+            return False
+        ruta = os.path.join(self.directorio_imagenes, archivo)
+        if not os.path.isfile(ruta):
+            self.errores.append((numero, f'no existe la imagen {ruta}'))
+            return False
+        destino = producto.imagen.field.generate_filename(producto, archivo)
+        if producto.imagen and producto.imagen.name == destino:
+            return False
+        if self.simular:
+            producto.imagen.name = destino
+            return True
+        if producto.imagen.storage.exists(destino):
+            # Ya está en el almacenamiento (por ejemplo, el directorio productos/ del proyecto)
+            producto.imagen.name = destino
+        else:
+            with open(ruta, 'rb') as contenido:
+                producto.imagen.save(archivo, File(contenido), save=False)
+        return True
+
+
+class _Simulacion(Exception):
+    """Revierte la transacción de un lote en modo simulación"""
@@ -0,0 +1,46 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from pp2 import benchmark
+from pp2.models import Producto
+
+
+class Command(BaseCommand):
+    help = ('Compara el throughput de las vistas de lectura (inicio, productos, detalle_producto, '
+            'ver_carrito) servidas con WSGI (pool de hilos) y con ASGI (pp1/asgi.py) ante clientes lentos')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--conexiones', type=int, default=100, help='Clientes concurrentes')
+        parser.add_argument('--peticiones', type=int, default=1000)
+        parser.add_argument('--hilos', type=int, default=8, help='Workers del servidor WSGI')
+        parser.add_argument('--latencia-cliente', type=float, default=20,
+                            help='Milisegundos que tarda cada cliente en recibir la respuesta')
+        parser.add_argument('--productos', type=int, default=200)
+
+    def handle(self, *args, **options):
+        if options['conexiones'] < 1 or options['peticiones'] < 1 or options['hilos'] < 1:
+            raise CommandError('--conexiones, --peticiones y --hilos deben ser positivos')
+        latencia = options['latencia_cliente'] / 1000
+
+        with benchmark.base_temporal():
+            usuarios = benchmark.sembrar_datos(productos=options['productos'], usuarios=1, pedidos=10)
+            productos = list(Producto.objects.filter(disponible=True).values_list('id', flat=True))
+            urls = benchmark.urls_lectura(productos)
+            cookie = benchmark.cookie_de_sesion(usuarios[0])
+
+            self.stdout.write(f"Vistas {'async' if settings.VISTAS_ASYNC else 'sync'} (VISTAS_ASYNC), "
+                              f"{options['conexiones']} conexiones, {options['peticiones']} peticiones, "
+                              f"cliente de {options['latencia_cliente']} ms")
+            resultados = {
+                f"WSGI ({options['hilos']} hilos)": benchmark.medir_wsgi(
+                    urls, cookie, options['conexiones'], options['peticiones'], options['hilos'], latencia),
+                'ASGI': benchmark.medir_asgi(
+                    urls, cookie, options['conexiones'], options['peticiones'], latencia),
+            }
+
+        self.stdout.write(f"{'servidor':<18}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'err':>6}")
+        for servidor, datos in resultados.items():
+            self.stdout.write(
+                f"{servidor:<18}{datos['peticiones_por_segundo']:>10}{datos['p50_ms']:>10}"
+                f"{datos['p95_ms']:>10}{datos['p99_ms']:>10}{datos['errores']:>6}"
+            )
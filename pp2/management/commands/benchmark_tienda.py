@@ -0,0 +1,73 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pp2 import benchmark
+
+
+class Command(BaseCommand):
+    help = ('Siembra datos sintéticos en una base SQLite temporal, recorre la tienda con clientes '
+            'concurrentes y reporta throughput, percentiles de latencia y consultas por petición')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--productos', type=int, default=500)
+        parser.add_argument('--usuarios', type=int, default=50)
+        parser.add_argument('--pedidos', type=int, default=2000)
+        parser.add_argument('--concurrencia', type=int, default=8)
+        parser.add_argument('--iteraciones', type=int, default=2, help='Recorridos por usuario')
+        parser.add_argument('--semilla', type=int, default=1)
+        parser.add_argument('--guardar', metavar='ARCHIVO', help='Guarda el resultado como línea base (JSON)')
+        parser.add_argument('--comparar', metavar='ARCHIVO', help='Falla si hay regresiones frente a esta línea base')
+        parser.add_argument('--umbral', type=float, default=0.25,
+                            help='Empeoramiento tolerado en latencia p95 y throughput (0.25 = 25%%)')
+
+    def handle(self, *args, **options):
+        if options['usuarios'] < 1 or options['productos'] < 2:
+            raise CommandError('Se necesitan al menos 1 usuario y 2 productos')
+        base = None
+        if options['comparar']:
+            try:
+                base = benchmark.cargar(options['comparar'])
+            except (OSError, ValueError) as error:
+                raise CommandError(f'No se pudo leer la línea base: {error}')
+
+        configuracion = {clave: options[clave] for clave in
+                         ('productos', 'usuarios', 'pedidos', 'concurrencia', 'iteraciones', 'semilla')}
+        resultado = self._medir(configuracion)
+        self._mostrar(resultado)
+
+        if options['guardar']:
+            benchmark.guardar(resultado, options['guardar'], configuracion)
+            self.stdout.write(f"Línea base guardada en {options['guardar']}")
+
+        if base is not None:
+            if base['configuracion'] != configuracion:
+                self.stderr.write('Aviso: la configuración difiere de la línea base: '
+                                  + json.dumps(base['configuracion']))
+            regresiones = benchmark.comparar(base['reporte'], resultado, options['umbral'])
+            if regresiones:
+                raise CommandError('Regresiones frente a la línea base:\n  ' + '\n  '.join(regresiones))
+            self.stdout.write(self.style.SUCCESS('Sin regresiones frente a la línea base'))
+
+    def _medir(self, configuracion):
+        with benchmark.base_temporal():
+            self.stdout.write('Sembrando datos...')
+            usuarios = benchmark.sembrar_datos(
+                configuracion['productos'], configuracion['usuarios'], configuracion['pedidos'],
+                semilla=configuracion['semilla'],
+            )
+            self.stdout.write(f"Recorriendo la tienda con {configuracion['concurrencia']} clientes concurrentes...")
+            return benchmark.ejecutar(usuarios, configuracion['iteraciones'],
+                                      configuracion['concurrencia'], configuracion['semilla'])
+
+    def _mostrar(self, resultado):
+        self.stdout.write(
+            f"{resultado['peticiones']} peticiones en {resultado['segundos']}s "
+            f"({resultado['peticiones_por_segundo']} req/s)"
+        )
+        self.stdout.write(f"{'paso':<24}{'n':>6}{'err':>5}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'consultas':>11}")
+        for paso, datos in resultado['pasos'].items():
+            self.stdout.write(
+                f"{paso:<24}{datos['peticiones']:>6}{datos['errores']:>5}{datos['p50_ms']:>10}"
+                f"{datos['p95_ms']:>10}{datos['p99_ms']:>10}{datos['consultas']:>11}"
+            )
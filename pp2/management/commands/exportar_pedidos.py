@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from pp2.exportacion import FORMATOS, ProgresoExportacion, exportar, filtrar_pedidos
+from pp2.models import Pedido
+
+
+def _fecha(valor):
+    fecha = parse_date(valor)
+    if fecha is None:
+        raise ValueError(valor)
+    return fecha
+
+
+class Command(BaseCommand):
+    help = 'Exporta pedidos con sus detalles y dirección de envío en CSV o JSON Lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--formato', choices=FORMATOS, default='csv')
+        parser.add_argument('--desde', type=_fecha, help='Fecha inicial (AAAA-MM-DD), inclusive')
+        parser.add_argument('--hasta', type=_fecha, help='Fecha final (AAAA-MM-DD), inclusive')
+        parser.add_argument('--estado', choices=[clave for clave, _ in Pedido.ESTADOS])
+        parser.add_argument('--despues-de', type=int, default=0,
+                            help='Reanuda la exportación a partir del pedido con id mayor a este')
+        parser.add_argument('--salida', help='Archivo de salida (por defecto, la salida estándar)')
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        if options['desde'] and options['hasta'] and options['desde'] > options['hasta']:
+            raise CommandError('--desde debe ser anterior o igual a --hasta')
+
+        pedidos = filtrar_pedidos(options['desde'], options['hasta'], options['estado'], options['despues_de'])
+        progreso = ProgresoExportacion()
+        filas = exportar(pedidos, options['formato'], options['chunk_size'], progreso)
+        if not options['salida']:
+            for fragmento in filas:
+                self.stdout.write(fragmento, ending='')
+        else:
+            # Al reanudar en el mismo archivo se agrega al final y no se repite la cabecera CSV
+            modo = 'a' if options['despues_de'] else 'w'
+            with open(options['salida'], modo, newline='', encoding='utf-8') as salida:
+                omitir_cabecera = options['formato'] == 'csv' and modo == 'a' and salida.tell() > 0
+                for indice, fragmento in enumerate(filas):
+                    if indice == 0 and omitir_cabecera:
+                        continue
+                    salida.write(fragmento)
+
+        # El último que se escribió de verdad, no el último que hay ahora en la tabla
+        ultimo = progreso.ultimo_id
+        if ultimo is not None:
+            self.stderr.write(f'Último pedido exportado: {ultimo} (usar --despues-de {ultimo} para continuar)')
@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from pp2.imagenes import actualizar_derivadas, pendientes
+from pp2.models import Producto
+
+
+class Command(BaseCommand):
+    help = 'Genera las miniaturas (WebP/JPEG) de las imágenes de productos que aún no las tienen'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--forzar', action='store_true',
+                            help='Regenera las miniaturas de todos los productos con imagen')
+        parser.add_argument('--limite', type=int, default=None,
+                            help='Procesa como máximo esta cantidad de productos (para ejecuciones por tandas)')
+
+    def handle(self, *args, **options):
+        if options['forzar']:
+            productos = Producto.objects.exclude(imagen='').exclude(imagen__isnull=True).order_by('id').iterator()
+        else:
+            productos = pendientes()
+
+        inicio = time.monotonic()
+        procesados = errores = 0
+        for producto in productos:
+            if options['limite'] is not None and procesados + errores >= options['limite']:
+                break
+            try:
+                actualizar_derivadas(producto, forzar=options['forzar'])
+            except (OSError, ValueError) as error:
+                # Un archivo faltante o corrupto no detiene el resto de la tanda
+                errores += 1
+                self.stderr.write(f'Producto {producto.pk} ({producto.imagen.name}): {error}')
+                continue
+            procesados += 1
+            self.stdout.write(f'Producto {producto.pk}: {len(producto.derivadas)} miniaturas')
+
+        segundos = time.monotonic() - inicio
+        self.stdout.write(self.style.SUCCESS(
+            f'{procesados} productos procesados, {errores} con errores en {segundos:.1f}s'
+        ))
@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pp2.importacion import ImportadorCatalogo, leer_filas
+
+
+class Command(BaseCommand):
+    help = ('Importa o actualiza categorías y productos desde CSV/JSON Lines '
+            '(columnas: nombre, categoria, precio, stock, disponible, descripcion, imagen)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo')
+        parser.add_argument('--formato', choices=('csv', 'jsonl'),
+                            help='Por defecto se deduce de la extensión del archivo')
+        parser.add_argument('--imagenes', help='Directorio local con las imágenes (por ejemplo, productos/)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Muestra los cambios sin guardarlos')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        mostrar_cambios = options['dry_run'] or options['verbosity'] >= 2
+        importador = ImportadorCatalogo(
+            directorio_imagenes=options['imagenes'],
+            simular=options['dry_run'],
+            tamano_lote=options['batch_size'],
+            informar=self.stdout.write if mostrar_cambios else None,
+        )
+
+        inicio = time.monotonic()
+        try:
+            importador.importar(leer_filas(options['archivo'], options['formato']))
+        except OSError as error:
+            raise CommandError(str(error))
+        segundos = time.monotonic() - inicio
+
+        # Los errores de formato se detectan al leer y los demás al procesar cada lote
+        for numero, error in sorted(importador.errores, key=lambda error: error[0]):
+            self.stderr.write(f'Línea {numero}: {error}')
+
+        filas = importador.creados + importador.actualizados + importador.sin_cambios + len(importador.errores)
+        prefijo = '[simulación] ' if options['dry_run'] else ''
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefijo}{importador.creados} creados, {importador.actualizados} actualizados, '
+            f'{importador.sin_cambios} sin cambios, {len(importador.errores)} con errores '
+            f'({filas} filas en {segundos:.1f}s, {filas / segundos if segundos else filas:.0f} filas/s)'
+        ))
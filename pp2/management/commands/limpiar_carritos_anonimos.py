@@ -0,0 +1,17 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from pp2.models import Carrito
+
+
+class Command(BaseCommand):
+    help = 'Borra los carritos anónimos más antiguos que la vida de la cookie de sesión (SESSION_COOKIE_AGE)'
+
+    def handle(self, *args, **options):
+        # Solo la sesión guarda el id de un carrito anónimo: vencida la cookie ya nadie puede volver a él
+        limite = timezone.now() - timedelta(seconds=settings.SESSION_COOKIE_AGE)
+        borrados, _ = Carrito.objects.filter(usuario__isnull=True, creado__lt=limite).delete()
+        self.stdout.write(self.style.SUCCESS(f'{borrados} filas de carritos anónimos borradas'))
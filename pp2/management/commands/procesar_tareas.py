@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from pp2.cola import procesar
+
+
+class Command(BaseCommand):
+    help = ('Trabajador de la cola de tareas en segundo plano: ejecuta las tareas pendientes '
+            '(correos, alertas) con reintentos y espera creciente')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--una-vez', action='store_true',
+                            help='Procesa lo que haya en la cola y termina (para cron o pruebas)')
+        parser.add_argument('--lote', type=int, default=10, help='Tareas que se toman por consulta')
+        parser.add_argument('--pausa', type=float, default=1.0,
+                            help='Segundos de espera cuando la cola está vacía')
+
+    def handle(self, *args, **options):
+        total_completadas = total_errores = 0
+        try:
+            while True:
+                # Como en una petición: descarta conexiones caídas o que superaron CONN_MAX_AGE
+                close_old_connections()
+                completadas, errores = procesar(options['lote'])
+                total_completadas += completadas
+                total_errores += errores
+                if completadas or errores:
+                    self.stdout.write(f'{completadas} tareas completadas, {errores} con error')
+                    continue
+                if options['una_vez']:
+                    break
+                time.sleep(options['pausa'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(
+            f'{total_completadas} tareas completadas, {total_errores} con error'
+        ))
@@ -0,0 +1,49 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db.models import DecimalField, ExpressionWrapper, F, Sum
+from django.db.models.functions import Coalesce
+
+from pp2.models import Pedido
+
+
+class Command(BaseCommand):
+    help = 'Recalcula los totales precalculados (total, item_count) de los pedidos existentes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Cantidad de pedidos actualizados por lote')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        importe = ExpressionWrapper(
+            F('detallepedido__cantidad') * F('detallepedido__precio_unitario'),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        )
+        pedidos = (
+            Pedido.objects
+            .annotate(
+                _total=Coalesce(Sum(importe), Decimal('0.00'), output_field=DecimalField(max_digits=12, decimal_places=2)),
+                _item_count=Coalesce(Sum('detallepedido__cantidad'), 0),
+            )
+            .only('id', 'total', 'item_count')
+            .order_by('id')
+        )
+
+        lote = []
+        actualizados = 0
+        for pedido in pedidos.iterator(chunk_size=batch_size):
+            if pedido.total == pedido._total and pedido.item_count == pedido._item_count:
+                continue
+            pedido.total = pedido._total
+            pedido.item_count = pedido._item_count
+            lote.append(pedido)
+            if len(lote) >= batch_size:
+                Pedido.objects.bulk_update(lote, ['total', 'item_count'])
+                actualizados += len(lote)
+                lote = []
+        if lote:
+            Pedido.objects.bulk_update(lote, ['total', 'item_count'])
+            actualizados += len(lote)
+
+        self.stdout.write(self.style.SUCCESS(f'{actualizados} pedidos actualizados'))
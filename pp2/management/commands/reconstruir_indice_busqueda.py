@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from pp2.busqueda import reconstruir_indice, usa_fts5
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye el índice de búsqueda de productos (FTS5 o índice invertido)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Cantidad de filas insertadas por lote')
+
+    def handle(self, *args, **options):
+        inicio = time.monotonic()
+        total = reconstruir_indice(options['batch_size'])
+        backend = 'FTS5' if usa_fts5() else 'índice invertido'
+        self.stdout.write(self.style.SUCCESS(
+            f'{total} productos indexados ({backend}) en {time.monotonic() - inicio:.1f}s'
+        ))
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from pp2.analitica import reconstruir
+
+
+def _fecha(valor):
+    fecha = parse_date(valor)
+    if fecha is None:
+        raise ValueError(valor)
+    return fecha
+
+
+class Command(BaseCommand):
+    help = 'Recalcula los resúmenes diarios de ventas a partir de los pedidos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', type=_fecha, help='Fecha inicial (AAAA-MM-DD), inclusive')
+        parser.add_argument('--hasta', type=_fecha, help='Fecha final (AAAA-MM-DD), inclusive')
+
+    def handle(self, *args, **options):
+        if options['desde'] and options['hasta'] and options['desde'] > options['hasta']:
+            raise CommandError('--desde debe ser anterior o igual a --hasta')
+        inicio = time.monotonic()
+        reconstruir(options['desde'], options['hasta'])
+        self.stdout.write(self.style.SUCCESS(f'Resúmenes reconstruidos en {time.monotonic() - inicio:.1f}s'))
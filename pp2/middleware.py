@@ -0,0 +1,195 @@
+import asyncio
+import math
+import re
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from contextlib import ExitStack
+
+from asgiref.sync import markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+
+def percentil(valores, p):
+    """Percentil por rango más cercano de una lista ya ordenada"""
+    if not valores:
+        return 0
+    indice = min(len(valores), max(1, math.ceil(p / 100 * len(valores)))) - 1
+    return valores[indice]
+
+
+_LISTA_IN = re.compile(r'\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)', re.IGNORECASE)
+_CADENA = re.compile(r"'(?:[^']|'')*'")
+_NUMERO = re.compile(r'(?<![\w."])-?\b\d+(?:\.\d+)?\b')
+_ESPACIOS = re.compile(r'\s+')
+
+
+def normalizar_sql(sql):
+    """Firma de una consulta: sin literales y con las listas IN (...) colapsadas.
+
+    Así `id IN (%s, %s)` e `id IN (%s, %s, %s)`, o un SQL crudo con el id
+    escrito en el texto, cuentan como la misma consulta repetida.
+    """
+    sql = _CADENA.sub('?', sql)
+    sql = _NUMERO.sub('?', sql.replace('%s', '?'))
+    sql = _LISTA_IN.sub('IN (...)', sql)
+    return _ESPACIOS.sub(' ', sql).strip()
+
+
+class RegistroMetricas:
+    """Ventana móvil de métricas por nombre de URL, compartida por los hilos del proceso"""
+
+    CAMPOS = ('consultas', 'db_ms', 'total_ms', 'bytes')
+
+    def __init__(self, ventana=500, max_duplicadas=10):
+        self.ventana = ventana
+        self.max_duplicadas = max_duplicadas
+        self._lock = threading.Lock()
+        self._muestras = defaultdict(lambda: deque(maxlen=self.ventana))
+        self._duplicadas = defaultdict(Counter)
+
+    def registrar(self, url_name, consultas, db_ms, total_ms, tamano, duplicadas=()):
+        with self._lock:
+            self._muestras[url_name].append((consultas, round(db_ms, 2), round(total_ms, 2), tamano))
+            contador = self._duplicadas[url_name]
+            for sql in duplicadas:
+                if sql not in contador and len(contador) >= self.max_duplicadas:
+                    # Memoria acotada por vista: la firma menos vista deja su lugar
+                    del contador[min(contador, key=contador.__getitem__)]
+                contador[sql] += 1
+
+    def resumen(self):
+        with self._lock:
+            muestras = {nombre: list(valores) for nombre, valores in self._muestras.items()}
+            duplicadas = {nombre: contador.most_common() for nombre, contador in self._duplicadas.items()}
+
+        resultado = {}
+        for nombre, filas in muestras.items():
+            datos = {'peticiones': len(filas)}
+            for i, campo in enumerate(self.CAMPOS):
+                valores = sorted(fila[i] for fila in filas)
+                datos[campo] = {
+                    'p50': percentil(valores, 50),
+                    'p95': percentil(valores, 95),
+                    'p99': percentil(valores, 99),
+                }
+            datos['consultas_duplicadas'] = [
+                {'sql': sql, 'peticiones': veces} for sql, veces in duplicadas.get(nombre, [])
+            ]
+            resultado[nombre] = datos
+        return resultado
+
+    def reiniciar(self):
+        with self._lock:
+            self._muestras.clear()
+            self._duplicadas.clear()
+
+
+registro_metricas = RegistroMetricas(
+    getattr(settings, 'METRICAS_VENTANA', 500), getattr(settings, 'METRICAS_MAX_DUPLICADAS', 10),
+)
+
+
+class _ContadorConsultas:
+    """execute_wrapper que cuenta consultas, tiempo de BD y SQL repetido (firmas N+1)"""
+
+    def __init__(self):
+        self.consultas = 0
+        self.db_segundos = 0.0
+        self.sentencias = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_segundos += time.perf_counter() - inicio
+            self.consultas += 1
+            # Misma firma aunque cambien los ids, el largo de un IN (...) o un literal en el texto
+            self.sentencias[normalizar_sql(sql)] += 1
+
+
+class MetricasMiddleware:
+    """Registra consultas, tiempo de BD, tiempo total y tamaño de respuesta por URL.
+
+    No depende de DEBUG: usa execute_wrapper, por lo que el costo por consulta
+    es una llamada a función. Añade la cabecera Server-Timing a cada respuesta.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.habilitado = getattr(settings, 'METRICAS_HABILITADAS', True)
+        self.umbral_duplicados = getattr(settings, 'METRICAS_UMBRAL_DUPLICADOS', 3)
+        # Con ASGI el resto de la cadena es async: no forzar el paso a un hilo aquí
+        if asyncio.iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        if not self.habilitado:
+            return self.get_response(request)
+
+        contador = _ContadorConsultas()
+        inicio = time.perf_counter()
+        with self._contar_consultas(contador):
+            response = self.get_response(request)
+        return self._registrar(request, response, contador, inicio)
+
+    async def __acall__(self, request):
+        if not self.habilitado:
+            return await self.get_response(request)
+
+        # Las consultas corren en el hilo de sync_to_async de la petición
+        # (ThreadSensitiveContext en pp1/asgi.py): el wrapper se instala allí
+        contador = _ContadorConsultas()
+        inicio = time.perf_counter()
+        pila = await sync_to_async(self._contar_consultas)(contador)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(pila.close)()
+        return self._registrar(request, response, contador, inicio)
+
+    @staticmethod
+    def _contar_consultas(contador):
+        pila = ExitStack()
+        for conexion in connections.all():
+            pila.enter_context(conexion.execute_wrapper(contador))
+        return pila
+
+    def _registrar(self, request, response, contador, inicio):
+        total_ms = (time.perf_counter() - inicio) * 1000
+        response['Server-Timing'] = (
+            f'db;dur={contador.db_segundos * 1000:.1f};desc="{contador.consultas} consultas", total;dur={total_ms:.1f}'
+        )
+        if response.streaming:
+            # El cuerpo (p. ej. la exportación de pedidos) se genera después de volver de la
+            # vista: se mide al agotarse, sumando sus consultas y bytes a los de la vista
+            response.streaming_content = self._medir_streaming(request, response.streaming_content, contador, inicio)
+        else:
+            self._guardar(request, contador, inicio, len(response.content))
+        return response
+
+    def _medir_streaming(self, request, contenido, contador, inicio):
+        tamano = 0
+        try:
+            # Se instala en el hilo que recorre el cuerpo, que puede no ser el de la vista
+            with self._contar_consultas(contador):
+                for fragmento in contenido:
+                    tamano += len(fragmento)
+                    yield fragmento
+        finally:
+            self._guardar(request, contador, inicio, tamano)
+
+    def _guardar(self, request, contador, inicio, tamano):
+        total_ms = (time.perf_counter() - inicio) * 1000
+        duplicadas = [sql for sql, veces in contador.sentencias.items() if veces >= self.umbral_duplicados]
+        match = getattr(request, 'resolver_match', None)
+        url_name = match.view_name if match and match.view_name else '<sin_resolver>'
+        registro_metricas.registrar(url_name, contador.consultas, contador.db_segundos * 1000, total_ms, tamano,
+                                    duplicadas)
@@ -0,0 +1,24 @@
+# Generated by Django 3.2.25 on 2026-10-18 11:50
+
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pp2', '0007_auto_20241026_1722'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pedido',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='pedido',
+            name='total',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12),
+        ),
+    ]
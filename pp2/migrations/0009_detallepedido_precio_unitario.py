@@ -0,0 +1,32 @@
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def copiar_precio_actual(apps, schema_editor):
+    # Los detalles existentes toman el precio vigente del producto como mejor aproximación
+    DetallePedido = apps.get_model('pp2', 'DetallePedido')
+    Producto = apps.get_model('pp2', 'Producto')
+    DetallePedido.objects.update(
+        precio_unitario=Subquery(
+            Producto.objects.filter(pk=OuterRef('producto_id')).values('precio')[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pp2', '0008_pedido_totales'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='detallepedido',
+            name='precio_unitario',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=10),
+            preserve_default=False,
+        ),
+        migrations.RunPython(copiar_precio_actual, migrations.RunPython.noop),
+    ]
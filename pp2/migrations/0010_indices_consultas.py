@@ -0,0 +1,33 @@
+# Generated by Django 3.2.25 on 2026-10-18 11:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pp2', '0009_detallepedido_precio_unitario'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cupon',
+            index=models.Index(fields=['valido_desde', 'valido_hasta'], name='cupon_vigencia_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['usuario', '-fecha_pedido', '-id'], name='pedido_usuario_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['estado', 'fecha_pedido'], name='pedido_estado_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(condition=models.Q(('disponible', True)), fields=['categoria', 'precio', 'id'], name='producto_disp_cat_precio_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(condition=models.Q(('disponible', True)), fields=['precio', 'id'], name='producto_disp_precio_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 3.2.25 on 2026-10-18 11:54
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('pp2', '0010_indices_consultas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Carrito',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+                ('usuario', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CarritoItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cantidad', models.PositiveIntegerField(default=1)),
+                ('carrito', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='pp2.carrito')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='pp2.producto')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='carritoitem',
+            constraint=models.UniqueConstraint(fields=('carrito', 'producto'), name='carrito_item_unico'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-18 11:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pp2', '0011_carrito'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='derivadas',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+    ]
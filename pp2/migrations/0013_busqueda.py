@@ -0,0 +1,89 @@
+# Generated by Django 3.2.25 on 2026-10-18 11:58
+
+import re
+import unicodedata
+from collections import Counter
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Copia de pp2/busqueda.py al crear esta migración: las migraciones no importan
+# código de la app, que puede cambiar o desaparecer después
+TABLA_FTS = 'pp2_producto_fts'
+PESO_NOMBRE = 10.0
+PESO_DESCRIPCION = 1.0
+LONGITUD_MAXIMA_TERMINO = 64
+
+
+def normalizar(texto):
+    descompuesto = unicodedata.normalize('NFKD', texto or '')
+    return ''.join(c for c in descompuesto if not unicodedata.combining(c)).lower()
+
+
+def terminos_ponderados(nombre, descripcion):
+    pesos = Counter()
+    for texto, peso in ((nombre, PESO_NOMBRE), (descripcion, PESO_DESCRIPCION)):
+        for token in re.findall(r'\w+', normalizar(texto)):
+            pesos[token[:LONGITUD_MAXIMA_TERMINO]] += peso
+    return pesos
+
+
+def crear_indice_busqueda(apps, schema_editor):
+    # SQLite con FTS5 usa una tabla virtual; cualquier otro caso, el índice invertido
+    Producto = apps.get_model('pp2', 'Producto')
+    TerminoBusqueda = apps.get_model('pp2', 'TerminoBusqueda')
+    conexion = schema_editor.connection
+    productos = Producto.objects.only('id', 'nombre', 'descripcion').order_by('id')
+
+    fts5 = False
+    if conexion.vendor == 'sqlite':
+        with conexion.cursor() as cursor:
+            cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+            fts5 = bool(cursor.fetchone()[0])
+
+    if fts5:
+        with conexion.cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE {TABLA_FTS} USING fts5("
+                f"nombre, descripcion, tokenize = 'unicode61 remove_diacritics 2')"
+            )
+            cursor.executemany(
+                f'INSERT INTO {TABLA_FTS} (rowid, nombre, descripcion) VALUES (%s, %s, %s)',
+                [(p.pk, normalizar(p.nombre), normalizar(p.descripcion)) for p in productos],
+            )
+        return
+
+    TerminoBusqueda.objects.bulk_create([
+        TerminoBusqueda(termino=termino, producto_id=producto.pk, peso=peso)
+        for producto in productos
+        for termino, peso in terminos_ponderados(producto.nombre, producto.descripcion).items()
+    ], batch_size=500)
+
+
+def eliminar_indice_busqueda(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {TABLA_FTS}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pp2', '0012_producto_derivadas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TerminoBusqueda',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('termino', models.CharField(max_length=64)),
+                ('peso', models.FloatField()),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='pp2.producto')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='terminobusqueda',
+            index=models.Index(fields=['termino', 'producto'], name='termino_busqueda_idx'),
+        ),
+        migrations.RunPython(crear_indice_busqueda, eliminar_indice_busqueda),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pp2', '0013_busqueda'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='categoria',
+            name='nombre',
+            field=models.CharField(db_index=True, max_length=50),
+        ),
+        migrations.AlterField(
+            model_name='producto',
+            name='nombre',
+            field=models.CharField(db_index=True, max_length=100),
+        ),
+    ]
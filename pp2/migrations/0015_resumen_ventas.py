@@ -0,0 +1,62 @@
+# Generated by Django 3.2.25 on 2026-10-18 12:02
+
+from decimal import Decimal
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pp2', '0014_indices_nombre'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VentaDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('estado', models.CharField(choices=[('espera', 'En espera'), ('aceptado', 'Pedido aceptado'), ('en_camino', 'En camino'), ('cancelado', 'Cancelado')], max_length=10)),
+                ('unidades', models.IntegerField(default=0)),
+                ('ingresos', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('pedidos', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='VentaDiariaProducto',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('estado', models.CharField(choices=[('espera', 'En espera'), ('aceptado', 'Pedido aceptado'), ('en_camino', 'En camino'), ('cancelado', 'Cancelado')], max_length=10)),
+                ('unidades', models.IntegerField(default=0)),
+                ('ingresos', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('pedidos', models.IntegerField(default=0)),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='pp2.producto')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='VentaDiariaCategoria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('estado', models.CharField(choices=[('espera', 'En espera'), ('aceptado', 'Pedido aceptado'), ('en_camino', 'En camino'), ('cancelado', 'Cancelado')], max_length=10)),
+                ('unidades', models.IntegerField(default=0)),
+                ('ingresos', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('pedidos', models.IntegerField(default=0)),
+                ('categoria', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='pp2.categoria')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='ventadiaria',
+            constraint=models.UniqueConstraint(fields=('fecha', 'estado'), name='venta_diaria_unica'),
+        ),
+        migrations.AddConstraint(
+            model_name='ventadiariaproducto',
+            constraint=models.UniqueConstraint(fields=('fecha', 'producto', 'estado'), name='venta_diaria_producto_unica'),
+        ),
+        migrations.AddConstraint(
+            model_name='ventadiariacategoria',
+            constraint=models.UniqueConstraint(fields=('fecha', 'categoria', 'estado'), name='venta_diaria_categoria_unica'),
+        ),
+    ]
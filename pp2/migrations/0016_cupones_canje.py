@@ -0,0 +1,35 @@
+# Generated by Django 3.2.25 on 2026-10-18 12:04
+
+from decimal import Decimal
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pp2', '0015_resumen_ventas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cupon',
+            name='max_usos',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='cupon',
+            name='usos',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='pedido',
+            name='cupon',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='pp2.cupon'),
+        ),
+        migrations.AddField(
+            model_name='pedido',
+            name='descuento',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12),
+        ),
+    ]
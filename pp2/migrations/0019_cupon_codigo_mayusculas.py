@@ -0,0 +1,28 @@
+from django.db import migrations
+
+
+def codigos_en_mayusculas(apps, schema_editor):
+    # Los códigos se comparan en mayúsculas. Los que ya lo están se conservan; si otro
+    # solo difiere en mayúsculas, recibe su id como sufijo para no chocar con `unique`
+    Cupon = apps.get_model('pp2', 'Cupon')
+    cupones = list(Cupon.objects.order_by('id'))
+    usados = {cupon.codigo for cupon in cupones}
+    for cupon in cupones:
+        codigo = (cupon.codigo or '').strip().upper()
+        if codigo == cupon.codigo:
+            continue
+        if codigo in usados:
+            codigo = f'{codigo}-{cupon.pk}'
+        usados.add(codigo)
+        Cupon.objects.filter(pk=cupon.pk).update(codigo=codigo)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pp2', '0018_tareas'),
+    ]
+
+    operations = [
+        migrations.RunPython(codigos_en_mayusculas, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,10 @@
+from decimal import Decimal
+
 from django.db import models
+from django.db.models import DecimalField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 # Modelo para la dirección de envío
 class DireccionEnvio(models.Model):
@@ -19,29 +24,48 @@ class DireccionEnvio(models.Model):
 
 # Modelo para la Categoría de los productos
 class Categoria(models.Model):
-    nombre = models.CharField(max_length=50)
+    nombre = models.CharField(max_length=50, db_index=True)
     descripcion = models.TextField(blank=True)
+    # Última modificación; con la de los productos da el ETag/Last-Modified del catálogo
+    actualizado = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.nombre
 
 # Modelo para el Producto
 class Producto(models.Model):
-    nombre = models.CharField(max_length=100)
+    nombre = models.CharField(max_length=100, db_index=True)  # Clave natural para importar el catálogo
     descripcion = models.TextField()
     precio = models.DecimalField(max_digits=10, decimal_places=2)
     stock = models.IntegerField()
     imagen = models.ImageField(upload_to='productos/', blank=True, null=True)
+    # Miniaturas generadas a partir de `imagen`: [{'nombre', 'ancho', 'alto', 'formato', 'hash'}]
+    derivadas = models.JSONField(default=list, blank=True, editable=False)
     disponible = models.BooleanField(default=True)
     categoria = models.ForeignKey(Categoria, on_delete=models.CASCADE)
+    # auto_now no aplica en update()/bulk_update(): quien los use debe asignarlo
+    actualizado = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            # Listado de productos disponibles: por categoría y rango de precio, ordenado por (precio, id)
+            models.Index(fields=['categoria', 'precio', 'id'], name='producto_disp_cat_precio_idx',
+                         condition=Q(disponible=True)),
+            models.Index(fields=['precio', 'id'], name='producto_disp_precio_idx',
+                         condition=Q(disponible=True)),
+        ]
 
     def __str__(self):
         return self.nombre
 
     def reducir_stock(self, cantidad):
-        """Método para reducir el stock al realizar un pedido"""
-        self.stock -= cantidad
-        self.save()
+        """Reduce el stock de forma atómica; devuelve False si no alcanza"""
+        actualizados = Producto.objects.filter(pk=self.pk, stock__gte=cantidad).update(
+            stock=F('stock') - cantidad, actualizado=timezone.now()
+        )
+        if actualizados:
+            self.refresh_from_db(fields=['stock'])
+        return bool(actualizados)
 
 # Modelo para el Pedido
 class Pedido(models.Model):
@@ -56,19 +80,58 @@ class Pedido(models.Model):
     fecha_pedido = models.DateTimeField(auto_now_add=True)
     estado = models.CharField(max_length=10, choices=ESTADOS, default='espera')
     direccion_envio = models.ForeignKey(DireccionEnvio, on_delete=models.SET_NULL, null=True)
+    # Totales desnormalizados: se recalculan cuando cambian los detalles
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    item_count = models.PositiveIntegerField(default=0)
+    # Cupón canjeado y monto descontado al confirmar la compra
+    cupon = models.ForeignKey('Cupon', on_delete=models.SET_NULL, null=True, blank=True)
+    descuento = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+
+    class Meta:
+        indexes = [
+            # Historial del cliente (pedidos_view) y filtros del admin por estado y fecha
+            models.Index(fields=['usuario', '-fecha_pedido', '-id'], name='pedido_usuario_fecha_idx'),
+            models.Index(fields=['estado', 'fecha_pedido'], name='pedido_estado_fecha_idx'),
+        ]
 
     def __str__(self):
         return f"Pedido de {self.usuario.username} - {self.fecha_pedido}"
 
     @property
     def subtotal(self):
-        """Calcula el subtotal de todos los detalles del pedido"""
-        return sum(detalle.subtotal for detalle in self.detallepedido_set.all())
+        """Subtotal de todos los detalles del pedido (ya precalculado en `total`)"""
+        return self.total
+
+    @property
+    def total_a_pagar(self):
+        """Total de los detalles menos el descuento del cupón"""
+        return max(self.total - self.descuento, Decimal('0.00'))
+
+    @staticmethod
+    def totales_de_detalles(detalles):
+        """Agrega total e item_count de un queryset de DetallePedido en una sola consulta"""
+        importe = ExpressionWrapper(
+            F('cantidad') * F('precio_unitario'),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        )
+        return detalles.aggregate(
+            total=Coalesce(Sum(importe), Decimal('0.00'), output_field=DecimalField(max_digits=12, decimal_places=2)),
+            item_count=Coalesce(Sum('cantidad'), 0),
+        )
+
+    def recalcular_totales(self):
+        """Recalcula y guarda total e item_count a partir de los detalles del pedido"""
+        totales = self.totales_de_detalles(DetallePedido.objects.filter(pedido_id=self.pk))
+        self.total = totales['total']
+        self.item_count = totales['item_count']
+        Pedido.objects.filter(pk=self.pk).update(total=self.total, item_count=self.item_count)
 
 class DetallePedido(models.Model):
     pedido = models.ForeignKey(Pedido, on_delete=models.CASCADE)
     producto = models.ForeignKey(Producto, on_delete=models.CASCADE)
     cantidad = models.PositiveIntegerField()
+    # Precio del producto al momento de la compra; no cambia si luego se edita el catálogo
+    precio_unitario = models.DecimalField(max_digits=10, decimal_places=2)
 
     def __str__(self):
         return f"{self.cantidad} x {self.producto.nombre} en {self.pedido}"
@@ -76,7 +139,96 @@ class DetallePedido(models.Model):
     @property
     def subtotal(self):
         """Calcula el subtotal de este detalle"""
-        return self.cantidad * self.producto.precio
+        return self.cantidad * self.precio_unitario
+
+
+# Índice invertido de búsqueda (se usa cuando la base de datos no ofrece SQLite FTS5)
+class TerminoBusqueda(models.Model):
+    termino = models.CharField(max_length=64)
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE)
+    peso = models.FloatField()
+
+    class Meta:
+        indexes = [
+            # Búsqueda por prefijo: rango sobre termino, luego producto
+            models.Index(fields=['termino', 'producto'], name='termino_busqueda_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.termino} -> {self.producto_id} ({self.peso})"
+
+
+# Modelo para el carrito de compras (guardado en la base de datos, no en la cookie)
+class Carrito(models.Model):
+    # Nulo para carritos anónimos; se fusionan con el del usuario al iniciar sesión
+    usuario = models.OneToOneField(User, on_delete=models.CASCADE, null=True, blank=True)
+    creado = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Carrito de {self.usuario.username}" if self.usuario_id else f"Carrito anónimo #{self.pk}"
+
+class CarritoItem(models.Model):
+    carrito = models.ForeignKey(Carrito, on_delete=models.CASCADE)
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE)
+    cantidad = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        constraints = [
+            # Una fila por producto: agregar, actualizar y eliminar son búsquedas por esta clave
+            models.UniqueConstraint(fields=['carrito', 'producto'], name='carrito_item_unico'),
+        ]
+
+    def __str__(self):
+        return f"{self.cantidad} x {self.producto_id} en carrito #{self.carrito_id}"
+
+
+# Resúmenes diarios de ventas, mantenidos de forma incremental (ver pp2/analitica.py)
+class VentaDiaria(models.Model):
+    fecha = models.DateField()
+    estado = models.CharField(max_length=10, choices=Pedido.ESTADOS)
+    unidades = models.IntegerField(default=0)
+    ingresos = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    pedidos = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['fecha', 'estado'], name='venta_diaria_unica'),
+        ]
+
+    def __str__(self):
+        return f"{self.fecha} {self.estado}: {self.pedidos} pedidos"
+
+class VentaDiariaProducto(models.Model):
+    fecha = models.DateField()
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE)
+    estado = models.CharField(max_length=10, choices=Pedido.ESTADOS)
+    unidades = models.IntegerField(default=0)
+    ingresos = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    pedidos = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['fecha', 'producto', 'estado'], name='venta_diaria_producto_unica'),
+        ]
+
+    def __str__(self):
+        return f"{self.fecha} {self.producto_id} {self.estado}: {self.unidades} u."
+
+class VentaDiariaCategoria(models.Model):
+    fecha = models.DateField()
+    categoria = models.ForeignKey(Categoria, on_delete=models.CASCADE)
+    estado = models.CharField(max_length=10, choices=Pedido.ESTADOS)
+    unidades = models.IntegerField(default=0)
+    ingresos = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    pedidos = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['fecha', 'categoria', 'estado'], name='venta_diaria_categoria_unica'),
+        ]
+
+    def __str__(self):
+        return f"{self.fecha} {self.categoria_id} {self.estado}: {self.unidades} u."
 
 
 # Modelo para cupones de descuento
@@ -85,6 +237,62 @@ class Cupon(models.Model):
     descuento = models.DecimalField(max_digits=5, decimal_places=2)  # Porcentaje de descuento
     valido_desde = models.DateField()
     valido_hasta = models.DateField()
+    # Canjes realizados; se incrementa con un UPDATE atómico al confirmar cada pedido
+    usos = models.PositiveIntegerField(default=0, editable=False)
+    max_usos = models.PositiveIntegerField(null=True, blank=True)  # Sin límite si está vacío
+
+    class Meta:
+        indexes = [
+            # Búsqueda de cupones vigentes en una fecha
+            models.Index(fields=['valido_desde', 'valido_hasta'], name='cupon_vigencia_idx'),
+        ]
 
     def __str__(self):
         return f"Cupon {self.codigo} - {self.descuento}%"
+
+    @staticmethod
+    def normalizar_codigo(codigo):
+        return (codigo or '').strip().upper()
+
+    # Los códigos se guardan en mayúsculas: así `unique` también rechaza "fruta10" si ya existe "FRUTA10"
+    def clean(self):
+        self.codigo = self.normalizar_codigo(self.codigo)
+
+    def save(self, *args, **kwargs):
+        self.codigo = self.normalizar_codigo(self.codigo)
+        super().save(*args, **kwargs)
+
+
+# Tarea en segundo plano (correos, alertas) que ejecuta `manage.py procesar_tareas`; ver pp2/cola.py
+class Tarea(models.Model):
+    ESTADOS = [
+        ('pendiente', 'Pendiente'),
+        ('en_proceso', 'En proceso'),
+        ('completada', 'Completada'),
+        ('fallida', 'Fallida'),
+    ]
+
+    tipo = models.CharField(max_length=100)
+    datos = models.JSONField(default=dict, blank=True)  # Argumentos de la función de la tarea
+    # Clave de idempotencia: una tarea con una clave ya encolada se ignora
+    clave = models.CharField(max_length=200, unique=True, null=True, blank=True)
+    estado = models.CharField(max_length=10, choices=ESTADOS, default='pendiente')
+    intentos = models.PositiveIntegerField(default=0)
+    max_intentos = models.PositiveIntegerField(default=5)
+    # Pendiente: cuándo puede ejecutarse (espera entre reintentos). En proceso: fin del
+    # bloqueo del trabajador; si vence sin terminar, otro trabajador la vuelve a tomar
+    disponible_desde = models.DateTimeField(default=timezone.now)
+    lote = models.CharField(max_length=32, blank=True)  # Trabajador que la tiene tomada
+    ultimo_error = models.TextField(blank=True)
+    creada = models.DateTimeField(auto_now_add=True)
+    terminada = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Tareas listas para tomar, por orden de llegada
+            models.Index(fields=['estado', 'disponible_desde'], name='tarea_disponible_idx'),
+            models.Index(fields=['lote'], name='tarea_lote_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.tipo} #{self.pk} ({self.estado})"
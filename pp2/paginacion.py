@@ -0,0 +1,111 @@
+from django.core import signing
+from django.db.models import Q
+
+SALT_CURSOR = 'pp2.paginacion.cursor'
+
+
+class CursorInvalido(Exception):
+    """El token de cursor recibido no es válido o fue manipulado"""
+
+
+class PaginaCursor:
+    """Página obtenida por keyset: no usa OFFSET ni ejecuta COUNT(*)"""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+def _campo(modelo, nombre):
+    return modelo._meta.get_field(nombre.lstrip('-'))
+
+
+def _codificar(modelo, orden, objeto, direccion):
+    valores = []
+    for nombre in orden:
+        valor = _campo(modelo, nombre).value_from_object(objeto)
+        valores.append(valor.isoformat() if hasattr(valor, 'isoformat') else str(valor))
+    return signing.dumps({'v': valores, 'd': direccion}, salt=SALT_CURSOR, compress=True)
+
+
+def _decodificar(modelo, orden, cursor):
+    try:
+        datos = signing.loads(cursor, salt=SALT_CURSOR)
+        valores = [_campo(modelo, nombre).to_python(valor) for nombre, valor in zip(orden, datos['v'])]
+        direccion = datos['d']
+    except (signing.BadSignature, KeyError, TypeError, ValueError) as error:
+        raise CursorInvalido(str(error))
+    if len(valores) != len(orden) or direccion not in ('next', 'prev'):
+        raise CursorInvalido('cursor incompleto')
+    return valores, direccion
+
+
+def _despues_de(orden, valores, invertir=False):
+    """Condición keyset: filas posteriores a `valores` según `orden`"""
+    condicion = Q()
+    for i, nombre in enumerate(orden):
+        descendente = nombre.startswith('-') != invertir
+        lookup = '__lt' if descendente else '__gt'
+        campo = nombre.lstrip('-')
+        igualdades = {orden[j].lstrip('-'): valores[j] for j in range(i)}
+        condicion |= Q(**igualdades, **{campo + lookup: valores[i]})
+    return condicion
+
+
+def _invertido(orden):
+    return [nombre[1:] if nombre.startswith('-') else '-' + nombre for nombre in orden]
+
+
+def paginar_por_cursor(queryset, orden, cursor=None, por_pagina=12):
+    """Devuelve una PaginaCursor del queryset ordenado por `orden`.
+
+    `orden` debe terminar en un campo único (normalmente el id) para que el
+    recorrido sea estable. El costo de cualquier página es el de la primera:
+    un rango sobre el índice y LIMIT por_pagina + 1.
+    """
+    modelo = queryset.model
+    orden = list(orden)
+    direccion = 'next'
+
+    if cursor:
+        valores, direccion = _decodificar(modelo, orden, cursor)
+        if direccion == 'next':
+            queryset = queryset.filter(_despues_de(orden, valores)).order_by(*orden)
+        else:
+            queryset = queryset.filter(_despues_de(orden, valores, invertir=True)).order_by(*_invertido(orden))
+    else:
+        queryset = queryset.order_by(*orden)
+
+    filas = list(queryset[:por_pagina + 1])
+    hay_mas = len(filas) > por_pagina
+    filas = filas[:por_pagina]
+    if direccion == 'prev':
+        filas.reverse()
+
+    if not filas:
+        return PaginaCursor(filas)
+
+    if direccion == 'next':
+        next_cursor = _codificar(modelo, orden, filas[-1], 'next') if hay_mas else None
+        previous_cursor = _codificar(modelo, orden, filas[0], 'prev') if cursor else None
+    else:
+        next_cursor = _codificar(modelo, orden, filas[-1], 'next')
+        previous_cursor = _codificar(modelo, orden, filas[0], 'prev') if hay_mas else None
+
+    return PaginaCursor(filas, next_cursor, previous_cursor)
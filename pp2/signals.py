@@ -0,0 +1,125 @@
+import logging
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.core.signals import request_started
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete
+from django.dispatch import receiver
+
+from .analitica import mover_pedido, retirar_pedido
+from .bases_de_datos import verificar_conexiones
+from .busqueda import desindexar_producto, indexar_producto
+from .cache_catalogo import invalidar_catalogo
+from .cupones import invalidar_cupones
+from .imagenes import actualizar_derivadas
+from .models import Categoria, Cupon, DetallePedido, Pedido, Producto
+from .sqlite import aplicar_pragmas
+
+logger = logging.getLogger(__name__)
+
+# Pedidos cuyo borrado está en curso en este hilo (ver actualizar_totales_pedido)
+_eliminacion = threading.local()
+
+
+# Mantiene los totales desnormalizados del pedido cuando cambian sus detalles
+@receiver(post_save, sender=DetallePedido)
+@receiver(post_delete, sender=DetallePedido)
+def actualizar_totales_pedido(sender, instance, **kwargs):
+    if instance.pedido_id in _pedidos_eliminandose():
+        # Se borra en cascada con su pedido: no hay totales que mantener
+        return
+    Pedido(pk=instance.pedido_id).recalcular_totales()
+
+
+def _pedidos_eliminandose():
+    if not hasattr(_eliminacion, 'pedidos'):
+        _eliminacion.pedidos = set()
+    return _eliminacion.pedidos
+
+
+# pre_delete de los pedidos llega antes que el post_delete de sus detalles en cascada
+@receiver(pre_delete, sender=Pedido)
+def marcar_pedido_eliminandose(sender, instance, **kwargs):
+    _pedidos_eliminandose().add(instance.pk)
+
+
+@receiver(post_delete, sender=Pedido)
+def desmarcar_pedido_eliminandose(sender, instance, **kwargs):
+    _pedidos_eliminandose().discard(instance.pk)
+
+# Resúmenes de ventas: recuerda el estado cargado para detectar cambios al guardar
+@receiver(post_init, sender=Pedido)
+def recordar_estado_pedido(sender, instance, **kwargs):
+    instance._estado_anterior = instance.__dict__.get('estado')
+
+
+@receiver(post_save, sender=Pedido)
+def actualizar_resumen_por_estado(sender, instance, created, **kwargs):
+    anterior = instance._estado_anterior
+    if not created and anterior and anterior != instance.estado:
+        mover_pedido(instance, anterior)
+    instance._estado_anterior = instance.estado
+
+
+@receiver(pre_delete, sender=Pedido)
+def retirar_pedido_del_resumen(sender, instance, **kwargs):
+    retirar_pedido(instance, instance._estado_anterior)
+
+
+# Genera las miniaturas al subir una imagen nueva (antes de invalidar la caché del catálogo)
+@receiver(post_save, sender=Producto)
+def generar_miniaturas_producto(sender, instance, update_fields=None, **kwargs):
+    if not getattr(settings, 'IMAGENES_DERIVADAS_AL_GUARDAR', True):
+        return
+    if update_fields is not None and 'imagen' not in update_fields:
+        return
+    try:
+        actualizar_derivadas(instance)
+    except FileNotFoundError:
+        logger.warning('Sin miniaturas para el producto %s: no existe %s', instance.pk, instance.imagen.name)
+    except (OSError, ValueError):
+        # El producto se guarda igual; generar_derivadas_imagenes lo reintentará
+        logger.exception('No se pudieron generar las miniaturas del producto %s', instance.pk)
+
+
+# Mantiene el índice de búsqueda al día con nombre y descripción del producto
+@receiver(post_save, sender=Producto)
+def indexar_producto_busqueda(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not {'nombre', 'descripcion'} & set(update_fields):
+        return
+    indexar_producto(instance)
+
+
+@receiver(post_delete, sender=Producto)
+def desindexar_producto_busqueda(sender, instance, **kwargs):
+    desindexar_producto(instance.pk)
+
+
+# Cualquier cambio en el catálogo (incluido list_editable del admin) invalida la caché
+@receiver(post_save, sender=Producto)
+@receiver(post_delete, sender=Producto)
+@receiver(post_save, sender=Categoria)
+@receiver(post_delete, sender=Categoria)
+def invalidar_cache_catalogo(sender, **kwargs):
+    transaction.on_commit(invalidar_catalogo)
+
+
+# Los cupones vigentes se guardan en memoria: se recargan al cambiar cualquier cupón
+@receiver(post_save, sender=Cupon)
+@receiver(post_delete, sender=Cupon)
+def invalidar_cache_cupones(sender, **kwargs):
+    transaction.on_commit(invalidar_cupones)
+
+
+# WAL, busy_timeout y demás PRAGMA en cada conexión SQLite nueva (ver SQLITE_PRAGMAS)
+@receiver(connection_created)
+def configurar_conexion_sqlite(sender, connection, **kwargs):
+    aplicar_pragmas(connection)
+
+
+# Conexiones persistentes: descarta las que dejaron de responder antes de usarlas
+@receiver(request_started)
+def verificar_conexiones_persistentes(sender, **kwargs):
+    verificar_conexiones()
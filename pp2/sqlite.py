@@ -0,0 +1,61 @@
+import types
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+# Valores por defecto si SQLITE_PRAGMAS no está en settings
+PRAGMAS = {
+    'journal_mode': 'WAL',      # Los lectores no esperan al escritor
+    'synchronous': 'NORMAL',    # Seguro con WAL; sin fsync en cada commit
+    'busy_timeout': 5000,       # Milisegundos que se espera un bloqueo antes de fallar
+    'cache_size': -20000,       # Negativo = KiB (unos 20 MB por conexión)
+    'mmap_size': 128 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+
+def pragmas():
+    return getattr(settings, 'SQLITE_PRAGMAS', PRAGMAS)
+
+
+def _begin_immediate(connection):
+    # Toma el bloqueo de escritura al abrir la transacción: si otro proceso escribe,
+    # se espera busy_timeout en lugar de fallar al pasar de lectura a escritura
+    connection.cursor().execute('BEGIN IMMEDIATE')
+
+
+def transaccion_inmediata(connection):
+    """Hace que transaction.atomic() abra con BEGIN IMMEDIATE en esta conexión SQLite.
+
+    Equivale a OPTIONS['transaction_mode'] = 'IMMEDIATE' de Django 5.1. En Django 3.2
+    se reemplaza el método interno _start_transaction_under_autocommit, el que usa
+    atomic() para abrir la transacción en SQLite. Si una versión de Django lo quita,
+    se lanza ImproperlyConfigured en vez de seguir en silencio con BEGIN diferido.
+    """
+    if not callable(getattr(connection, '_start_transaction_under_autocommit', None)):
+        raise ImproperlyConfigured(
+            'Esta versión de Django no tiene _start_transaction_under_autocommit: desactive '
+            'SQLITE_TRANSACCION_INMEDIATA o use OPTIONS["transaction_mode"] (Django 5.1+)'
+        )
+    connection._start_transaction_under_autocommit = types.MethodType(_begin_immediate, connection)
+
+
+def aplicar_pragmas(connection):
+    """Ejecuta los PRAGMA configurados en una conexión SQLite recién abierta"""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for nombre, valor in pragmas().items():
+            cursor.execute(f'PRAGMA {nombre} = {valor}')
+    if getattr(settings, 'SQLITE_TRANSACCION_INMEDIATA', True):
+        transaccion_inmediata(connection)
+
+
+def leer_pragmas(connection):
+    """Valores actuales de los PRAGMA configurados (para diagnóstico y pruebas)"""
+    valores = {}
+    with connection.cursor() as cursor:
+        for nombre in pragmas():
+            cursor.execute(f'PRAGMA {nombre}')
+            valores[nombre] = cursor.fetchone()[0]
+    return valores
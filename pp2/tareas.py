@@ -0,0 +1,41 @@
+"""Tareas en segundo plano de la tienda (ver pp2/cola.py y `manage.py procesar_tareas`)"""
+from django.conf import settings
+from django.core.mail import mail_admins, send_mail
+from django.template.loader import render_to_string
+
+from .cola import tarea
+from .models import Pedido, Producto, Tarea
+
+
+def tareas_de_pedido(pedido, producto_ids):
+    """Efectos posteriores a una compra; la clave evita duplicarlos si se vuelven a encolar"""
+    return [
+        Tarea(tipo='confirmacion_pedido', datos={'pedido_id': pedido.pk}, clave=f'pedido:{pedido.pk}:confirmacion'),
+        Tarea(tipo='alerta_stock', datos={'producto_ids': sorted(producto_ids)}, clave=f'pedido:{pedido.pk}:stock'),
+    ]
+
+
+@tarea('confirmacion_pedido')
+def enviar_confirmacion_pedido(pedido_id):
+    """Correo de confirmación a la dirección de envío del pedido"""
+    pedido = Pedido.objects.select_related('direccion_envio').filter(pk=pedido_id).first()
+    if pedido is None or pedido.direccion_envio is None or not pedido.direccion_envio.correo:
+        return
+    cuerpo = render_to_string('correos/confirmacion_pedido.txt', {
+        'pedido': pedido,
+        'direccion': pedido.direccion_envio,
+        'detalles': pedido.detallepedido_set.select_related('producto').order_by('id'),
+    })
+    send_mail(f'Pedido #{pedido.pk} recibido', cuerpo, None, [pedido.direccion_envio.correo])
+
+
+@tarea('alerta_stock')
+def alertar_stock_bajo(producto_ids):
+    """Avisa a ADMINS de los productos que quedaron con STOCK_ALERTA_UMBRAL unidades o menos"""
+    umbral = getattr(settings, 'STOCK_ALERTA_UMBRAL', 5)
+    bajos = list(Producto.objects.filter(id__in=producto_ids, stock__lte=umbral).order_by('stock', 'id'))
+    if bajos:
+        mail_admins(
+            f'Stock bajo: {len(bajos)} producto(s)',
+            '\n'.join(f'{producto.nombre} (id {producto.id}): {producto.stock} unidades' for producto in bajos),
+        )
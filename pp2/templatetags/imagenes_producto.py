@@ -0,0 +1,44 @@
+from django import template
+from django.templatetags.static import static
+from django.utils.html import format_html, format_html_join
+
+register = template.Library()
+
+TIPOS = {'webp': 'image/webp', 'jpeg': 'image/jpeg'}
+
+
+@register.simple_tag
+def imagen_producto(producto, sizes='100vw', clase='', imagen_por_defecto='img/default-image.png'):
+    """<picture> con srcset de las miniaturas del producto (WebP con respaldo JPEG).
+
+    Si el producto aún no tiene miniaturas se usa la imagen original, y si no
+    tiene imagen, la imagen por defecto.
+    """
+    if not producto.imagen:
+        return format_html('<img src="{}" class="{}" alt="{}" loading="lazy">',
+                           static(imagen_por_defecto), clase, producto.nombre)
+
+    storage = producto.imagen.storage
+    por_formato = {}
+    for derivada in producto.derivadas:
+        por_formato.setdefault(derivada['formato'], []).append(derivada)
+
+    if not por_formato:
+        return format_html('<img src="{}" class="{}" alt="{}" loading="lazy">',
+                           producto.imagen.url, clase, producto.nombre)
+
+    def srcset(derivadas):
+        return ', '.join(f"{storage.url(derivada['nombre'])} {derivada['ancho']}w" for derivada in derivadas)
+
+    respaldo = por_formato.get('jpeg') or next(iter(por_formato.values()))
+    mayor = max(respaldo, key=lambda derivada: derivada['ancho'])
+    fuentes = format_html_join(
+        '', '<source type="{}" srcset="{}" sizes="{}">',
+        ((TIPOS.get(formato, ''), srcset(derivadas), sizes)
+         for formato, derivadas in por_formato.items() if derivadas is not respaldo),
+    )
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" class="{}" alt="{}" loading="lazy"></picture>',
+        fuentes, storage.url(mayor['nombre']), srcset(respaldo), sizes,
+        mayor['ancho'], mayor['alto'], clase, producto.nombre,
+    )
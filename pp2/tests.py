@@ -1,3 +1,1871 @@
-from django.test import TestCase
+import asyncio
+import csv
+import importlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import types
+from datetime import date, datetime, timedelta
+from io import BytesIO, StringIO
+from unittest import mock
+from decimal import Decimal
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.sessions.backends.cache import SessionStore
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core import mail, signing
+from django.core.cache.utils import make_template_fragment_key
+from django.core.management import call_command
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.db import IntegrityError, connection, connections, transaction
+from django.db.models import QuerySet
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.template import Context, Template
+from django.urls import get_resolver, reverse
+from django.utils import timezone
+
+from . import analitica
+from . import benchmark
+from . import busqueda
+from . import checkout
+from . import cola
+from . import exportacion
+from . import imagenes
+from . import cupones
+from . import vistas_async
+from .admin import ProductoAdmin
+from .bases_de_datos import lectura_en_replica
+from .cache_catalogo import ORDEN_CURSOR, PRODUCTOS_POR_PAGINA, invalidar_catalogo, version_catalogo
+from .carrito import CarritoCompras
+from .middleware import MetricasMiddleware, RegistroMetricas, normalizar_sql, registro_metricas
+from .paginacion import CursorInvalido, paginar_por_cursor
+from .sqlite import leer_pragmas, transaccion_inmediata
+from .checkout import StockInsuficiente, procesar_compra
+from .views import PEDIDOS_POR_PAGINA
+from .exportacion import filtrar_pedidos
+from .importacion import ImportadorCatalogo, leer_filas
+from .models import (Carrito, CarritoItem, Categoria, Cupon, DetallePedido, DireccionEnvio, Pedido, Producto, Tarea,
+                     VentaDiaria, VentaDiariaCategoria, VentaDiariaProducto)
+
+
+# Verifica con EXPLAIN QUERY PLAN que las consultas calientes usan índices
+class PlanesDeConsultaTests(TestCase):
+    TABLAS = ('pp2_producto', 'pp2_pedido', 'pp2_cupon')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('cliente', password='clave-segura')
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'clave-segura')
+        categorias = [Categoria.objects.create(nombre=nombre) for nombre in ('Frutas Andinas', 'Frutas de la Selva')]
+        Producto.objects.bulk_create([
+            Producto(nombre=f'Fruta {i}', descripcion='', precio=Decimal(8 + i), stock=10,
+                     disponible=i % 5 != 0, categoria=categorias[i % 2])
+            for i in range(40)
+        ])
+        Pedido.objects.bulk_create([
+            Pedido(usuario=cls.usuario, estado='espera' if i % 2 else 'aceptado') for i in range(30)
+        ])
+        Cupon.objects.create(codigo='FRUTA10', descuento=Decimal('10'),
+                             valido_desde=date(2024, 1, 1), valido_hasta=date(2030, 12, 31))
+
+    def setUp(self):
+        cache.clear()
+
+    def assertSinEscaneoCompleto(self, consultas):
+        for consulta in consultas:
+            sql = consulta['sql']
+            if not sql.startswith('SELECT') or not any(tabla in sql for tabla in self.TABLAS):
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                planes = [fila[-1] for fila in cursor.fetchall()]
+            for plan in planes:
+                for tabla in self.TABLAS:
+                    self.assertNotEqual(plan, f'SCAN {tabla}', f'Escaneo completo de {tabla} en: {sql}\n{planes}')
+
+    def capturar(self, url, usuario=None):
+        if usuario:
+            self.client.force_login(usuario)
+        with CaptureQueriesContext(connection) as contexto:
+            respuesta = self.client.get(url)
+        self.assertEqual(respuesta.status_code, 200)
+        return contexto.captured_queries
+
+    def test_listado_de_productos(self):
+        url = reverse('productos')
+        for parametros in ('', '?categoria=Frutas Andinas', '?precio=20',
+                           '?categoria=Frutas Andinas&precio=30', '?cursor=', '?cursor=&precio=30'):
+            self.assertSinEscaneoCompleto(self.capturar(url + parametros))
+
+    def test_historial_de_pedidos(self):
+        url = reverse('pedidos')
+        self.assertSinEscaneoCompleto(self.capturar(url, self.usuario))
+        self.assertSinEscaneoCompleto(self.capturar(url + '?cursor=', self.usuario))
+
+    def test_admin_pedidos_filtrado_por_estado(self):
+        url = reverse('admin:pp2_pedido_changelist') + '?estado__exact=espera'
+        self.assertSinEscaneoCompleto(self.capturar(url, self.admin))
+
+    def test_cupones_vigentes(self):
+        hoy = date(2025, 6, 1)
+        with CaptureQueriesContext(connection) as contexto:
+            list(Cupon.objects.filter(valido_desde__lte=hoy, valido_hasta__gte=hoy))
+        self.assertSinEscaneoCompleto(contexto.captured_queries)
+
+
+# El recorrido del benchmark debe funcionar de punta a punta con datos sembrados
+class BenchmarkTests(TestCase):
+    def test_recorrido_sin_errores(self):
+        usuarios = benchmark.sembrar_datos(productos=20, usuarios=2, pedidos=10, categorias=2)
+        self.assertEqual(Pedido.objects.count(), 10)
+        reporte = benchmark.ejecutar(usuarios, iteraciones=1, concurrencia=1)
+        self.assertEqual(reporte['peticiones'], 22)
+        for paso, datos in reporte['pasos'].items():
+            self.assertEqual(datos['errores'], 0, paso)
+            self.assertGreater(datos['consultas'], 0, paso)
+        self.assertEqual(Pedido.objects.count(), 12)
+
+    def test_comparar_detecta_regresiones(self):
+        base = {'peticiones_por_segundo': 100, 'pasos': {
+            'productos': {'p95_ms': 10, 'consultas': 2, 'errores': 0},
+        }}
+        igual = {'peticiones_por_segundo': 90, 'pasos': {
+            'productos': {'p95_ms': 12, 'consultas': 2, 'errores': 0},
+        }}
+        peor = {'peticiones_por_segundo': 50, 'pasos': {
+            'productos': {'p95_ms': 30, 'consultas': 3, 'errores': 1},
+        }}
+        self.assertEqual(benchmark.comparar(base, igual), [])
+        self.assertEqual(len(benchmark.comparar(base, peor)), 4)
+
+
+# Máximo de consultas por vista (nombre de URL); no debe crecer con el número de filas
+PRESUPUESTO_CONSULTAS = {
+    'inicio': 2,
+    'productos': 5,  # incluye la consulta de agregados del ETag
+    'detalle_producto': 4,  # idem
+    'registro': 0,
+    'login': 0,
+    'crear_pedido': 3,
+    'agregar_al_carrito': 4,
+    'ver_carrito': 4,
+    'finalizar_compra': 4,
+    # POST de finalizar_compra con varios productos: un UPDATE de stock, un bulk_create de detalles,
+    # analítica por upsert y las tareas encoladas de una vez, cualquiera sea el tamaño del carrito
+    'finalizar_compra_post': 17,
+    'mi_cuenta': 2,
+    'pedidos': 3,
+    'actualizar_pedido': 3,
+    'eliminar_pedido': 3,
+    'detalle_pedido': 4,
+    'confirmacion_pedido': 4,
+    'metricas': 2,
+    'panel_ventas': 9,
+    'exportar_pedidos': 4,
+    'api_productos': 1,  # ?ids=: el lote sale de una sola consulta
+    'api_producto': 4,  # sesión y usuario (para el ETag), validadores y el producto
+    'api_categorias': 1,
+}
+
+
+def contar_consultas(cliente, metodo, url, datos=None):
+    """Hace la petición (consumiendo las respuestas en streaming) y devuelve (respuesta, consultas)"""
+    cache.clear()
+    with CaptureQueriesContext(connection) as contexto:
+        respuesta = getattr(cliente, metodo)(url, datos or {})
+        if respuesta.streaming:
+            b''.join(respuesta.streaming_content)
+    return respuesta, len(contexto.captured_queries)
+
+
+# Ejecuta cada vista con pocas y con muchas filas: el número de consultas debe ser el mismo
+class PresupuestoConsultasTests(TestCase):
+    # Con 3 el carrito todavía tiene varios productos al comprar (eliminar_pedido quita uno)
+    TAMANOS = (3, 25)
+
+    def crear_datos(self, n):
+        """Usuario (staff) con n pedidos de n líneas, n productos en el carrito y n productos extra"""
+        usuario = User.objects.create_user(f'cliente{n}', password='clave-segura', is_staff=True)
+        categoria = Categoria.objects.create(nombre=f'Categoría {n}')
+        Producto.objects.bulk_create([
+            Producto(nombre=f'Fruta {n}-{i}', precio=Decimal(5 + i), stock=100, categoria=categoria,
+                     imagen=f'productos/fruta{i}.jpg')
+            for i in range(n)
+        ])
+        productos = list(Producto.objects.filter(categoria=categoria).order_by('id'))
+        Pedido.objects.bulk_create([Pedido(usuario=usuario) for _ in range(n)])
+        pedidos = list(Pedido.objects.filter(usuario=usuario).order_by('id'))
+        DetallePedido.objects.bulk_create([
+            DetallePedido(pedido=pedido, producto=producto, cantidad=1, precio_unitario=producto.precio)
+            for pedido in pedidos for producto in productos
+        ])
+        carrito = Carrito.objects.create(usuario=usuario)
+        CarritoItem.objects.bulk_create([
+            CarritoItem(carrito=carrito, producto=producto, cantidad=2) for producto in productos
+        ])
+        return usuario, productos, pedidos[0]
+
+    def medir(self, n):
+        usuario, productos, pedido = self.crear_datos(n)
+        producto = productos[0]
+        self.client.force_login(usuario)
+        sesion = self.client.session
+        sesion['carrito_id'] = Carrito.objects.get(usuario=usuario).pk
+        sesion.save()
+
+        peticiones = [
+            ('inicio', 'get', reverse('inicio'), None),
+            ('productos', 'get', reverse('productos') + '?page=2', None),
+            ('detalle_producto', 'get', reverse('detalle_producto', args=[producto.pk]), None),
+            ('registro', 'get', reverse('registro'), None),
+            ('login', 'get', reverse('login'), None),
+            ('crear_pedido', 'get', reverse('crear_pedido', args=[producto.pk]), None),
+            ('ver_carrito', 'get', reverse('ver_carrito'), None),
+            ('finalizar_compra', 'get', reverse('finalizar_compra'), None),
+            ('mi_cuenta', 'get', reverse('mi_cuenta'), None),
+            ('pedidos', 'get', reverse('pedidos'), None),
+            ('detalle_pedido', 'get', reverse('detalle_pedido', args=[pedido.pk]), None),
+            ('confirmacion_pedido', 'get', reverse('confirmacion_pedido', args=[pedido.pk]), None),
+            ('metricas', 'get', reverse('metricas'), None),
+            ('panel_ventas', 'get', reverse('panel_ventas'), None),
+            ('exportar_pedidos', 'get', reverse('exportar_pedidos') + '?formato=jsonl', None),
+            ('api_productos', 'get', reverse('api_productos') + '?ids=' + ','.join(str(p.pk) for p in productos), None),
+            ('api_producto', 'get', reverse('api_producto', args=[producto.pk]) + '?fields=id,miniaturas', None),
+            ('api_categorias', 'get', reverse('api_categorias'), None),
+            ('agregar_al_carrito', 'post', reverse('agregar_al_carrito', args=[producto.pk]), {'cantidad': 1}),
+            ('actualizar_pedido', 'post', reverse('actualizar_pedido', args=[producto.pk]), {'cantidad': 3}),
+            ('eliminar_pedido', 'post', reverse('eliminar_pedido', args=[producto.pk]), None),
+            # Al final: compra y vacía el carrito (con n - 1 productos)
+            ('finalizar_compra_post', 'post', reverse('finalizar_compra'), {
+                'nombres': 'Ana', 'celular': '999', 'dni': '12345678', 'direccion': 'Av. Sol 1',
+                'ciudad': 'Cusco', 'distrito': 'Centro', 'pais': 'Perú', 'correo': 'ana@example.com',
+            }),
+        ]
+        consultas = {}
+        for nombre, metodo, url, datos in peticiones:
+            respuesta, consultas[nombre] = contar_consultas(self.client, metodo, url, datos)
+            self.assertIn(respuesta.status_code, (200, 302), nombre)
+        # La compra se completó: no volvió al formulario con un error
+        self.assertRedirects(respuesta, reverse('mi_cuenta'), fetch_redirect_response=False)
+        self.assertEqual(DetallePedido.objects.filter(pedido=Pedido.objects.latest('id')).count(), n - 1)
+        return consultas
+
+    def test_vistas_dentro_del_presupuesto(self):
+        pocas, muchas = (self.medir(n) for n in self.TAMANOS)
+        for nombre, maximo in PRESUPUESTO_CONSULTAS.items():
+            with self.subTest(vista=nombre):
+                self.assertLessEqual(muchas[nombre], maximo, f'{nombre} supera su presupuesto de consultas')
+                self.assertEqual(pocas[nombre], muchas[nombre],
+                                 f'{nombre}: las consultas crecen con el número de filas (posible N+1)')
+
+    def test_todas_las_vistas_tienen_presupuesto(self):
+        nombres = {
+            patron.name for patron in get_resolver().url_patterns
+            if getattr(patron, 'name', None) and getattr(patron.callback, '__module__', '') in ('pp2.views', 'pp2.api')
+        }
+        self.assertEqual(nombres - set(PRESUPUESTO_CONSULTAS), set())
+
+
+# Con WAL los lectores no esperan a una compra que tiene abierta su transacción de escritura
+class ConcurrenciaSQLiteTests(SimpleTestCase):
+    def setUp(self):
+        descriptor, self.ruta = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(descriptor)
+        self.conexiones = []
+        escritor = self.conectar()
+        with escritor.cursor() as cursor:
+            cursor.execute('CREATE TABLE stock (id INTEGER PRIMARY KEY, cantidad INTEGER NOT NULL)')
+            cursor.execute('INSERT INTO stock (id, cantidad) VALUES (1, 10)')
+
+    def tearDown(self):
+        for conexion in self.conexiones:
+            conexion.close()
+        for sufijo in ('', '-wal', '-shm'):
+            if os.path.exists(self.ruta + sufijo):
+                os.remove(self.ruta + sufijo)
+
+    def conectar(self, cerrar_al_final=True):
+        """Conexión nueva al archivo temporal; connection_created aplica los PRAGMA"""
+        base = connections['default']
+        conexion = base.__class__({**base.settings_dict, 'NAME': self.ruta}, alias='concurrencia')
+        conexion.ensure_connection()
+        if cerrar_al_final:
+            self.conexiones.append(conexion)
+        return conexion
+
+    def test_pragmas_aplicados(self):
+        pragmas = leer_pragmas(self.conectar())
+        self.assertEqual(pragmas['journal_mode'], 'wal')
+        self.assertEqual(pragmas['synchronous'], 1)  # NORMAL
+        self.assertGreater(pragmas['busy_timeout'], 0)
+
+    def test_atomic_abre_con_begin_immediate(self):
+        # Falla aquí (y no en producción, en silencio) si Django renombra el método interno
+        self.assertTrue(callable(getattr(connections['default'].__class__, '_start_transaction_under_autocommit', None)))
+        conexion = self.conectar()
+        with CaptureQueriesContext(conexion) as contexto:
+            conexion.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+            conexion.rollback()
+            conexion.set_autocommit(True)
+        self.assertEqual(contexto.captured_queries[0]['sql'], 'BEGIN IMMEDIATE')
+
+        with self.assertRaises(ImproperlyConfigured):
+            transaccion_inmediata(types.SimpleNamespace())
+
+    def test_lectores_no_esperan_al_escritor(self):
+        escritor, lector = self.conectar(), self.conectar()
+        with escritor.cursor() as cursor:
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.execute('UPDATE stock SET cantidad = cantidad - 3 WHERE id = 1 AND cantidad >= 3')
+
+        inicio = time.monotonic()
+        with lector.cursor() as cursor:
+            cursor.execute('SELECT cantidad FROM stock WHERE id = 1')
+            self.assertEqual(cursor.fetchone()[0], 10)  # Último valor confirmado
+        self.assertLess(time.monotonic() - inicio, 0.5)
+
+        with escritor.cursor() as cursor:
+            cursor.execute('COMMIT')
+        with lector.cursor() as cursor:
+            cursor.execute('SELECT cantidad FROM stock WHERE id = 1')
+            self.assertEqual(cursor.fetchone()[0], 7)
+
+    def test_escritores_concurrentes_esperan_su_turno(self):
+        errores, hilos = [], []
+
+        def comprar():
+            # Cada hilo usa (y cierra) su propia conexión
+            conexion = self.conectar(cerrar_al_final=False)
+            try:
+                # Igual que transaction.atomic(): abre la transacción con el BEGIN configurado
+                conexion.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+                with conexion.cursor() as cursor:
+                    # Como el checkout: primero lee y luego escribe en la misma transacción
+                    cursor.execute('SELECT cantidad FROM stock WHERE id = 1')
+                    time.sleep(0.02)
+                    cursor.execute('UPDATE stock SET cantidad = cantidad - 1 WHERE id = 1 AND cantidad >= 1')
+                conexion.commit()
+                conexion.set_autocommit(True)
+            except Exception as error:
+                errores.append(error)
+            finally:
+                conexion.close()
+
+        for _ in range(8):
+            hilos.append(threading.Thread(target=comprar))
+            hilos[-1].start()
+        for hilo in hilos:
+            hilo.join()
+
+        self.assertEqual(errores, [])
+        with self.conectar().cursor() as cursor:
+            cursor.execute('SELECT cantidad FROM stock WHERE id = 1')
+            self.assertEqual(cursor.fetchone()[0], 2)
+
+
+# Las vistas del catálogo leen de la réplica; sesiones, usuarios y carritos, de default
+@override_settings(BASES_DE_DATOS_REPLICA=['replica'])
+class RouterReplicasTests(TestCase):
+    databases = {'default', 'replica'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('cliente', password='clave-segura')
+        # Datos distintos en cada base para saber de dónde se leyó
+        cls.principal = Producto.objects.create(
+            nombre='Solo en default', precio=Decimal('5'), stock=3,
+            categoria=Categoria.objects.create(nombre='Frutas'), imagen='productos/a.jpg',
+        )
+        cls.replicado = Producto.objects.using('replica').create(
+            id=cls.principal.pk + 100, nombre='Solo en la réplica', precio=Decimal('7'), stock=3,
+            categoria=Categoria.objects.using('replica').create(nombre='Frutas'), imagen='productos/b.jpg',
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.usuario)
+
+    def test_catalogo_lee_de_la_replica(self):
+        self.assertContains(self.client.get(reverse('detalle_producto', args=[self.replicado.pk])),
+                            'Solo en la réplica')
+        self.assertContains(self.client.get(reverse('productos')), 'Solo en la réplica')
+
+    def test_solo_los_modelos_del_catalogo(self):
+        @lectura_en_replica
+        def vista(request):
+            return {modelo: modelo.objects.all().db for modelo in (Producto, Categoria, Pedido, User)}
+
+        self.assertEqual(vista(None), {Producto: 'replica', Categoria: 'replica', Pedido: 'default', User: 'default'})
+        self.assertEqual(Producto.objects.all().db, 'default')
+
+    def test_resto_de_vistas_lee_de_default(self):
+        respuesta = self.client.get(reverse('crear_pedido', args=[self.principal.pk]))
+        self.assertContains(respuesta, 'Solo en default')
+
+    def test_escrituras_van_a_default(self):
+        self.client.post(reverse('crear_pedido', args=[self.principal.pk]), {'cantidad': 1})
+        self.assertEqual(Carrito.objects.using('default').count(), 1)
+        self.assertEqual(Carrito.objects.using('replica').count(), 0)
+
+    @override_settings(BASES_DE_DATOS_REPLICA=[])
+    def test_sin_replicas_todo_va_a_default(self):
+        respuesta = self.client.get(reverse('detalle_producto', args=[self.replicado.pk]))
+        self.assertEqual(respuesta.status_code, 404)
+
+
+# Selección de la configuración por entorno
+class ConfiguracionPorEntornoTests(SimpleTestCase):
+    def cargar(self, modulo, **variables):
+        with mock.patch.dict(os.environ, variables):
+            sys.modules.pop('pp1.settings.base', None)
+            sys.modules.pop(modulo, None)
+            try:
+                return importlib.import_module(modulo)
+            finally:
+                sys.modules.pop('pp1.settings.base', None)
+                sys.modules.pop(modulo, None)
+
+    def test_prod_con_postgresql_y_replicas(self):
+        prod = self.cargar('pp1.settings.prod', DJANGO_SECRET_KEY='secreto', DJANGO_ALLOWED_HOSTS='tienda.pe',
+                           DJANGO_CACHE_URL='redis://cache:6379/1', DB_HOST='db1', DB_REPLICAS='db2,db3')
+        self.assertFalse(prod.DEBUG)
+        self.assertEqual(prod.ALLOWED_HOSTS, ['tienda.pe'])
+        self.assertEqual(prod.DATABASES['default']['ENGINE'], 'django.db.backends.postgresql')
+        self.assertGreater(prod.DATABASES['default']['CONN_MAX_AGE'], 0)
+        self.assertEqual([prod.DATABASES[alias]['HOST'] for alias in prod.BASES_DE_DATOS_REPLICA], ['db2', 'db3'])
+
+    def test_prod_exige_secret_key(self):
+        with self.assertRaises(ImproperlyConfigured):
+            self.cargar('pp1.settings.prod', DJANGO_SECRET_KEY='', DJANGO_ALLOWED_HOSTS='tienda.pe',
+                        DJANGO_CACHE_URL='redis://cache:6379/1')
+
+    def test_prod_exige_cache_compartido(self):
+        with self.assertRaises(ImproperlyConfigured):
+            self.cargar('pp1.settings.prod', DJANGO_SECRET_KEY='secreto', DJANGO_ALLOWED_HOSTS='tienda.pe',
+                        DJANGO_CACHE_URL='')
+        prod = self.cargar('pp1.settings.prod', DJANGO_SECRET_KEY='secreto', DJANGO_ALLOWED_HOSTS='tienda.pe',
+                           DJANGO_CACHE_URL='memcached://cache1:11211,cache2:11211')
+        self.assertEqual(prod.CACHES['default'], {
+            'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+            'LOCATION': ['cache1:11211', 'cache2:11211'],
+        })
+        with self.assertRaises(ImproperlyConfigured):
+            self.cargar('pp1.settings.prod', DJANGO_SECRET_KEY='secreto', DJANGO_ALLOWED_HOSTS='tienda.pe',
+                        DJANGO_CACHE_URL='locmem://')
+
+    def test_dev_con_sqlite(self):
+        dev = self.cargar('pp1.settings.dev', DB_ENGINE='sqlite')
+        self.assertTrue(dev.DEBUG)
+        self.assertEqual(dev.DATABASES['default']['ENGINE'], 'django.db.backends.sqlite3')
+
+    def test_plantillas_en_cache_fuera_de_debug(self):
+        dev = self.cargar('pp1.settings.dev', DB_ENGINE='sqlite')
+        prod = self.cargar('pp1.settings.prod', DJANGO_SECRET_KEY='secreto', DJANGO_ALLOWED_HOSTS='tienda.pe',
+                           DJANGO_CACHE_URL='redis://cache:6379/1')
+        self.assertNotIn('cached', repr(dev.TEMPLATES[0]['OPTIONS']['loaders']))
+        self.assertEqual(prod.TEMPLATES[0]['OPTIONS']['loaders'][0][0], 'django.template.loaders.cached.Loader')
+
+
+# Vistas async (VISTAS_ASYNC) y el middleware de métricas en modo async
+class VistasAsyncTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('cliente', password='clave-segura')
+        cls.producto = Producto.objects.create(
+            nombre='Aguaymanto', precio=Decimal('6'), stock=5, imagen='productos/aguaymanto.jpg',
+            categoria=Categoria.objects.create(nombre='Frutas Andinas'),
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def peticion(self, url, usuario=None):
+        request = RequestFactory().get(url)
+        request.user = usuario or AnonymousUser()
+        request.session = SessionStore()
+        return request
+
+    def test_catalogo(self):
+        respuesta = async_to_sync(vistas_async.productos)(self.peticion(reverse('productos')))
+        self.assertContains(respuesta, 'Aguaymanto')
+        respuesta = async_to_sync(vistas_async.detalle_producto)(
+            self.peticion(reverse('detalle_producto', args=[self.producto.pk])), self.producto.pk)
+        self.assertContains(respuesta, 'Aguaymanto')
+        self.assertEqual(async_to_sync(vistas_async.inicio)(self.peticion(reverse('inicio'))).status_code, 200)
+        with self.assertRaises(Http404):
+            async_to_sync(vistas_async.detalle_producto)(self.peticion('/productos/0/'), 0)
+
+    def test_carrito(self):
+        anonimo = async_to_sync(vistas_async.ver_carrito)(self.peticion(reverse('ver_carrito')))
+        self.assertEqual(anonimo.status_code, 200)
+
+        request = self.peticion(reverse('ver_carrito'), self.usuario)
+        carrito = Carrito.objects.create(usuario=self.usuario)
+        CarritoItem.objects.create(carrito=carrito, producto=self.producto, cantidad=2)
+        request.session['carrito_id'] = carrito.pk
+        respuesta = async_to_sync(vistas_async.ver_carrito)(request)
+        self.assertContains(respuesta, 'Aguaymanto')
+        self.assertContains(respuesta, 'S/12.00')
+
+    def test_metricas_en_modo_async(self):
+        async def vista(request):
+            await sync_to_async(Producto.objects.count)()
+            return HttpResponse('ok')
+
+        registro_metricas.reiniciar()
+        middleware = MetricasMiddleware(vista)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        respuesta = async_to_sync(middleware)(self.peticion('/'))
+        self.assertIn('1 consultas', respuesta['Server-Timing'])
+        self.assertEqual(registro_metricas.resumen()['<sin_resolver>']['consultas']['p50'], 1)
+
+
+# pp1/asgi.py: un hilo sync por petición en curso, reutilizado entre peticiones
+class HilosAsgiTests(SimpleTestCase):
+    def setUp(self):
+        from pp1 import asgi
+        self.asgi = asgi
+        self.addCleanup(asgi._hilos_libres.clear)
+        asgi._hilos_libres.clear()
+
+    def atender(self, cantidad):
+        """Atiende `cantidad` peticiones a la vez; devuelve el hilo sync de cada una"""
+        hilos = []
+
+        async def aplicacion(scope, receive, send):
+            hilos.append(await sync_to_async(threading.get_ident)())
+            await asyncio.sleep(0.01)
+
+        async def todas():
+            await asyncio.gather(*(self.asgi.application({'type': 'http'}, None, None) for _ in range(cantidad)))
+
+        # asyncio.run y no async_to_sync: este mandaría el código sync de vuelta al hilo del test
+        with mock.patch.object(self.asgi, 'django_application', aplicacion):
+            asyncio.run(todas())
+        return hilos
+
+    def test_reutiliza_hilos_entre_peticiones(self):
+        primeras = self.atender(3)
+        self.assertEqual(len(set(primeras)), 3)
+        # Mismos hilos, y con ellos sus conexiones persistentes (CONN_MAX_AGE)
+        self.assertEqual(set(self.atender(3)), set(primeras))
+
+    def test_otra_version_de_asgiref_usa_el_handler_de_django(self):
+        self.assertTrue(self.asgi.hilos_reutilizables('3.12.1'))
+        self.assertFalse(self.asgi.hilos_reutilizables('4.0.0'))
+        self.assertFalse(self.asgi.hilos_reutilizables('3.2.10'))
+        self.assertFalse(self.asgi.hilos_reutilizables('dev'))
+        with mock.patch.object(self.asgi, 'REPARTIR_HILOS', False):
+            hilos = self.atender(3)
+        # Sin reparto: el único hilo sync compartido, y ninguno queda guardado
+        self.assertEqual(len(set(hilos)), 1)
+        self.assertEqual(self.asgi._hilos_libres, [])
+
+    @override_settings(ASGI_HILOS_LIBRES=1)
+    def test_descarta_los_hilos_que_sobran(self):
+        cerradas = threading.Semaphore(0)
+        with mock.patch.object(self.asgi.connections, 'close_all', side_effect=cerradas.release):
+            self.atender(3)
+            # Los hilos descartados cierran sus conexiones antes de terminar
+            self.assertTrue(all(cerradas.acquire(timeout=5) for _ in range(2)))
+        self.assertEqual(len(self.asgi._hilos_libres), 1)
+
+
+# Métricas: detección de SQL repetido (N+1) con firmas normalizadas
+class MetricasDuplicadasTests(TestCase):
+    def setUp(self):
+        registro_metricas.reiniciar()
+        self.addCleanup(registro_metricas.reiniciar)
+
+    def test_normalizar_sql(self):
+        self.assertEqual(
+            normalizar_sql('SELECT "t1"."id" FROM "t1"  WHERE ("t1"."id" IN (%s, %s, %s) AND "t1"."x" = \'it\'\'s\') LIMIT 21'),
+            'SELECT "t1"."id" FROM "t1" WHERE ("t1"."id" IN (...) AND "t1"."x" = ?) LIMIT ?',
+        )
+        self.assertEqual(normalizar_sql('SELECT a FROM t WHERE id = 42 AND precio > -1.5'),
+                         'SELECT a FROM t WHERE id = ? AND precio > ?')
+        # Las subconsultas no se colapsan: solo las listas de valores
+        self.assertEqual(normalizar_sql('SELECT a FROM t WHERE b IN (SELECT c FROM u WHERE d IN (1, 2))'),
+                         'SELECT a FROM t WHERE b IN (SELECT c FROM u WHERE d IN (...))')
+
+    def test_duplicadas_en_el_resumen(self):
+        def vista(request):
+            for i in range(1, 5):
+                # Listas IN de distinto largo y SQL crudo con el id en el texto: misma firma
+                list(Producto.objects.filter(id__in=list(range(i))))
+                with connection.cursor() as cursor:
+                    cursor.execute(f'SELECT COUNT(*) FROM pp2_producto WHERE id = {i}')
+            Producto.objects.count()
+            return HttpResponse('ok')
+
+        middleware = MetricasMiddleware(vista)
+        for _ in range(2):
+            middleware(RequestFactory().get('/'))
+        duplicadas = registro_metricas.resumen()['<sin_resolver>']['consultas_duplicadas']
+        self.assertEqual([fila['peticiones'] for fila in duplicadas], [2, 2])
+        orm, crudo = sorted(fila['sql'] for fila in duplicadas)
+        self.assertTrue(orm.endswith('FROM "pp2_producto" WHERE "pp2_producto"."id" IN (...)'), orm)
+        self.assertEqual(crudo, 'SELECT COUNT(*) FROM pp2_producto WHERE id = ?')
+
+    def test_respuestas_en_streaming(self):
+        def filas():
+            for _ in range(2):
+                yield f'{Producto.objects.count()}\n'.encode()
+
+        def vista(request):
+            Producto.objects.exists()
+            return StreamingHttpResponse(filas())
+
+        respuesta = MetricasMiddleware(vista)(RequestFactory().get('/'))
+        # Nada se registra hasta que el cuerpo termina de enviarse
+        self.assertEqual(registro_metricas.resumen(), {})
+        self.assertEqual(b''.join(respuesta.streaming_content), b'0\n0\n')
+        metricas = registro_metricas.resumen()['<sin_resolver>']
+        self.assertEqual((metricas['consultas']['p50'], metricas['bytes']['p50']), (3, 4))
+
+    def test_firmas_acotadas_por_vista(self):
+        registro = RegistroMetricas(max_duplicadas=3)
+        for _ in range(3):
+            registro.registrar('vista', 1, 1, 1, 1, ['frecuente'])
+        for numero in range(10):
+            registro.registrar('vista', 1, 1, 1, 1, [f'consulta {numero}'])
+        registro.registrar('otra', 1, 1, 1, 1, ['propia'])
+
+        duplicadas = registro.resumen()['vista']['consultas_duplicadas']
+        self.assertEqual(len(duplicadas), 3)
+        self.assertEqual(duplicadas[0], {'sql': 'frecuente', 'peticiones': 3})
+        self.assertEqual(registro.resumen()['otra']['consultas_duplicadas'], [{'sql': 'propia', 'peticiones': 1}])
+
+
+# Carrito: anónimo que se fusiona al iniciar sesión y validación de cantidades
+class CarritoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        categoria = Categoria.objects.create(nombre='Frutas de Estación')
+        cls.mango, cls.palta = [
+            Producto.objects.create(nombre=nombre, precio=Decimal('5'), stock=10,
+                                    imagen='productos/fruta.jpg', categoria=categoria)
+            for nombre in ('Mango', 'Palta')
+        ]
+        cls.usuario = User.objects.create_user('cliente', password='clave-segura')
+
+    def cantidades(self, carrito):
+        return dict(carrito.carritoitem_set.values_list('producto_id', 'cantidad'))
+
+    def test_carrito_anonimo_se_fusiona_al_iniciar_sesion(self):
+        self.client.post(reverse('crear_pedido', args=[self.mango.id]), {'cantidad': 2})
+        respuesta = self.client.post(reverse('agregar_al_carrito', args=[self.palta.id]), {'cantidad': 1})
+        self.assertRedirects(respuesta, reverse('ver_carrito'))
+        self.assertContains(self.client.get(reverse('ver_carrito')), 'Palta')
+        anonimo = Carrito.objects.get(usuario__isnull=True)
+
+        # El usuario ya tenía mangos en su carrito: se suman
+        carrito = Carrito.objects.create(usuario=self.usuario)
+        CarritoItem.objects.create(carrito=carrito, producto=self.mango, cantidad=3)
+        self.client.post(reverse('login'), {'username': 'cliente', 'password': 'clave-segura'})
+
+        self.assertEqual(self.cantidades(carrito), {self.mango.id: 5, self.palta.id: 1})
+        self.assertFalse(Carrito.objects.filter(pk=anonimo.pk).exists())
+        self.assertEqual(self.client.session['carrito_id'], carrito.pk)
+
+    def test_limpiar_carritos_anonimos_vencidos(self):
+        vencido, reciente = Carrito.objects.create(), Carrito.objects.create()
+        del_usuario = Carrito.objects.create(usuario=self.usuario)
+        CarritoItem.objects.create(carrito=vencido, producto=self.mango)
+        antes = timezone.now() - timedelta(seconds=settings.SESSION_COOKIE_AGE + 60)
+        Carrito.objects.filter(pk__in=[vencido.pk, del_usuario.pk]).update(creado=antes)
+
+        call_command('limpiar_carritos_anonimos', stdout=StringIO())
+
+        self.assertEqual(set(Carrito.objects.values_list('pk', flat=True)), {reciente.pk, del_usuario.pk})
+        self.assertFalse(CarritoItem.objects.filter(carrito_id=vencido.pk).exists())
+
+    def test_finalizar_compra_sigue_pidiendo_sesion(self):
+        self.client.post(reverse('crear_pedido', args=[self.mango.id]))
+        respuesta = self.client.get(reverse('finalizar_compra'))
+        self.assertRedirects(respuesta, f"{reverse('login')}?next={reverse('finalizar_compra')}",
+                             fetch_redirect_response=False)
+
+    def test_cantidades_invalidas_responden_400(self):
+        self.client.force_login(self.usuario)
+        self.client.post(reverse('crear_pedido', args=[self.mango.id]), {'cantidad': 2})
+        urls = [reverse(nombre, args=[self.mango.id])
+                for nombre in ('crear_pedido', 'agregar_al_carrito', 'actualizar_pedido')]
+        for url in urls:
+            for cantidad in ('abc', '', '0', '-3', '1.5'):
+                with self.subTest(url=url, cantidad=cantidad):
+                    self.assertEqual(self.client.post(url, {'cantidad': cantidad}).status_code, 400)
+
+        carrito = Carrito.objects.get(usuario=self.usuario)
+        self.assertEqual(self.cantidades(carrito), {self.mango.id: 2})
+        self.client.post(reverse('actualizar_pedido', args=[self.mango.id]), {'cantidad': 4})
+        self.assertEqual(self.cantidades(carrito), {self.mango.id: 4})
+
+    def test_carrito_compras_rechaza_cantidades_menores_que_uno(self):
+        request = RequestFactory().post('/')
+        request.user = self.usuario
+        request.session = SessionStore()
+        carrito = CarritoCompras(request)
+        for cantidad in (0, -1):
+            with self.assertRaises(ValueError):
+                carrito.agregar(self.mango.id, cantidad)
+            with self.assertRaises(ValueError):
+                carrito.actualizar(self.mango.id, cantidad)
+        self.assertEqual(carrito.items(), [])
+
+
+# Búsqueda de productos con FTS5 y con el índice invertido de respaldo
+class BusquedaTests(TestCase):
+    databases = {'default', 'replica'}
+
+    @classmethod
+    def setUpTestData(cls):
+        categoria = Categoria.objects.create(nombre='Frutas del Bosque')
+        datos = (
+            ('Arándanos', 'Bayas azules de la sierra'),
+            ('Mermelada de fresa', 'Hecha con arándanos y fresas'),
+            ('Mango Kent', 'Dulce y jugoso'),
+            ('Mandarina', 'Cítrico de temporada'),
+        )
+        cls.arandanos, cls.mermelada, cls.mango, cls.mandarina = [
+            Producto.objects.create(nombre=nombre, descripcion=descripcion, precio=Decimal('5'),
+                                    stock=5, categoria=categoria)
+            for nombre, descripcion in datos
+        ]
+
+    def setUp(self):
+        busqueda._fts5_disponible.clear()
+        self.addCleanup(busqueda._fts5_disponible.clear)
+
+    def en_ambos_backends(self, prueba):
+        for fts5 in (True, False):
+            with self.subTest(fts5=fts5), override_settings(BUSQUEDA_USAR_FTS5=fts5):
+                self.assertEqual(busqueda.usa_fts5(), fts5)
+                busqueda.reconstruir_indice()
+                prueba()
+
+    def test_normalizar_quita_tildes(self):
+        self.assertEqual(busqueda.normalizar('Arándanos ÑANDÚ'), 'arandanos nandu')
+        self.assertEqual(busqueda.tokenizar('Piña, limón'), ['pina', 'limon'])
+
+    def test_tildes_y_mayusculas_no_importan(self):
+        def prueba():
+            for texto in ('arandanos', 'ARÁNDANOS', 'Arandános'):
+                self.assertEqual(set(busqueda.buscar_ids(texto)), {self.arandanos.pk, self.mermelada.pk})
+        self.en_ambos_backends(prueba)
+
+    def test_coincide_por_prefijo_y_exige_todos_los_terminos(self):
+        def prueba():
+            self.assertEqual(set(busqueda.buscar_ids('man')), {self.mango.pk, self.mandarina.pk})
+            self.assertEqual(busqueda.buscar_ids('man dulce'), [self.mango.pk])
+            self.assertEqual(busqueda.buscar_ids('man kiwi'), [])
+            self.assertEqual(busqueda.buscar_ids('  ¿?  '), [])
+        self.en_ambos_backends(prueba)
+
+    def test_el_nombre_pesa_mas_que_la_descripcion(self):
+        def prueba():
+            self.assertEqual(busqueda.buscar_ids('arandanos'), [self.arandanos.pk, self.mermelada.pk])
+            self.assertEqual(busqueda.buscar_ids('fresa'), [self.mermelada.pk])
+            self.assertEqual(busqueda.buscar_ids('man', limite=1), busqueda.buscar_ids('man')[:1])
+        self.en_ambos_backends(prueba)
+
+    def test_indice_al_dia_al_guardar_y_borrar(self):
+        def prueba():
+            self.mango.nombre = 'Mango Edward'
+            self.mango.save()
+            self.assertEqual(busqueda.buscar_ids('edward'), [self.mango.pk])
+            busqueda.desindexar_producto(self.mango.pk)
+            self.assertEqual(busqueda.buscar_ids('edward'), [])
+        self.en_ambos_backends(prueba)
+
+    def test_admin_no_se_corta_en_el_limite_de_busqueda(self):
+        modelo_admin = ProductoAdmin(Producto, admin.site)
+        request = RequestFactory().get('/admin/pp2/producto/', {'q': 'man'})
+
+        def prueba():
+            with override_settings(BUSQUEDA_LIMITE=1):
+                self.assertEqual(len(busqueda.buscar_ids('man')), 1)
+                resultados, _ = modelo_admin.get_search_results(request, Producto.objects.all(), 'man')
+            self.assertEqual(set(resultados), {self.mango, self.mandarina})
+        self.en_ambos_backends(prueba)
+
+    def test_fts5_se_detecta_por_conexion(self):
+        replica = connections['replica']
+        with mock.patch.object(replica.introspection, 'table_names', return_value=[]):
+            self.assertFalse(busqueda.usa_fts5(replica))
+        self.assertTrue(busqueda.usa_fts5(connection))
+        self.assertEqual(busqueda._fts5_disponible, {'replica': False, 'default': True})
+
+
+# Fragmentos en caché: grilla de productos y barra de navegación
+class FragmentosEnCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        categoria = Categoria.objects.create(nombre='Frutas de Huerto')
+        cls.productos = [
+            Producto.objects.create(nombre=f'Fresa {numero}', precio=Decimal('8') + numero, stock=5,
+                                    imagen='productos/fresa.jpg', categoria=categoria)
+            for numero in range(3)
+        ]
+        cls.usuarios = [User.objects.create_user(f'cliente{numero}', password='clave-segura') for numero in range(2)]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_grilla_en_cache_por_productos_y_version(self):
+        self.client.get(reverse('productos'))
+        ids = [producto.id for producto in self.productos]
+        version = version_catalogo()
+        self.assertIsNotNone(cache.get(make_template_fragment_key('grilla_productos', [ids, version, False])))
+
+        invalidar_catalogo()
+        respuesta = self.client.get(reverse('productos'))
+        self.assertContains(respuesta, 'Fresa 2')
+        self.assertIsNotNone(cache.get(make_template_fragment_key('grilla_productos', [ids, version + 1, False])))
+
+    def test_token_csrf_fuera_de_los_fragmentos(self):
+        tokens = []
+        for usuario in self.usuarios:
+            cliente = self.client_class(enforce_csrf_checks=True)
+            cliente.force_login(usuario)
+            respuesta = cliente.get(reverse('productos'))
+            self.assertContains(respuesta, 'form="form-carrito"', count=len(self.productos))
+            tokens.append(respuesta.context['csrf_token'])
+            # El formulario con el token de esta sesión permite añadir al carrito
+            respuesta = cliente.post(reverse('crear_pedido', args=[self.productos[0].id]),
+                                     {'csrfmiddlewaretoken': str(tokens[-1])})
+            self.assertNotEqual(respuesta.status_code, 403)
+
+        # La segunda petición reutilizó los fragmentos de la primera sin copiar su token
+        fragmento = cache.get(make_template_fragment_key('navbar', [True]))
+        self.assertNotIn('csrfmiddlewaretoken', fragmento)
+        self.assertNotIn('csrfmiddlewaretoken', cache.get(make_template_fragment_key(
+            'grilla_productos', [[producto.id for producto in self.productos], version_catalogo(), True])))
+
+
+# GET condicional: ETag/Last-Modified, 304 sin render y Cache-Control
+class GetCondicionalTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('cliente', password='clave-segura')
+        cls.producto = Producto.objects.create(
+            nombre='Camu camu', precio=Decimal('12'), stock=5, imagen='productos/camu.jpg',
+            categoria=Categoria.objects.create(nombre='Frutas de la Selva'),
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_catalogo_responde_304_sin_renderizar(self):
+        respuesta = self.client.get(reverse('productos'))
+        self.assertEqual(respuesta['Cache-Control'], 'public, max-age=60')
+        self.assertIn('Last-Modified', respuesta)
+        etag = respuesta['ETag']
+
+        with self.assertNumQueries(1):
+            respuesta = self.client.get(reverse('productos'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 304)
+        self.assertEqual(respuesta.templates, [])
+        self.assertEqual(respuesta['ETag'], etag)
+
+        # Otra página del listado tiene su propio ETag
+        self.assertEqual(self.client.get(reverse('productos') + '?page=2', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_cambios_en_el_catalogo_cambian_el_etag(self):
+        etag = self.client.get(reverse('productos'))['ETag']
+        self.producto.precio = Decimal('13')
+        self.producto.save()
+        self.assertEqual(self.client.get(reverse('productos'), HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_vender_stock_cambia_el_etag(self):
+        # El stock se descuenta con UPDATE (sin auto_now): debe tocar `actualizado` igual
+        url = reverse('detalle_producto', args=[self.producto.pk])
+        etag = self.client.get(url)['ETag']
+        direccion = DireccionEnvio(nombres='Ana', celular='999', dni='12345678', direccion='Av. Sol 1',
+                                   ciudad='Cusco', distrito='Centro', pais='Perú', correo='ana@example.com')
+        procesar_compra(self.usuario, direccion, [{'producto_id': self.producto.pk, 'cantidad': 2}])
+        respuesta = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertContains(respuesta, self.producto.nombre)
+
+        etag = respuesta['ETag']
+        self.assertTrue(Producto.objects.get(pk=self.producto.pk).reducir_stock(1))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        etag = self.client.get(reverse('productos'))['ETag']
+        self.producto.categoria.save()
+        self.assertEqual(self.client.get(reverse('productos'), HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_detalle_producto(self):
+        url = reverse('detalle_producto', args=[self.producto.pk])
+        respuesta = self.client.get(url)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=respuesta['ETag']).status_code, 304)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=respuesta['Last-Modified']).status_code, 304)
+        self.assertEqual(self.client.get(reverse('detalle_producto', args=[0])).status_code, 404)
+
+    def test_usuario_autenticado_no_va_al_cache_compartido(self):
+        anonimo = self.client.get(reverse('productos'))['ETag']
+        self.client.force_login(self.usuario)
+        respuesta = self.client.get(reverse('productos'))
+        self.assertNotEqual(respuesta['ETag'], anonimo)
+        self.assertEqual(respuesta['Cache-Control'], 'private, no-cache')
+        self.assertEqual(self.client.get(reverse('productos'), HTTP_IF_NONE_MATCH=anonimo).status_code, 200)
+
+    def test_peticiones_con_cookies_son_privadas(self):
+        url = reverse('detalle_producto', args=[self.producto.pk])
+        anonima = self.client.get(url)
+        self.assertEqual(anonima['Cache-Control'], 'public, max-age=60')
+        self.assertIn('Cookie', anonima['Vary'])
+
+        # Un 304 no renderiza (CSRF_COOKIE_USED no se marca): basta la cookie CSRF para ser privado
+        self.client.cookies['csrftoken'] = 'a' * 64
+        respuesta = self.client.get(url, HTTP_IF_MODIFIED_SINCE=anonima['Last-Modified'])
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta['Cache-Control'], 'private, no-cache')
+        self.assertNotIn('Last-Modified', respuesta)
+        no_modificada = self.client.get(url, HTTP_IF_NONE_MATCH=respuesta['ETag'])
+        self.assertEqual(no_modificada.status_code, 304)
+        self.assertEqual(no_modificada['Cache-Control'], 'private, no-cache')
+        self.assertIn('Cookie', no_modificada['Vary'])
+
+        # Con sesión iniciada la fecha del catálogo no valida: el usuario o su carrito pudieron cambiar
+        self.client.force_login(self.usuario)
+        respuesta = self.client.get(url, HTTP_IF_MODIFIED_SINCE=anonima['Last-Modified'])
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotIn('Last-Modified', respuesta)
+
+    def test_vista_async(self):
+        request = RequestFactory().get(reverse('productos'))
+        request.user = AnonymousUser()
+        request.session = SessionStore()
+        etag = async_to_sync(vistas_async.productos)(request)['ETag']
+
+        request = RequestFactory().get(reverse('productos'), HTTP_IF_NONE_MATCH=etag)
+        request.user = AnonymousUser()
+        request.session = SessionStore()
+        self.assertEqual(async_to_sync(vistas_async.productos)(request).status_code, 304)
+
+
+# API JSON del catálogo: ?fields=, lote por ids y paginación por cursor
+class ApiCatalogoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.categoria = Categoria.objects.create(nombre='Frutas Tropicales')
+        cls.productos = [
+            Producto.objects.create(nombre=f'Mango {numero}', descripcion='Dulce', precio=Decimal(10 + numero),
+                                    stock=3, categoria=cls.categoria, disponible=numero != 4)
+            for numero in range(5)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_fields(self):
+        producto = self.productos[0]
+        respuesta = self.client.get(reverse('api_producto', args=[producto.pk]), {'fields': 'nombre,precio,nombre'})
+        self.assertEqual(respuesta.json(), {'nombre': 'Mango 0', 'precio': '10.00'})
+        self.assertNotIn(b': ', respuesta.content)
+
+        respuesta = self.client.get(reverse('api_categorias'))
+        self.assertEqual(respuesta.json(), {'resultados': [{'id': self.categoria.pk, 'nombre': 'Frutas Tropicales'}]})
+
+        respuesta = self.client.get(reverse('api_productos'), {'fields': 'nombre,secreto'})
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertIn('secreto', respuesta.json()['error'])
+
+    def test_lote_por_ids(self):
+        ids = [self.productos[2].pk, 999999, self.productos[4].pk, self.productos[0].pk]
+        with self.assertNumQueries(1):
+            respuesta = self.client.get(reverse('api_productos'), {'ids': ','.join(map(str, ids)),
+                                                                   'fields': 'id,stock,disponible'})
+        datos = respuesta.json()
+        self.assertEqual([producto['id'] for producto in datos['resultados']], [ids[0], ids[2], ids[3]])
+        self.assertFalse(datos['resultados'][1]['disponible'])
+        self.assertEqual(datos['faltantes'], [999999])
+        self.assertEqual(self.client.get(reverse('api_productos'), {'ids': '1,x'}).status_code, 400)
+
+    def test_paginacion_por_cursor(self):
+        vistos, cursor = [], None
+        while True:
+            parametros = {'limite': 2, 'fields': 'id'}
+            if cursor:
+                parametros['cursor'] = cursor
+            datos = self.client.get(reverse('api_productos'), parametros).json()
+            vistos += [producto['id'] for producto in datos['resultados']]
+            cursor = datos['siguiente']
+            if not cursor:
+                break
+        # Solo los disponibles, por precio
+        self.assertEqual(vistos, [producto.pk for producto in self.productos[:4]])
+        self.assertEqual(self.client.get(reverse('api_productos'), {'cursor': 'manipulado'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('api_productos'), {'limite': 1000}).status_code, 400)
+
+    def test_errores_y_get_condicional(self):
+        self.assertEqual(self.client.get(reverse('api_producto', args=[0])).json(), {'error': 'No existe el producto'})
+        self.assertEqual(self.client.post(reverse('api_productos')).status_code, 405)
+
+        etag = self.client.get(reverse('api_productos'))['ETag']
+        self.assertEqual(self.client.get(reverse('api_productos'), HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+
+_fallos_pendientes = []
+
+
+@cola.tarea('prueba_inestable')
+def _tarea_inestable(valor):
+    if _fallos_pendientes:
+        _fallos_pendientes.pop()
+        raise RuntimeError('fallo simulado')
+
+
+# Miniaturas de las imágenes de productos: archivos, etiqueta <picture> y comando
+class MiniaturasTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.categoria = Categoria.objects.create(nombre='Frutas')
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        configuracion = override_settings(MEDIA_ROOT=directorio.name, IMAGENES_DERIVADAS_AL_GUARDAR=True,
+                                          IMAGENES_ANCHOS=(160, 320, 640), IMAGENES_FORMATOS=('webp', 'jpeg'))
+        configuracion.enable()
+        self.addCleanup(configuracion.disable)
+
+    def crear_producto(self, nombre='Mango', ancho=400, alto=300):
+        from PIL import Image
+
+        contenido = BytesIO()
+        Image.new('RGB', (ancho, alto), 'orange').save(contenido, 'JPEG')
+        return Producto.objects.create(nombre=nombre, precio=Decimal('5'), stock=10, categoria=self.categoria,
+                                       imagen=SimpleUploadedFile(f'{nombre.lower()}.jpg', contenido.getvalue()))
+
+    def archivos(self):
+        storage = Producto._meta.get_field('imagen').storage
+        _, nombres = storage.listdir(imagenes.CARPETA)
+        return {nombre: storage.get_modified_time(f'{imagenes.CARPETA}/{nombre}') for nombre in nombres}
+
+    def test_genera_los_anchos_y_formatos_al_guardar(self):
+        from PIL import Image
+
+        producto = Producto.objects.get(pk=self.crear_producto().pk)
+        storage = producto.imagen.storage
+        # Sin ampliar: el ancho de 640 queda en los 400 del original
+        self.assertEqual(sorted((derivada['ancho'], derivada['formato']) for derivada in producto.derivadas), [
+            (160, 'jpeg'), (160, 'webp'), (320, 'jpeg'), (320, 'webp'), (400, 'jpeg'), (400, 'webp'),
+        ])
+        for derivada in producto.derivadas:
+            with storage.open(derivada['nombre']) as archivo, Image.open(archivo) as miniatura:
+                self.assertEqual(miniatura.format, derivada['formato'].upper())
+                self.assertEqual(miniatura.size, (derivada['ancho'], derivada['alto']))
+        self.assertEqual(len(self.archivos()), 6)
+
+    def test_actualizar_sin_cambios_no_relee_la_imagen(self):
+        producto = Producto.objects.get(pk=self.crear_producto().pk)
+        with mock.patch.object(imagenes, 'generar_derivadas') as generar:
+            self.assertFalse(imagenes.actualizar_derivadas(producto))
+        generar.assert_not_called()
+        # Forzado regenera con el mismo hash: mismos nombres, nada que actualizar
+        self.assertFalse(imagenes.actualizar_derivadas(producto, forzar=True))
+        self.assertEqual(len(self.archivos()), 6)
+
+    def test_etiqueta_con_srcset_y_sizes(self):
+        producto = Producto.objects.get(pk=self.crear_producto().pk)
+        html = Template('{% load imagenes_producto %}{% imagen_producto producto sizes="50vw" clase="img-fluid" %}'
+                        ).render(Context({'producto': producto}))
+        self.assertIn('<source type="image/webp" srcset="', html)
+        self.assertEqual(html.count('sizes="50vw"'), 2)
+        for ancho in (160, 320, 400):
+            self.assertIn(f'-{ancho}w.webp {ancho}w', html)
+            self.assertIn(f'-{ancho}w.jpg {ancho}w', html)
+        self.assertIn('width="400" height="300"', html)
+
+        # Sin miniaturas todavía: la imagen original
+        producto.derivadas = []
+        html = Template('{% load imagenes_producto %}{% imagen_producto producto %}').render(Context({'producto': producto}))
+        self.assertIn(f'src="{producto.imagen.url}"', html)
+        self.assertNotIn('srcset', html)
+
+    def test_comando_idempotente(self):
+        with self.settings(IMAGENES_DERIVADAS_AL_GUARDAR=False):
+            producto = self.crear_producto()
+            faltante = Producto.objects.create(nombre='Lúcuma', precio=Decimal('5'), stock=1, categoria=self.categoria,
+                                               imagen='productos/no-existe.jpg')
+
+        salida, errores = StringIO(), StringIO()
+        call_command('generar_derivadas_imagenes', stdout=salida, stderr=errores)
+        self.assertIn('1 productos procesados, 1 con errores', salida.getvalue())
+        self.assertIn(f'Producto {faltante.pk}', errores.getvalue())
+        producto.refresh_from_db()
+        self.assertEqual(len(producto.derivadas), 6)
+        archivos = self.archivos()
+
+        salida = StringIO()
+        call_command('generar_derivadas_imagenes', stdout=salida, stderr=StringIO())
+        self.assertIn('0 productos procesados, 1 con errores', salida.getvalue())
+        self.assertEqual(self.archivos(), archivos)
+        derivadas = producto.derivadas
+        producto.refresh_from_db()
+        self.assertEqual(producto.derivadas, derivadas)
+
+
+# Paginación por cursor (keyset): empates en el orden, cursores manipulados y bordes de página
+class PaginacionCursorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('cliente', password='clave-segura')
+        categoria = Categoria.objects.create(nombre='Frutas')
+        # Varios precios repetidos: el id desempata
+        Producto.objects.bulk_create([
+            Producto(nombre=f'Fruta {i}', precio=Decimal(precio), stock=5, categoria=categoria)
+            for i, precio in enumerate(('5', '8', '5', '5', '9', '8', '5', '5'))
+        ])
+        cls.orden = list(Producto.objects.order_by('precio', 'id').values_list('id', flat=True))
+
+    def setUp(self):
+        cache.clear()
+
+    def recorrer(self, orden, por_pagina):
+        """Páginas hacia adelante con next_cursor y luego hacia atrás con previous_cursor"""
+        queryset = Producto.objects.all()
+        paginas = [paginar_por_cursor(queryset, orden, por_pagina=por_pagina)]
+        while paginas[-1].has_next():
+            paginas.append(paginar_por_cursor(queryset, orden, paginas[-1].next_cursor, por_pagina))
+        hacia_atras = [paginas[-1]]
+        while hacia_atras[-1].has_previous():
+            hacia_atras.append(paginar_por_cursor(queryset, orden, hacia_atras[-1].previous_cursor, por_pagina))
+        ids = lambda pagina: [producto.id for producto in pagina]
+        return [ids(pagina) for pagina in paginas], [ids(pagina) for pagina in reversed(hacia_atras)]
+
+    def test_adelante_y_atras_con_precios_repetidos(self):
+        for por_pagina in (1, 2, 3, 8):
+            with self.subTest(por_pagina=por_pagina):
+                adelante, atras = self.recorrer(('precio', 'id'), por_pagina)
+                self.assertEqual(sum(adelante, []), self.orden)
+                self.assertEqual(atras, adelante)
+                self.assertTrue(all(len(pagina) == por_pagina for pagina in adelante[:-1]))
+
+    def test_orden_descendente(self):
+        adelante, atras = self.recorrer(('-precio', '-id'), 3)
+        self.assertEqual(sum(adelante, []), list(reversed(self.orden)))
+        self.assertEqual(atras, adelante)
+
+    def test_cursor_manipulado(self):
+        cursor = paginar_por_cursor(Producto.objects.all(), ORDEN_CURSOR, por_pagina=3).next_cursor
+        # Cambiar un carácter de la firma invalida el cursor
+        manipulado = cursor[:-1] + ('A' if cursor[-1] != 'A' else 'B')
+        for invalido in (manipulado, 'basura', signing.dumps({'v': ['5'], 'd': 'next'}, salt='otra')):
+            with self.assertRaises(CursorInvalido):
+                paginar_por_cursor(Producto.objects.all(), ORDEN_CURSOR, invalido, 3)
+
+        # La vista vuelve a la primera página en lugar de fallar
+        respuesta = self.client.get(reverse('productos'), {'cursor': manipulado})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual([producto.id for producto in respuesta.context['page_obj']],
+                         self.orden[:PRODUCTOS_POR_PAGINA])
+        self.assertFalse(respuesta.context['page_obj'].has_previous())
+
+    def pedidos_paginados(self, cursor=''):
+        respuesta = self.client.get(reverse('pedidos'), {'cursor': cursor})
+        return respuesta.context['page_obj']
+
+    def test_bordes_de_pagina_en_pedidos(self):
+        self.client.force_login(self.usuario)
+        Pedido.objects.bulk_create([Pedido(usuario=self.usuario) for _ in range(PEDIDOS_POR_PAGINA)])
+        # Todos con la misma fecha: el orden lo decide el id
+        Pedido.objects.update(fecha_pedido=timezone.now())
+        esperados = list(Pedido.objects.order_by('-id').values_list('id', flat=True))
+
+        pagina = self.pedidos_paginados()
+        self.assertEqual([pedido.id for pedido in pagina], esperados)
+        self.assertFalse(pagina.has_next())
+
+        Pedido.objects.create(usuario=self.usuario)
+        pagina = self.pedidos_paginados()
+        self.assertEqual(len(pagina), PEDIDOS_POR_PAGINA)
+        self.assertTrue(pagina.has_next())
+        siguiente = self.pedidos_paginados(pagina.next_cursor)
+        self.assertEqual([pedido.id for pedido in siguiente], esperados[-1:])
+        self.assertFalse(siguiente.has_next())
+        self.assertEqual([pedido.id for pedido in self.pedidos_paginados(siguiente.previous_cursor)],
+                         [pedido.id for pedido in pagina])
+
+        # Un cursor manipulado vuelve a la primera página
+        self.assertEqual(len(self.pedidos_paginados(pagina.next_cursor[:-3] + 'xyz')), PEDIDOS_POR_PAGINA)
+
+
+# Totales precalculados del pedido (total, item_count), su recálculo y el precio pagado por línea
+class TotalesPedidoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('cliente', password='clave-segura')
+        categoria = Categoria.objects.create(nombre='Frutas')
+        cls.mango, cls.pina = [Producto.objects.create(nombre=nombre, precio=Decimal(precio), stock=50,
+                                                       categoria=categoria)
+                               for nombre, precio in (('Mango', '3.20'), ('Piña', '4.50'))]
+
+    def crear_pedido(self, *lineas):
+        pedido = Pedido.objects.create(usuario=self.usuario)
+        for producto, cantidad in lineas:
+            DetallePedido.objects.create(pedido=pedido, producto=producto, cantidad=cantidad,
+                                         precio_unitario=producto.precio)
+        return pedido
+
+    def totales(self, pedido):
+        return tuple(Pedido.objects.filter(pk=pedido.pk).values_list('total', 'item_count').get())
+
+    def test_detalles_mantienen_los_totales(self):
+        pedido = self.crear_pedido((self.mango, 3), (self.pina, 2))
+        self.assertEqual(self.totales(pedido), (Decimal('18.60'), 5))
+        pedido.detallepedido_set.get(producto=self.mango).delete()
+        self.assertEqual(self.totales(pedido), (Decimal('9.00'), 2))
+
+    def test_borrar_el_pedido_no_recalcula_por_detalle(self):
+        pedido = self.crear_pedido((self.mango, 3), (self.pina, 2))
+        otro = self.crear_pedido((self.mango, 1))
+        with CaptureQueriesContext(connection) as contexto:
+            pedido.delete()
+        sentencias = [consulta['sql'] for consulta in contexto.captured_queries]
+        self.assertFalse([sql for sql in sentencias if sql.startswith('UPDATE "pp2_pedido"') or 'SUM(' in sql])
+        self.assertFalse(DetallePedido.objects.filter(pedido_id=pedido.pk).exists())
+        # Los demás pedidos siguen manteniendo sus totales
+        otro.detallepedido_set.get().delete()
+        self.assertEqual(self.totales(otro), (Decimal('0.00'), 0))
+
+    def test_recalcular_totales_pedidos(self):
+        pedidos = [self.crear_pedido((self.mango, 3), (self.pina, 2)), self.crear_pedido((self.pina, 1)),
+                   self.crear_pedido((self.mango, 1)), self.crear_pedido()]
+        # Totales desalineados, como antes de la migración o tras un update() directo
+        Pedido.objects.filter(pk__in=[pedidos[0].pk, pedidos[1].pk]).update(total=Decimal('0.00'), item_count=0)
+        Pedido.objects.filter(pk=pedidos[3].pk).update(total=Decimal('99.00'), item_count=7)
+
+        salida = StringIO()
+        call_command('recalcular_totales_pedidos', batch_size=2, stdout=salida)
+        self.assertIn('3 pedidos actualizados', salida.getvalue())
+        self.assertEqual([self.totales(pedido) for pedido in pedidos], [
+            (Decimal('18.60'), 5), (Decimal('4.50'), 1), (Decimal('3.20'), 1), (Decimal('0.00'), 0),
+        ])
+
+        salida = StringIO()
+        call_command('recalcular_totales_pedidos', stdout=salida)
+        self.assertIn('0 pedidos actualizados', salida.getvalue())
+
+    def test_cambio_de_precio_no_altera_pedidos_anteriores(self):
+        direccion = DireccionEnvio(nombres='Ana', celular='999', dni='12345678', direccion='Av. Sol 1',
+                                   ciudad='Cusco', distrito='Centro', pais='Perú', correo='ana@example.com')
+        pedido = procesar_compra(self.usuario, direccion, [{'producto_id': self.mango.pk, 'cantidad': 2}])
+        Producto.objects.filter(pk=self.mango.pk).update(precio=Decimal('9.99'))
+        call_command('recalcular_totales_pedidos', stdout=StringIO())
+
+        detalle = DetallePedido.objects.get(pedido=pedido)
+        self.assertEqual((detalle.precio_unitario, detalle.subtotal), (Decimal('3.20'), Decimal('6.40')))
+        self.assertEqual(self.totales(pedido), (Decimal('6.40'), 2))
+        self.client.force_login(self.usuario)
+        respuesta = self.client.get(reverse('detalle_pedido', args=[pedido.pk]))
+        self.assertContains(respuesta, 'S/6.40')
+        self.assertNotContains(respuesta, '9.99')
+
+    def test_migracion_copia_el_precio_vigente(self):
+        migracion = importlib.import_module('pp2.migrations.0009_detallepedido_precio_unitario')
+        pedido = self.crear_pedido((self.mango, 2), (self.pina, 1))
+        DetallePedido.objects.update(precio_unitario=Decimal('0.00'))
+        migracion.copiar_precio_actual(django_apps, None)
+        self.assertEqual(dict(pedido.detallepedido_set.values_list('producto_id', 'precio_unitario')),
+                         {self.mango.pk: Decimal('3.20'), self.pina.pk: Decimal('4.50')})
+
+
+# Listado de pedidos del admin: consultas fijas sin importar cuántos pedidos y detalles haya
+class PedidoAdminTests(TestCase):
+    URL = '/admin/pp2/pedido/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'clave-segura')
+        categoria = Categoria.objects.create(nombre='Frutas')
+        cls.productos = [Producto.objects.create(nombre=f'Fruta {i}', precio=Decimal('2'), stock=50,
+                                                 categoria=categoria) for i in range(6)]
+        cls.clientes = [User.objects.create_user(f'cliente{i}', password='clave-segura') for i in range(3)]
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def crear_pedidos(self, cantidad, lineas):
+        for i in range(cantidad):
+            pedido = Pedido.objects.create(usuario=self.clientes[i % len(self.clientes)])
+            DetallePedido.objects.bulk_create([
+                DetallePedido(pedido=pedido, producto=producto, cantidad=j + 1, precio_unitario=producto.precio)
+                for j, producto in enumerate(self.productos[:lineas])
+            ])
+
+    def test_changelist_en_consultas_fijas(self):
+        # Usuario, COUNT (sin el COUNT total: show_full_result_count), pedidos con su usuario y
+        # detalles con su producto; la sesión está en la caché
+        for parametros, consultas in (('', 4), ('?usuario=cliente1', 4), ('?estado=espera&usuario=cliente1', 4)):
+            with self.subTest(parametros=parametros):
+                Pedido.objects.all().delete()
+                self.crear_pedidos(2, 1)
+                with self.assertNumQueries(consultas):
+                    self.client.get(self.URL + parametros)
+                self.crear_pedidos(12, 6)
+                with self.assertNumQueries(consultas):
+                    respuesta = self.client.get(self.URL + parametros)
+                self.assertEqual(respuesta.status_code, 200)
+
+    def test_columnas_y_filtro_por_usuario(self):
+        self.crear_pedidos(3, 2)
+        respuesta = self.client.get(self.URL, {'usuario': 'cliente1'})
+        pedidos = list(respuesta.context['cl'].result_list)
+        self.assertEqual([pedido.usuario.username for pedido in pedidos], ['cliente1'])
+        self.assertContains(respuesta, 'Fruta 0, Fruta 1')
+        self.assertContains(respuesta, '1, 2')
+
+    def test_totales_no_editables(self):
+        self.crear_pedidos(1, 2)
+        # bulk_create no dispara las señales que mantienen los totales
+        Pedido.objects.get().recalcular_totales()
+        pedido = Pedido.objects.get()
+        direccion = DireccionEnvio.objects.create(usuario=pedido.usuario, nombres='Ana', celular='999', dni='12345678',
+                                                  direccion='Av. Sol 1', ciudad='Cusco', distrito='Centro',
+                                                  pais='Perú', correo='ana@example.com')
+        url = f'{self.URL}{pedido.pk}/change/'
+        formulario = self.client.get(url).context['adminform'].form
+        self.assertFalse({'total', 'item_count', 'descuento', 'cupon'} & set(formulario.fields))
+
+        respuesta = self.client.post(url, {
+            'usuario': pedido.usuario_id, 'direccion_envio': direccion.pk,
+            'estado': 'aceptado', 'total': '1.00', 'item_count': 99, 'descuento': '5.00',
+        })
+        self.assertEqual(respuesta.status_code, 302)
+        pedido.refresh_from_db()
+        self.assertEqual((pedido.estado, pedido.total, pedido.item_count, pedido.descuento),
+                         ('aceptado', Decimal('6.00'), 3, Decimal('0.00')))
+
+
+# Checkout: todo o nada y sin sobreventa
+class CheckoutTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('cliente', password='clave-segura')
+        categoria = Categoria.objects.create(nombre='Frutas Tropicales')
+        cls.pina, cls.coco, cls.maracuya = [
+            Producto.objects.create(nombre=nombre, precio=Decimal('4'), stock=stock, categoria=categoria)
+            for nombre, stock in (('Piña', 10), ('Coco', 1), ('Maracuyá', 3))
+        ]
+
+    def comprar(self, *lineas):
+        direccion = DireccionEnvio(nombres='Ana', celular='999', dni='12345678', direccion='Av. Sol 1',
+                                   ciudad='Cusco', distrito='Centro', pais='Perú', correo='ana@example.com')
+        carrito = [{'producto_id': producto_id, 'cantidad': cantidad} for producto_id, cantidad in lineas]
+        return procesar_compra(self.usuario, direccion, carrito)
+
+    def stocks(self):
+        return dict(Producto.objects.values_list('id', 'stock'))
+
+    def assertSinPedidos(self):
+        self.assertFalse(Pedido.objects.exists())
+        self.assertFalse(DetallePedido.objects.exists())
+
+    def test_un_producto_corto_no_descuenta_nada(self):
+        antes = self.stocks()
+        with self.assertRaises(StockInsuficiente) as contexto:
+            self.comprar((self.pina.pk, 2), (self.coco.pk, 2), (self.maracuya.pk, 1))
+        self.assertEqual(contexto.exception.productos, [self.coco])
+        self.assertIn('Coco', str(contexto.exception))
+        self.assertEqual(self.stocks(), antes)
+        self.assertSinPedidos()
+
+    def test_producto_eliminado_se_nombra_en_el_error(self):
+        eliminado = Producto.objects.create(nombre='Tuna', precio=Decimal('2'), stock=5,
+                                            categoria=self.pina.categoria)
+        eliminado_id = eliminado.pk
+        eliminado.delete()
+        with self.assertRaises(StockInsuficiente) as contexto:
+            self.comprar((self.pina.pk, 1), (eliminado_id, 1))
+        self.assertEqual(contexto.exception.inexistentes, [eliminado_id])
+        self.assertIn(f'id: {eliminado_id}', str(contexto.exception))
+        self.assertEqual(self.stocks()[self.pina.pk], 10)
+        self.assertSinPedidos()
+
+    def test_sin_sobreventa_en_compras_sucesivas(self):
+        self.comprar((self.maracuya.pk, 2))
+        with self.assertRaises(StockInsuficiente):
+            self.comprar((self.maracuya.pk, 2))
+        self.assertEqual(Producto.objects.get(pk=self.maracuya.pk).stock, 1)
+        self.assertEqual(Pedido.objects.count(), 1)
+
+    def test_lectura_bloquea_las_filas(self):
+        with mock.patch.object(QuerySet, 'select_for_update', autospec=True,
+                               side_effect=QuerySet.select_for_update) as bloqueo:
+            self.comprar((self.pina.pk, 1))
+        bloqueo.assert_called_once()
+
+    def test_update_condicional_frena_una_compra_que_se_adelanta(self):
+        # Otra compra se lleva el stock entre la lectura de precios y el UPDATE: donde
+        # FOR UPDATE no bloquea (SQLite), el UPDATE condicional evita la sobreventa
+        original = checkout._por_producto
+
+        def compra_concurrente(cantidades):
+            Producto.objects.filter(pk=self.maracuya.pk).update(stock=1)
+            return original(cantidades)
+
+        with mock.patch.object(checkout, '_por_producto', side_effect=compra_concurrente):
+            with self.assertRaises(StockInsuficiente):
+                self.comprar((self.pina.pk, 1), (self.maracuya.pk, 2))
+        self.assertEqual(self.stocks()[self.pina.pk], 10)
+        self.assertSinPedidos()
+
+
+# Resúmenes de ventas: lo mantenido pedido a pedido coincide con recalcularlo desde cero
+class ResumenVentasTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('cliente', password='clave-segura')
+        frutas, jugos = Categoria.objects.create(nombre='Frutas'), Categoria.objects.create(nombre='Jugos')
+        cls.pina, cls.mango, cls.jugo = [
+            Producto.objects.create(nombre=nombre, precio=precio, stock=50, categoria=categoria)
+            for nombre, precio, categoria in (
+                ('Piña', Decimal('4.50'), frutas), ('Mango', Decimal('3.20'), frutas), ('Jugo', Decimal('7'), jugos),
+            )
+        ]
+
+    def comprar(self, *lineas):
+        direccion = DireccionEnvio(nombres='Ana', celular='999', dni='12345678', direccion='Av. Sol 1',
+                                   ciudad='Cusco', distrito='Centro', pais='Perú', correo='ana@example.com')
+        return procesar_compra(self.usuario, direccion, [
+            {'producto_id': producto.pk, 'cantidad': cantidad} for producto, cantidad in lineas
+        ])
+
+    def resumenes(self):
+        # Las filas que quedaron en cero tras mover o borrar pedidos no cuentan: reconstruir no las crea
+        campos = ('fecha', 'estado', 'unidades', 'ingresos', 'pedidos')
+        return {
+            modelo.__name__: sorted(
+                modelo.objects.exclude(pedidos=0).values_list(*extra, *campos)
+            )
+            for modelo, extra in ((VentaDiaria, ()), (VentaDiariaProducto, ('producto_id',)),
+                                  (VentaDiariaCategoria, ('categoria_id',)))
+        }
+
+    def test_incremental_igual_a_reconstruir(self):
+        with mock.patch('django.utils.timezone.now', return_value=timezone.now() - timedelta(days=1)):
+            de_ayer = self.comprar((self.pina, 2), (self.jugo, 1))
+            self.comprar((self.mango, 5))
+        aceptado = self.comprar((self.pina, 1), (self.mango, 2))
+        cancelado = self.comprar((self.jugo, 3))
+        borrado = self.comprar((self.pina, 4), (self.jugo, 2))
+        movido_y_borrado = self.comprar((self.mango, 1))
+
+        for pedido, estados in ((de_ayer, ('aceptado', 'en_camino')), (aceptado, ('aceptado',)),
+                                (cancelado, ('cancelado',)), (movido_y_borrado, ('en_camino',))):
+            for estado in estados:
+                pedido.estado = estado
+                pedido.save()
+        borrado.delete()
+        Pedido.objects.get(pk=movido_y_borrado.pk).delete()
+
+        incremental = self.resumenes()
+        self.assertEqual(len({fila[0] for fila in incremental['VentaDiaria']}), 2)
+        self.assertIn('cancelado', {fila[1] for fila in incremental['VentaDiaria']})
+        analitica.reconstruir()
+        self.assertEqual(self.resumenes(), incremental)
+
+
+# Importación del catálogo: upsert por nombre, simulación y errores por fila
+class ImportacionCatalogoTests(TestCase):
+    CSV = (
+        'nombre,categoria,precio,stock,disponible,descripcion\n'
+        'Mango,,4.5,,,\n'                               # 2: actualiza precio
+        'Kiwi,Exóticas,6,12,si,Verde por dentro\n'      # 3: nuevo, con categoría nueva
+        'Piña,Frutas,,3,,\n'                            # 4: nuevo sin precio
+        'Fresa,Frutas,2,muchas,,\n'                     # 5: stock inválido
+        ',Frutas,1,1,,\n'                               # 6: sin nombre
+        'Palta,,9,,,\n'                                 # 7: hay dos Palta
+        'Uva,Frutas,5,8,,Negra\n'                       # 8: igual a la actual
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.frutas = Categoria.objects.create(nombre='Frutas')
+        cls.mango, cls.uva, *cls.paltas = [
+            Producto.objects.create(nombre=nombre, descripcion=descripcion, precio=Decimal(precio), stock=stock,
+                                    categoria=cls.frutas)
+            for nombre, descripcion, precio, stock in (
+                ('Mango', '', '3', 5), ('Uva', 'Negra', '5', 8), ('Palta', 'Fuerte', '8', 2), ('Palta', 'Hass', '8', 2),
+            )
+        ]
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.ruta = os.path.join(directorio.name, 'catalogo.csv')
+        with open(self.ruta, 'w', encoding='utf-8') as archivo:
+            archivo.write(self.CSV)
+
+    def importar(self, **opciones):
+        salida, errores = StringIO(), StringIO()
+        call_command('importar_catalogo', self.ruta, stdout=salida, stderr=errores, **opciones)
+        return salida.getvalue(), errores.getvalue()
+
+    def test_upsert_por_nombre(self):
+        salida, errores = self.importar()
+        self.assertIn('1 creados, 1 actualizados, 1 sin cambios, 4 con errores', salida)
+
+        self.mango.refresh_from_db()
+        self.assertEqual((self.mango.precio, self.mango.stock), (Decimal('4.50'), 5))
+        kiwi = Producto.objects.get(nombre='Kiwi')
+        self.assertEqual((kiwi.categoria.nombre, kiwi.precio, kiwi.stock, kiwi.disponible),
+                         ('Exóticas', Decimal('6.00'), 12, True))
+        self.assertEqual(busqueda.buscar_ids('verde'), [kiwi.pk])
+        self.assertFalse(Producto.objects.filter(nombre__in=['Piña', 'Fresa']).exists())
+        self.assertEqual(sorted(Producto.objects.filter(nombre='Palta').values_list('precio', flat=True)),
+                         [Decimal('8.00')] * 2)
+
+    def test_errores_por_fila(self):
+        _, errores = self.importar()
+        lineas = errores.splitlines()
+        self.assertEqual([linea.split(':')[0] for linea in lineas],
+                         ['Línea 4', 'Línea 5', 'Línea 6', 'Línea 7'])
+        self.assertIn('necesita precio y categoría', lineas[0])
+        self.assertIn('valor numérico inválido', lineas[1])
+        self.assertIn('falta el nombre', lineas[2])
+        self.assertIn('hay varios productos llamados "Palta"', lineas[3])
+
+    def test_simulacion_no_guarda_nada(self):
+        antes = list(Producto.objects.order_by('id').values_list('nombre', 'precio', 'stock', 'actualizado'))
+        salida, _ = self.importar(dry_run=True)
+        self.assertIn('[simulación] 1 creados, 1 actualizados', salida)
+        self.assertIn('~ Mango: precio 3.00 -> 4.50', salida)
+        self.assertIn('+ Kiwi', salida)
+        self.assertEqual(list(Producto.objects.order_by('id').values_list('nombre', 'precio', 'stock', 'actualizado')),
+                         antes)
+        self.assertFalse(Categoria.objects.filter(nombre='Exóticas').exists())
+
+    def test_categoria_repetida_es_un_error(self):
+        Categoria.objects.create(nombre='Frutas')
+        importador = ImportadorCatalogo().importar([(2, {'nombre': 'Lima', 'categoria': 'Frutas', 'precio': '1'})])
+        self.assertEqual(importador.errores, [(2, 'hay varias categorías llamadas "Frutas"')])
+        self.assertFalse(Producto.objects.filter(nombre='Lima').exists())
+
+    def test_jsonl_con_linea_invalida(self):
+        ruta = self.ruta.replace('.csv', '.jsonl')
+        with open(ruta, 'w', encoding='utf-8') as archivo:
+            archivo.write('{"nombre": "Uva", "stock": 20}\n{roto\n')
+        importador = ImportadorCatalogo().importar(leer_filas(ruta))
+        self.assertEqual((importador.actualizados, [numero for numero, _ in importador.errores]), (1, [2]))
+        self.assertEqual(Producto.objects.get(pk=self.uva.pk).stock, 20)
+
+
+# Exportación de pedidos: CSV/JSON Lines, filtros, vista en streaming y comando
+class ExportacionPedidosTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.personal = User.objects.create_user('operaciones', password='clave-segura', is_staff=True)
+        cliente = User.objects.create_user('cliente', password='clave-segura')
+        categoria = Categoria.objects.create(nombre='Frutas')
+        mango, pina = [Producto.objects.create(nombre=nombre, precio=Decimal('4'), stock=10, categoria=categoria)
+                       for nombre in ('Mango', 'Piña')]
+        direccion = DireccionEnvio.objects.create(usuario=cliente, nombres='Ana', celular='999', dni='12345678',
+                                                  direccion='Av. Sol 1', ciudad='Cusco', distrito='Centro',
+                                                  pais='Perú', correo='ana@example.com')
+        cls.pedidos = []
+        for fecha, estado, lineas in (
+            (datetime(2024, 1, 10, 9, 0), 'espera', [(mango, 2, '4.00'), (pina, 1, '6.50')]),
+            (datetime(2024, 1, 15, 23, 30), 'aceptado', [(mango, 3, '3.50')]),
+            (datetime(2024, 1, 20, 12, 0), 'cancelado', []),
+        ):
+            pedido = Pedido.objects.create(usuario=cliente, estado=estado, direccion_envio=direccion)
+            for producto, cantidad, precio in lineas:
+                DetallePedido.objects.create(pedido=pedido, producto=producto, cantidad=cantidad,
+                                             precio_unitario=Decimal(precio))
+            Pedido.objects.filter(pk=pedido.pk).update(fecha_pedido=timezone.make_aware(fecha))
+            cls.pedidos.append(pedido)
+
+    def ids(self, **filtros):
+        return list(filtrar_pedidos(**filtros).values_list('id', flat=True))
+
+    def test_csv_una_fila_por_detalle(self):
+        filas = list(csv.reader(''.join(exportacion.exportar(filtrar_pedidos(), 'csv', chunk_size=2)).splitlines()))
+        self.assertEqual(filas[0], exportacion.COLUMNAS_CSV)
+        columnas = [dict(zip(filas[0], fila)) for fila in filas[1:]]
+        self.assertEqual([(fila['pedido_id'], fila['producto'], fila['subtotal']) for fila in columnas], [
+            (str(self.pedidos[0].pk), 'Mango', '8.00'), (str(self.pedidos[0].pk), 'Piña', '6.50'),
+            (str(self.pedidos[1].pk), 'Mango', '10.50'), (str(self.pedidos[2].pk), '', ''),
+        ])
+        self.assertEqual((columnas[0]['total'], columnas[0]['item_count'], columnas[0]['ciudad']), ('14.50', '3', 'Cusco'))
+
+    def test_jsonl_un_objeto_por_pedido(self):
+        objetos = [json.loads(linea) for linea in exportacion.exportar(filtrar_pedidos(), 'jsonl', chunk_size=2)]
+        self.assertEqual([objeto['pedido_id'] for objeto in objetos], [pedido.pk for pedido in self.pedidos])
+        self.assertEqual([len(objeto['detalles']) for objeto in objetos], [2, 1, 0])
+        self.assertEqual(objetos[1]['detalles'][0], {
+            'producto_id': objetos[1]['detalles'][0]['producto_id'], 'producto': 'Mango',
+            'cantidad': 3, 'precio_unitario': '3.50', 'subtotal': '10.50',
+        })
+        self.assertEqual(objetos[0]['direccion_envio']['correo'], 'ana@example.com')
+
+    def test_filtros(self):
+        primero, segundo, tercero = (pedido.pk for pedido in self.pedidos)
+        self.assertEqual(self.ids(desde=date(2024, 1, 15)), [segundo, tercero])
+        # `hasta` incluye todo el día
+        self.assertEqual(self.ids(hasta=date(2024, 1, 15)), [primero, segundo])
+        self.assertEqual(self.ids(desde=date(2024, 1, 11), hasta=date(2024, 1, 19)), [segundo])
+        self.assertEqual(self.ids(estado='cancelado'), [tercero])
+        self.assertEqual(self.ids(despues_de=primero), [segundo, tercero])
+        self.assertEqual(self.ids(despues_de=primero, estado='espera'), [])
+
+    def test_vista_en_streaming(self):
+        self.client.force_login(self.personal)
+        respuesta = self.client.get(reverse('exportar_pedidos'), {
+            'formato': 'jsonl', 'desde': '2024-01-12', 'estado': 'aceptado',
+        })
+        self.assertIsInstance(respuesta, StreamingHttpResponse)
+        self.assertEqual(respuesta['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        self.assertIn('pedidos.jsonl', respuesta['Content-Disposition'])
+        lineas = b''.join(respuesta.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(linea)['pedido_id'] for linea in lineas], [self.pedidos[1].pk])
+
+        respuesta = self.client.get(reverse('exportar_pedidos'), {'despues_de': self.pedidos[1].pk})
+        self.assertEqual(respuesta['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(len(b''.join(respuesta.streaming_content).decode().splitlines()), 2)
+
+    def test_vista_parametros_invalidos(self):
+        self.client.force_login(self.personal)
+        for parametros in ({'formato': 'xlsx'}, {'despues_de': 'abc'}, {'desde': '2024-13-01'},
+                           {'desde': 'ayer'}, {'hasta': '10/01/2024'}, {'estado': 'perdido'}):
+            with self.subTest(parametros=parametros):
+                self.assertEqual(self.client.get(reverse('exportar_pedidos'), parametros).status_code, 400)
+
+    def test_vista_solo_para_el_personal(self):
+        self.assertEqual(self.client.get(reverse('exportar_pedidos')).status_code, 302)
+
+    def test_comando_reanuda_sin_repetir_la_cabecera(self):
+        salida, avisos = StringIO(), StringIO()
+        call_command('exportar_pedidos', formato='jsonl', estado='espera', stdout=salida, stderr=avisos)
+        self.assertEqual([json.loads(linea)['pedido_id'] for linea in salida.getvalue().splitlines()],
+                         [self.pedidos[0].pk])
+        self.assertIn(f'--despues-de {self.pedidos[0].pk}', avisos.getvalue())
+
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        ruta = os.path.join(directorio.name, 'pedidos.csv')
+        call_command('exportar_pedidos', hasta=date(2024, 1, 10), salida=ruta, stderr=StringIO())
+        call_command('exportar_pedidos', despues_de=self.pedidos[0].pk, salida=ruta, stderr=StringIO())
+        with open(ruta, newline='', encoding='utf-8') as archivo:
+            filas = list(csv.reader(archivo))
+        self.assertEqual([fila[0] for fila in filas], ['pedido_id'] + [str(self.pedidos[0].pk)] * 2
+                         + [str(self.pedidos[1].pk), str(self.pedidos[2].pk)])
+
+    def test_comando_informa_el_ultimo_pedido_escrito(self):
+        # Un pedido confirmado mientras se exporta no se da por exportado
+        filas = exportacion.exportar
+
+        def exportar_con_pedido_nuevo(*args, **kwargs):
+            yield from filas(*args, **kwargs)
+            Pedido.objects.create(usuario=self.pedidos[0].usuario)
+
+        avisos = StringIO()
+        with mock.patch('pp2.management.commands.exportar_pedidos.exportar', exportar_con_pedido_nuevo):
+            call_command('exportar_pedidos', formato='jsonl', stdout=StringIO(), stderr=avisos)
+        self.assertTrue(Pedido.objects.filter(pk__gt=self.pedidos[2].pk).exists())
+        self.assertIn(f'Último pedido exportado: {self.pedidos[2].pk} ', avisos.getvalue())
+
+        progreso = exportacion.ProgresoExportacion()
+        filas_csv = exportacion.exportar(filtrar_pedidos(), 'csv', 2, progreso)
+        next(filas_csv), next(filas_csv), next(filas_csv)
+        # Cabecera y las dos filas del primer pedido: aún no se pidió nada más allá de él
+        self.assertIsNone(progreso.ultimo_id)
+        next(filas_csv)
+        self.assertEqual(progreso.ultimo_id, self.pedidos[0].pk)
+
+
+# Cola de tareas: encolado dentro del checkout, reintentos con espera e idempotencia
+@override_settings(ADMINS=[('Operaciones', 'ops@example.com')], STOCK_ALERTA_UMBRAL=5)
+class ColaTareasTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('cliente', password='clave-segura')
+        cls.producto = Producto.objects.create(nombre='Lúcuma', precio=Decimal('9'), stock=7,
+                                               categoria=Categoria.objects.create(nombre='Frutas Andinas'))
+
+    def comprar(self, cantidad):
+        direccion = DireccionEnvio(nombres='Ana', celular='999', dni='12345678', direccion='Av. Sol 1',
+                                   ciudad='Cusco', distrito='Centro', pais='Perú', correo='ana@example.com')
+        return procesar_compra(self.usuario, direccion, [{'producto_id': self.producto.pk, 'cantidad': cantidad}])
+
+    def test_checkout_encola_y_el_trabajador_ejecuta(self):
+        pedido = self.comprar(3)
+        self.assertEqual(sorted(Tarea.objects.values_list('tipo', flat=True)), ['alerta_stock', 'confirmacion_pedido'])
+        self.assertEqual(mail.outbox, [])
+
+        call_command('procesar_tareas', una_vez=True, stdout=StringIO())
+        self.assertEqual(set(Tarea.objects.values_list('estado', flat=True)), {'completada'})
+        confirmacion, alerta = sorted(mail.outbox, key=lambda correo: correo.to)
+        self.assertEqual(confirmacion.to, ['ana@example.com'])
+        self.assertIn(f'pedido #{pedido.pk}', confirmacion.body)
+        self.assertIn('Lúcuma (id', alerta.body)
+
+    def test_compra_revertida_no_deja_tareas(self):
+        with self.assertRaises(StockInsuficiente):
+            self.comprar(100)
+        self.assertFalse(Tarea.objects.exists())
+
+    def test_clave_de_idempotencia(self):
+        cola.encolar(Tarea(tipo='prueba_inestable', datos={'valor': 1}, clave='unica'))
+        cola.encolar(Tarea(tipo='prueba_inestable', datos={'valor': 2}, clave='unica'),
+                     Tarea(tipo='prueba_inestable', datos={'valor': 3}))
+        self.assertEqual(sorted(Tarea.objects.values_list('datos__valor', flat=True)), [1, 3])
+        with self.assertRaises(cola.TareaDesconocida):
+            cola.encolar(Tarea(tipo='no_existe'))
+
+    def test_reintentos_con_espera_creciente(self):
+        _fallos_pendientes[:] = [1, 1]
+        cola.encolar(Tarea(tipo='prueba_inestable', datos={'valor': 1}, max_intentos=2))
+        self.assertEqual(cola.procesar(), (0, 1))
+        tarea = Tarea.objects.get()
+        self.assertEqual((tarea.estado, tarea.intentos), ('pendiente', 1))
+        self.assertIn('fallo simulado', tarea.ultimo_error)
+        self.assertGreater(tarea.disponible_desde, timezone.now())
+        # Todavía en espera
+        self.assertEqual(cola.procesar(), (0, 0))
+
+        Tarea.objects.update(disponible_desde=timezone.now())
+        self.assertEqual(cola.procesar(), (0, 1))
+        self.assertEqual(Tarea.objects.get().estado, 'fallida')
+        self.assertLess(cola.espera_reintento(1), cola.espera_reintento(3))
+
+    def test_bloqueo_vencido_se_retoma(self):
+        _fallos_pendientes[:] = []
+        cola.encolar(Tarea(tipo='prueba_inestable', datos={'valor': 1}))
+        abandonada = cola.tomar()[0]
+        self.assertEqual(cola.tomar(), [])
+
+        # El trabajador murió: al vencer el bloqueo otro la toma y la termina
+        Tarea.objects.update(disponible_desde=timezone.now())
+        retomada = cola.tomar()[0]
+        self.assertTrue(cola.ejecutar(retomada))
+        # Si el primero termina tarde no pisa el resultado del segundo
+        _fallos_pendientes[:] = [1]
+        cola.ejecutar(abandonada)
+        tarea = Tarea.objects.get()
+        self.assertEqual((tarea.estado, tarea.intentos, tarea.lote), ('completada', 2, retomada.lote))
+
+    def test_bloqueo_vencido_sin_intentos_queda_fallida(self):
+        cola.encolar(Tarea(tipo='prueba_inestable', datos={'valor': 1}, max_intentos=2),
+                     Tarea(tipo='prueba_inestable', datos={'valor': 2}, max_intentos=2))
+        for _ in range(2):
+            # Cada trabajador muere sin llegar a ejecutar(): solo vence el bloqueo
+            self.assertEqual(len(cola.tomar()), 2)
+            Tarea.objects.update(disponible_desde=timezone.now())
+        Tarea.objects.filter(datos__valor=2).update(max_intentos=3)
+
+        retomadas = cola.tomar()
+        self.assertEqual([tarea.datos['valor'] for tarea in retomadas], [2])
+        agotada = Tarea.objects.get(datos__valor=1)
+        self.assertEqual((agotada.estado, agotada.intentos), ('fallida', 2))
+        self.assertIsNotNone(agotada.terminada)
+        self.assertIn('bloqueo venció', agotada.ultimo_error)
+
+
+# Cupones: aplicar en el carrito, canjear al comprar y agotar max_usos
+class CuponesTests(TestCase):
+    DIRECCION = {'nombres': 'Ana', 'celular': '999', 'dni': '12345678', 'direccion': 'Av. Sol 1',
+                 'ciudad': 'Cusco', 'distrito': 'Centro', 'pais': 'Perú', 'correo': 'ana@example.com'}
+
+    @classmethod
+    def setUpTestData(cls):
+        hoy = timezone.localdate()
+        cls.cupon = Cupon.objects.create(codigo='FRUTA10', descuento=Decimal('10'),
+                                         valido_desde=hoy, valido_hasta=hoy, max_usos=1)
+        cls.usuario = User.objects.create_user('cliente', password='clave-segura')
+        cls.producto = Producto.objects.create(nombre='Pitahaya', precio=Decimal('10'), stock=10,
+                                               categoria=Categoria.objects.create(nombre='Frutas de la Selva'))
+
+    def setUp(self):
+        cache.clear()
+        # Descarta los cupones que otra prueba dejó en la memoria del proceso
+        cupones.invalidar_cupones()
+        self.client.force_login(self.usuario)
+        carrito = Carrito.objects.create(usuario=self.usuario)
+        CarritoItem.objects.create(carrito=carrito, producto=self.producto, cantidad=3)
+        sesion = self.client.session
+        sesion['carrito_id'] = carrito.pk
+        sesion.save()
+
+    def test_aplicar_canjear_y_agotar(self):
+        self.assertContains(self.client.post(reverse('ver_carrito'), {'codigo': 'NOEXISTE'}), 'no es válido')
+        self.assertRedirects(self.client.post(reverse('ver_carrito'), {'codigo': ' fruta10 '}), reverse('ver_carrito'))
+        respuesta = self.client.get(reverse('ver_carrito'))
+        self.assertContains(respuesta, 'Descuento: -S/3.00')
+        self.assertContains(respuesta, 'S/27.00')
+
+        self.assertRedirects(self.client.post(reverse('finalizar_compra'), self.DIRECCION), reverse('mi_cuenta'),
+                             fetch_redirect_response=False)
+        pedido = Pedido.objects.get()
+        self.assertEqual((pedido.cupon_id, pedido.descuento, pedido.total_a_pagar),
+                         (self.cupon.pk, Decimal('3.00'), Decimal('27.00')))
+        self.cupon.refresh_from_db()
+        self.assertEqual(self.cupon.usos, 1)
+
+        # max_usos alcanzado: no se puede volver a canjear ni se ofrece en el carrito
+        with self.assertRaises(cupones.CuponInvalido):
+            cupones.canjear_cupon(cupones.CuponVigente(self.cupon.pk, 'FRUTA10', Decimal('10'), 1))
+        with self.assertRaises(cupones.CuponInvalido):
+            cupones.buscar_cupon('FRUTA10')
+
+    def test_agotarlo_al_comprar_lo_retira_del_cache(self):
+        self.client.post(reverse('ver_carrito'), {'codigo': 'FRUTA10'})
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.client.post(reverse('finalizar_compra'), self.DIRECCION)
+        self.assertIn(cupones.invalidar_cupones, callbacks)
+        # Sin esperar a un canje fallido: el siguiente cliente ya no lo ve
+        with self.assertRaises(cupones.CuponInvalido):
+            cupones.buscar_cupon('FRUTA10')
+
+    def test_sin_max_usos_no_invalida(self):
+        Cupon.objects.filter(pk=self.cupon.pk).update(max_usos=None)
+        cupones.invalidar_cupones()
+        with self.captureOnCommitCallbacks() as callbacks:
+            cupones.canjear_cupon(cupones.buscar_cupon('FRUTA10'))
+        self.assertNotIn(cupones.invalidar_cupones, callbacks)
+
+    def test_recarga_periodica_sin_cache_compartido(self):
+        # Otro proceso desactiva el cupón: con LocMem la versión de este no cambia
+        cupones.buscar_cupon('FRUTA10')
+        Cupon.objects.filter(pk=self.cupon.pk).update(valido_hasta=timezone.localdate() - timedelta(days=1))
+        self.assertEqual(cupones.buscar_cupon('FRUTA10').id, self.cupon.pk)
+        despues = time.monotonic() + 61
+        with mock.patch('pp2.cupones.time.monotonic', return_value=despues):
+            with self.assertRaises(cupones.CuponInvalido):
+                cupones.buscar_cupon('FRUTA10')
+
+    def test_codigo_sin_distinguir_mayusculas(self):
+        hoy = timezone.localdate()
+        datos = {'descuento': Decimal('5'), 'valido_desde': hoy, 'valido_hasta': hoy}
+        self.assertEqual(Cupon.objects.create(codigo=' verano5 ', **datos).codigo, 'VERANO5')
+        with self.assertRaises(ValidationError) as contexto:
+            Cupon(codigo='Fruta10', **datos).full_clean()
+        self.assertIn('codigo', contexto.exception.message_dict)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Cupon.objects.create(codigo='fruta10', **datos)
+
+    def test_migracion_pasa_los_codigos_a_mayusculas(self):
+        hoy = timezone.localdate()
+        datos = {'descuento': Decimal('5'), 'valido_desde': hoy, 'valido_hasta': hoy}
+        # bulk_create no pasa por save(): como los datos anteriores a la migración
+        Cupon.objects.bulk_create([Cupon(codigo='fruta10', **datos), Cupon(codigo=' otro ', **datos)])
+        minuscula = Cupon.objects.get(codigo='fruta10')
+        migracion = importlib.import_module('pp2.migrations.0019_cupon_codigo_mayusculas')
+        migracion.codigos_en_mayusculas(django_apps, None)
+        self.assertEqual(dict(Cupon.objects.values_list('codigo', 'descuento')), {
+            'FRUTA10': Decimal('10.00'), f'FRUTA10-{minuscula.pk}': Decimal('5.00'), 'OTRO': Decimal('5.00'),
+        })
@@ -1,43 +1,87 @@
 from itertools import product
-from django.http import HttpResponse, JsonResponse
+from django.http import HttpResponse, HttpResponseBadRequest, JsonResponse
 from django.template import loader
 from django.shortcuts import render, get_object_or_404, redirect
 from django.views.generic import ListView, DetailView
 from django.contrib.auth.models import User
 from django.contrib.auth.decorators import login_required
+from django.views.decorators.http import require_POST
+from django.contrib import admin
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.forms import AuthenticationForm
 from django.core.paginator import Paginator
+from django.conf import settings
+from django.utils.dateparse import parse_date
 from .models import Producto, Categoria, Pedido, DetallePedido
+from .checkout import procesar_compra, StockInsuficiente
+from .cupones import CuponInvalido
+from .cache_catalogo import pagina_productos, pagina_productos_cursor, version_catalogo, estadisticas as estadisticas_cache_catalogo
+from .paginacion import paginar_por_cursor, CursorInvalido
+from .middleware import registro_metricas
+from .analitica import panel as panel_analitica
+from .bases_de_datos import lectura_en_replica
+from .condicional import condicional, validadores_catalogo, validadores_producto
+from .exportacion import FORMATOS as FORMATOS_EXPORTACION, filtrar_pedidos, respuesta_exportacion
+from .carrito import CarritoCompras, cotizar_carrito, fusionar_carrito_anonimo, CLAVE_SESION as CLAVE_SESION_CARRITO
 from .forms import RegistroUsuarioForm, PedidoForm, DireccionEnvioForm, ClienteForm, DetallePedidoForm
 
+PEDIDOS_POR_PAGINA = 20
+CANTIDAD_INVALIDA = 'La cantidad debe ser un número entero mayor que cero'
+
+
+def usa_paginacion_por_cursor(request):
+    """La paginación por cursor se activa con ?cursor= o con PAGINACION_POR_CURSOR"""
+    return 'cursor' in request.GET or getattr(settings, 'PAGINACION_POR_CURSOR', False)
+
 # Vista para la página de inicio
+@lectura_en_replica
 def inicio(request):
     productos_destacados = Producto.objects.filter(disponible=True)[:4]  # Ejemplo de productos destacados
     return render(request, 'inicio.html', {'productos_destacados': productos_destacados})
 
 # Vista para la página de productos
+@lectura_en_replica
+@condicional(validadores_catalogo)
 def productos(request):
-    productos = Producto.objects.filter(disponible=True)
+    return render(request, 'productos.html', contexto_productos(request))
 
-    # Filtrar por categoría
+# Página del catálogo según los filtros del request (compartida con pp2/vistas_async.py)
+def contexto_productos(request):
     categoria = request.GET.get('categoria')
-    if categoria:
-        productos = productos.filter(categoria__nombre=categoria)
-
-    # Filtrar por precio
     precio = request.GET.get('precio')
-    if precio:
-        productos = productos.filter(precio__lte=precio)
-
-    # Paginación: 12 productos por página
-    paginator = Paginator(productos, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-
-    return render(request, 'productos.html', {'page_obj': page_obj})
+    # Búsqueda de texto (sin tildes ni mayúsculas, por prefijo)
+    q = request.GET.get('q', '').strip()
+
+    # Paginación por cursor (opcional): ?cursor= o PAGINACION_POR_CURSOR en settings
+    if usa_paginacion_por_cursor(request):
+        try:
+            page_obj = pagina_productos_cursor(categoria, precio, request.GET.get('cursor'), q)
+        except CursorInvalido:
+            page_obj = pagina_productos_cursor(categoria, precio, q=q)
+        return dict(contexto_grilla(page_obj), paginacion_cursor=True)
+
+    # Filtros por categoría y precio, paginación de 12 productos por página (con caché)
+    page_obj = pagina_productos(
+        categoria=categoria,
+        precio=precio,
+        page_number=request.GET.get('page'),
+        q=q,
+    )
+    return contexto_grilla(page_obj)
+
+
+# Clave del fragmento en caché de la grilla: productos de la página y versión del catálogo
+def contexto_grilla(page_obj):
+    return {
+        'page_obj': page_obj,
+        'ids_productos': [producto.id for producto in page_obj],
+        'version_catalogo': version_catalogo(),
+    }
 
 # Vista para ver los detalles de un producto
+@lectura_en_replica
+@condicional(validadores_producto)
 def detalle_producto(request, producto_id):
     producto = get_object_or_404(Producto, id=producto_id)
     return render(request, 'detalle_producto.html', {'producto': producto})
@@ -50,7 +94,9 @@ def registro(request):
             user = form.save(commit=False)
             user.set_password(form.cleaned_data['password'])
             user.save()
+            carrito_anonimo_id = request.session.get(CLAVE_SESION_CARRITO)
             login(request, user)
+            fusionar_carrito_anonimo(request, carrito_anonimo_id)
             return redirect('inicio')
     else:
         form = RegistroUsuarioForm()
@@ -65,7 +111,11 @@ def login_view(request):
             password = form.cleaned_data.get('password')
             user = authenticate(username=username, password=password)
             if user is not None:
+                carrito_anonimo_id = request.session.get(CLAVE_SESION_CARRITO)
                 login(request, user)
+
+                # Los productos agregados sin sesión pasan al carrito del usuario
+                fusionar_carrito_anonimo(request, carrito_anonimo_id)
                 
                 # Redirigir al carrito si es que estaba intentando realizar una compra
                 next_url = request.GET.get('next', 'inicio')
@@ -74,62 +124,64 @@ def login_view(request):
         form = AuthenticationForm()
     return render(request, 'login.html', {'form': form})
 
-# Vista para crear un pedido
-@login_required
+# Cantidad enviada en un formulario del carrito; None si no es un entero mayor que cero
+def cantidad_pedida(request):
+    try:
+        cantidad = int(request.POST.get('cantidad', 1))
+    except (TypeError, ValueError):
+        return None
+    return cantidad if cantidad >= 1 else None
+
+# Vista para crear un pedido (también sin sesión: el carrito anónimo se fusiona al iniciar sesión)
 def crear_pedido(request, producto_id):
     producto = get_object_or_404(Producto, id=producto_id)
     if request.method == 'POST':
-        cantidad = int(request.POST.get('cantidad', 1))
+        cantidad = cantidad_pedida(request)
+        if cantidad is None:
+            return HttpResponseBadRequest(CANTIDAD_INVALIDA)
 
-        carrito = request.session.get('carrito', [])
-        
-        # Verificar si el producto ya está en el carrito
-        producto_encontrado = False
-        for item in carrito:
-            if item['producto_id'] == producto.id:
-                item['cantidad'] += cantidad
-                producto_encontrado = True
-                break
-
-        if not producto_encontrado:
-            carrito.append({
-                'producto_id': producto.id,
-                'nombre': producto.nombre,
-                'precio': float(producto.precio),
-                'cantidad': cantidad
-            })
-
-        request.session['carrito'] = carrito
-        request.session.modified = True
+        # Suma la cantidad si el producto ya está en el carrito
+        CarritoCompras(request).agregar(producto.id, cantidad)
 
         return redirect('ver_carrito')
     else:
         return render(request, 'crear_pedido.html', {'producto': producto})
 
 # Vista para ver el carrito de compras
-@login_required
 def ver_carrito(request):
-    carrito = request.session.get('carrito', [])
-    total_general = sum(item['precio'] * item['cantidad'] for item in carrito)
+    carrito_compras = CarritoCompras(request)
+    error_cupon = None
 
-    productos_ids = [item['producto_id'] for item in carrito]
-    productos = Producto.objects.filter(id__in=productos_ids)
-
-    pedidos = []
-    for item in carrito:
-        producto = productos.get(id=item['producto_id'])
-        pedidos.append({
-            'producto': producto,
-            'cantidad': item['cantidad'],
-            'subtotal': producto.precio * item['cantidad'],
-        })
-
-    return render(request, 'carrito.html', {'pedidos': pedidos, 'total': total_general})
+    # Aplicar o quitar un cupón (validado contra el cache en memoria, sin consultas)
+    if request.method == 'POST':
+        if 'quitar_cupon' in request.POST:
+            carrito_compras.quitar_cupon()
+            return redirect('ver_carrito')
+        try:
+            carrito_compras.aplicar_cupon(request.POST.get('codigo', ''))
+        except CuponInvalido as error:
+            error_cupon = str(error)
+        else:
+            return redirect('ver_carrito')
+
+    return render(request, 'carrito.html', contexto_carrito(carrito_compras, error_cupon))
+
+# Precios vigentes de todos los productos del carrito en una sola consulta
+def contexto_carrito(carrito_compras, error_cupon=None):
+    cotizacion = carrito_compras.cotizar()
+    return {
+        'pedidos': cotizacion.lineas,
+        'total': cotizacion.total_a_pagar,
+        'cotizacion': cotizacion,
+        'error_cupon': error_cupon,
+    }
 
 # Vista para finalizar compra
 @login_required
 def finalizar_compra(request):
-    carrito = request.session.get('carrito', [])
+    carrito_compras = CarritoCompras(request)
+    carrito = carrito_compras.items()
+    cupon = carrito_compras.cupon()
 
     if not carrito:
         return redirect('nombre_de_la_vista_de_error')
@@ -138,33 +190,24 @@ def finalizar_compra(request):
         direccion_form = DireccionEnvioForm(request.POST)
 
         if direccion_form.is_valid():
-            direccion_envio = direccion_form.save(commit=False)
-            direccion_envio.usuario = request.user
-            direccion_envio.save()
-
-            pedido = Pedido.objects.create(
-                usuario=request.user,
-                direccion_envio=direccion_envio,
-                estado='espera'
-            )
-
-            for item in carrito:
-                DetallePedido.objects.create(
-                    pedido=pedido,
-                    producto_id=item['producto_id'],
-                    cantidad=item['cantidad']
-                )
-
-            request.session['carrito'] = []
-
-            return redirect('mi_cuenta')
-
+            try:
+                procesar_compra(request.user, direccion_form.save(commit=False), carrito, cupon)
+            except StockInsuficiente as error:
+                direccion_form.add_error(None, str(error))
+            except CuponInvalido as error:
+                carrito_compras.quitar_cupon()
+                cupon = None
+                direccion_form.add_error(None, str(error))
+            else:
+                carrito_compras.vaciar()
+                carrito_compras.quitar_cupon()
+                return redirect('mi_cuenta')
     else:
         direccion_form = DireccionEnvioForm()
 
     return render(request, 'finalizar_compra.html', {
         'direccion_form': direccion_form,
-        'carrito': carrito,
+        'carrito': cotizar_carrito(carrito, cupon),
     })
 
 # Vista para ver la cuenta del usuario
@@ -176,66 +219,105 @@ def mi_cuenta(request):
 @login_required
 def pedidos_view(request):
     pedidos = Pedido.objects.filter(usuario=request.user).order_by('-fecha_pedido')
+
+    # Historial paginado por cursor (fecha_pedido, id) cuando se solicita
+    if usa_paginacion_por_cursor(request):
+        orden = ('-fecha_pedido', '-id')
+        try:
+            page_obj = paginar_por_cursor(pedidos, orden, request.GET.get('cursor'), PEDIDOS_POR_PAGINA)
+        except CursorInvalido:
+            page_obj = paginar_por_cursor(pedidos, orden, por_pagina=PEDIDOS_POR_PAGINA)
+        return render(request, 'pedidos.html', {'pedidos': page_obj, 'page_obj': page_obj})
+
     return render(request, 'pedidos.html', {'pedidos': pedidos})
 
 # Vista para actualizar un pedido (opcional)
-@login_required
-def actualizar_pedido(request, pedido_id):
-    pedido = get_object_or_404(Pedido, id=pedido_id, usuario=request.user)
+def actualizar_pedido(request, producto_id):
     if request.method == 'POST':
-        nueva_cantidad = int(request.POST.get('cantidad', 1))
-        pedido.cantidad = nueva_cantidad
-        pedido.save()
+        nueva_cantidad = cantidad_pedida(request)
+        if nueva_cantidad is None:
+            return HttpResponseBadRequest(CANTIDAD_INVALIDA)
+        CarritoCompras(request).actualizar(producto_id, nueva_cantidad)
     return redirect('ver_carrito')
 
 # Vista para eliminar un pedido
-@login_required
 def eliminar_pedido(request, producto_id):
-    carrito = request.session.get('carrito', [])
-    nuevo_carrito = [item for item in carrito if item['producto_id'] != producto_id]
-
-    request.session['carrito'] = nuevo_carrito
-    request.session.modified = True
+    CarritoCompras(request).eliminar(producto_id)
     return redirect('ver_carrito')
 
 # Vista para agregar al carrito
-@login_required
+@require_POST
 def agregar_al_carrito(request, producto_id):
     producto = get_object_or_404(Producto, id=producto_id)
-    cantidad = int(request.POST.get('cantidad', 1))
-
-    carrito = request.session.get('carrito', [])
-    
-    producto_encontrado = False
-    for item in carrito:
-        if item['producto_id'] == producto_id:
-            item['cantidad'] += cantidad
-            producto_encontrado = True
-            break
-
-    if not producto_encontrado:
-        carrito.append({
-            'producto_id': producto.id,
-            'nombre': producto.nombre,
-            'precio': producto.precio,
-            'cantidad': cantidad
-        })
-
-    request.session['carrito'] = carrito
-    request.session.modified = True
+    cantidad = cantidad_pedida(request)
+    if cantidad is None:
+        return HttpResponseBadRequest(CANTIDAD_INVALIDA)
+
+    CarritoCompras(request).agregar(producto.id, cantidad)
     return redirect('ver_carrito')
 
 # Vista para ver detalles del pedido
 @login_required
 def detalle_pedido(request, pedido_id):
     pedido = get_object_or_404(Pedido, id=pedido_id, usuario=request.user)
-    return render(request, 'detalle_pedido.html', {'pedido': pedido})
+    return render(request, 'detalle_pedido.html', {'pedido': pedido, 'detalles': _detalles_de(pedido)})
 
 # Vista para la confirmación del pedido
 @login_required
 def confirmacion_pedido(request, pedido_id):
     pedido = get_object_or_404(Pedido, id=pedido_id, usuario=request.user)
-    return render(request, 'detalle_pedido.html', {'pedido': pedido})
+    return render(request, 'detalle_pedido.html', {'pedido': pedido, 'detalles': _detalles_de(pedido)})
+
+# Detalles con su producto en una sola consulta (sin una consulta por línea)
+def _detalles_de(pedido):
+    return list(pedido.detallepedido_set.select_related('producto').order_by('id'))
+
+# Métricas de rendimiento por vista (solo personal)
+@staff_member_required
+def metricas(request):
+    return JsonResponse({
+        'vistas': registro_metricas.resumen(),
+        'cache_catalogo': estadisticas_cache_catalogo(),
+    })
+
+# Panel de ventas del admin: solo lee las tablas de resumen
+@staff_member_required
+def panel_ventas(request):
+    try:
+        dias = max(1, min(int(request.GET.get('dias', 30)), 366))
+    except ValueError:
+        dias = 30
+    contexto = admin.site.each_context(request)
+    contexto.update(panel_analitica(dias), title='Panel de ventas', dias=dias)
+    return render(request, 'admin/panel_ventas.html', contexto)
+
+# Exportación de pedidos para operaciones (solo personal)
+# ?formato=csv|jsonl&desde=AAAA-MM-DD&hasta=AAAA-MM-DD&estado=...&despues_de=<último id exportado>
+@staff_member_required
+def exportar_pedidos(request):
+    formato = request.GET.get('formato', 'csv')
+    if formato not in FORMATOS_EXPORTACION:
+        return HttpResponseBadRequest('Formato no soportado')
+    estado = request.GET.get('estado') or None
+    if estado is not None and estado not in dict(Pedido.ESTADOS):
+        return HttpResponseBadRequest('Estado desconocido')
+    try:
+        desde = _fecha_exportacion(request.GET.get('desde'))
+        hasta = _fecha_exportacion(request.GET.get('hasta'))
+        despues_de = int(request.GET.get('despues_de') or 0)
+    except ValueError:
+        return HttpResponseBadRequest('Parámetros inválidos')
+    pedidos = filtrar_pedidos(desde, hasta, estado, despues_de)
+    return respuesta_exportacion(pedidos, formato)
+
+def _fecha_exportacion(valor):
+    # parse_date devuelve None si el formato no es AAAA-MM-DD: sin esto se exportaría toda la tabla
+    if not valor:
+        return None
+    fecha = parse_date(valor)
+    if fecha is None:
+        raise ValueError(valor)
+    return fecha
 
 # Vista para cerrar sesión
 def custom_logout(request):
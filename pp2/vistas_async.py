@@ -0,0 +1,60 @@
+"""Versiones async de las vistas de lectura del catálogo y del carrito.
+
+Se usan en lugar de las de pp2/views.py cuando VISTAS_ASYNC está activo y el
+sitio corre con ASGI (pp1/asgi.py). Django 3.2 no tiene API async del ORM, así
+que cada vista hace sus lecturas y el render en un solo salto a sync_to_async:
+mientras tanto el event loop sigue atendiendo otras conexiones, y un cliente
+lento no retiene un hilo mientras recibe la respuesta.
+"""
+from asgiref.sync import sync_to_async
+from django.shortcuts import get_object_or_404, render
+
+from . import views
+from .bases_de_datos import lectura_en_replica
+from .carrito import CarritoCompras
+from .condicional import condicional, validadores_catalogo, validadores_producto
+from .models import Producto
+
+
+@sync_to_async
+def _render_productos(request):
+    return render(request, 'productos.html', views.contexto_productos(request))
+
+
+@sync_to_async
+def _render_detalle(request, producto_id):
+    producto = get_object_or_404(Producto, id=producto_id)
+    return render(request, 'detalle_producto.html', {'producto': producto})
+
+
+@sync_to_async
+def _render_carrito(request):
+    # Sin sesión iniciada se muestra el carrito anónimo guardado en la sesión
+    return render(request, 'carrito.html', views.contexto_carrito(CarritoCompras(request)))
+
+
+# Vista para la página de inicio
+@lectura_en_replica
+async def inicio(request):
+    return await sync_to_async(views.inicio)(request)
+
+
+# Vista para la página de productos
+@lectura_en_replica
+@condicional(validadores_catalogo)
+async def productos(request):
+    return await _render_productos(request)
+
+
+# Vista para ver los detalles de un producto
+@lectura_en_replica
+@condicional(validadores_producto)
+async def detalle_producto(request, producto_id):
+    return await _render_detalle(request, producto_id)
+
+
+# Vista para ver el carrito: GET async; aplicar o quitar cupones sigue en la vista sync
+async def ver_carrito(request):
+    if request.method == 'POST':
+        return await sync_to_async(views.ver_carrito)(request)
+    return await _render_carrito(request)